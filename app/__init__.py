@@ -45,6 +45,18 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     login.init_app(app)
     
+    # Shared cache of parsed uploads
+    from app.core import loader
+    loader.init_app(app)
+    
+    # Process pool drawing charts
+    from app.core import render
+    render.init_app(app)
+    
+    # Worker pool for analysis jobs
+    from app.analysis import jobs
+    jobs.init_app(app)
+    
     # Register blueprints
     from app.core import bp as core_bp
     app.register_blueprint(core_bp)
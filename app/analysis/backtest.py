@@ -0,0 +1,147 @@
+"""Rolling-origin backtests of the forecast models.
+
+A model is judged by how well it would have forecast data it did not see.
+For each of several forecast origins near the end of a series, the model
+is fitted to the ``window`` observations before the origin and its
+forecasts over the next ``horizon`` observations are compared with what
+actually happened. Windows have the same length for every origin, so the
+windows of all origins and all columns are stacked side by side into one
+``(window x origins·columns)`` matrix and each model is fitted to all of
+them in one vectorized call (see ``app.analysis.forecasting``). Models are
+spread over a pool of processes.
+
+Errors are reported as MAPE, in percent and undefined where the actuals
+are zero, and MASE, scaled by the in-window mean absolute error of the
+(seasonal) naive forecast, so values below 1 beat the naive forecast. The
+model with the lowest MASE of a column is its ``best`` model, which the
+forecast route uses by default.
+"""
+import multiprocessing
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from flask import current_app
+
+from app.analysis.forecasting import MODELS, linear_forecast, smoothing_forecast
+
+DEFAULT_HORIZON = 3
+DEFAULT_ORIGINS = 6
+# Shortest window a model is fitted to; seasonal models need two seasons
+MIN_WINDOW = 6
+
+_executor_lock = threading.Lock()
+
+
+def backtest_models(season_length):
+    """Models a backtest covers for a season length"""
+    return ['linear'] + [name for name, (_, _, seasonality) in MODELS.items()
+                         if not seasonality or season_length]
+
+
+def _windows(y, horizon, origins):
+    """Stack the training windows and actuals of every origin.
+
+    Returns ``(train, actual, origins)`` with shapes ``(window, origins·k)``
+    and ``(horizon, origins·k)``, columns grouped by origin, or None when
+    the series is too short for a single origin.
+    """
+    n, k = y.shape
+    origins = min(origins, n - horizon - MIN_WINDOW + 1)
+    if origins < 1:
+        return None
+    window = n - horizon - origins + 1
+    # windows[o] holds rows o .. o + window + horizon - 1
+    windows = np.lib.stride_tricks.sliding_window_view(y, window + horizon, axis=0)[:origins]
+    stacked = windows.transpose(2, 0, 1).reshape(window + horizon, origins * k)
+    return stacked[:window], stacked[window:], origins
+
+
+def _score(model, train, actual, season_length):
+    """Forecast ``actual`` from ``train`` with one model; errors per stacked column"""
+    horizon = len(actual)
+    _, _, seasonality = MODELS.get(model, (None, None, None))
+    if seasonality and len(train) < 2 * season_length:
+        return None
+    if model == 'linear':
+        forecast = linear_forecast(train, horizon)['forecast']
+    else:
+        forecast = smoothing_forecast(train, horizon, model=model, season_length=season_length)['forecast']
+
+    lag = season_length or 1
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        error = np.abs(actual - forecast)
+        scale = np.nanmean(np.abs(train[lag:] - train[:-lag]), axis=0)
+        ape = np.where(actual != 0, error / np.abs(actual), np.nan)
+        mape = np.nanmean(ape, axis=0) * 100
+        mase = np.nanmean(error, axis=0) / scale
+    return mape, mase
+
+
+def run_backtest(values, horizon=DEFAULT_HORIZON, origins=DEFAULT_ORIGINS, season_length=None,
+                 executor=None):
+    """Backtest every model on the columns of an ``(n, k)`` array.
+
+    Returns ``{'horizon', 'origins', 'season_length', 'models': {model:
+    {'mape': [...], 'mase': [...]}}}`` with one value per column, None where
+    a model could not be scored. With ``executor`` the models run in
+    parallel on it.
+    """
+    y = np.asarray(values, dtype='float64')
+    if y.ndim == 1:
+        y = y[:, None]
+    k = y.shape[1]
+    result = {'horizon': horizon, 'origins': 0, 'season_length': season_length, 'models': {}}
+    windows = _windows(y, horizon, origins)
+    if windows is None:
+        return result
+    train, actual, origins = windows
+    result['origins'] = origins
+
+    models = backtest_models(season_length)
+    if executor is not None:
+        futures = [executor.submit(_score, model, train, actual, season_length) for model in models]
+        scores = [future.result() for future in futures]
+    else:
+        scores = [_score(model, train, actual, season_length) for model in models]
+
+    for model, score in zip(models, scores):
+        if score is None:
+            continue
+        # Average the stacked columns of each origin back to one value per column
+        mape, mase = (np.nanmean(metric.reshape(origins, k), axis=0) if np.isfinite(metric).any()
+                      else np.full(k, np.nan) for metric in score)
+        result['models'][model] = {
+            'mape': [None if np.isnan(value) else float(value) for value in mape],
+            'mase': [None if np.isnan(value) else float(value) for value in mase],
+        }
+    return result
+
+
+def best_models(backtest, columns):
+    """Model with the lowest MASE (or MAPE where MASE is undefined) per column, or None"""
+    best = {}
+    for i, column in enumerate(columns):
+        candidates = [(scores['mase'][i], model) for model, scores in backtest['models'].items()
+                      if scores['mase'][i] is not None]
+        if not candidates:
+            candidates = [(scores['mape'][i], model) for model, scores in backtest['models'].items()
+                          if scores['mape'][i] is not None]
+        best[column] = min(candidates)[1] if candidates else None
+    return best
+
+
+def get_backtest_executor():
+    """The backtest process pool of the current application, started on first use, or None"""
+    workers = current_app.config.get('BACKTEST_WORKERS', 0)
+    if workers <= 0:
+        return None
+    with _executor_lock:
+        executor = current_app.extensions.get('backtest_executor')
+        if executor is None:
+            # Forking a process with running threads can copy held locks
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            current_app.extensions['backtest_executor'] = executor
+        return executor
@@ -0,0 +1,412 @@
+"""Trend and seasonal forecasts for many columns at once.
+
+Two families of models are fitted, each vectorized across columns:
+
+- ``linear``: an ordinary least-squares line over the period number. The
+  closed-form solution only needs per-column sums, so every column of a
+  ``(periods x columns)`` matrix is fitted with a handful of array
+  operations, with missing values masked out per column. Its prediction
+  intervals are ``y ± t(level, n - 2) · s · sqrt(1 + 1/n + (x - mean(x))² / Sxx)``.
+- exponential smoothing (``MODELS``): simple, Holt, damped-trend and
+  Holt-Winters models with additive or multiplicative seasonality, in the
+  additive-error state space form of Hyndman et al. The recursions run
+  once over time, with the state of every column and every candidate
+  parameter set held in one array, and each column keeps its parameter set
+  with the smallest squared one-step errors. With ``model='auto'`` each
+  column then keeps the model with the smallest AICc. Intervals use the
+  class 1 variance formula, which is exact for the additive models and an
+  approximation for multiplicative seasonality.
+
+Every fit also returns per-column states, the final smoothing states or
+line coefficients with the parameters and error variance, from which
+``evaluate_state`` forecasts any horizon and interval level without the
+data. ``forecast_columns`` returns JSON-ready results for either family.
+"""
+import math
+import warnings
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_LEVEL = 0.95
+
+
+def t_quantile(p, df):
+    """Quantile ``p`` of Student's t distribution with ``df`` degrees of freedom.
+
+    Exact for one and two degrees of freedom and a Cornish-Fisher expansion
+    around the normal quantile otherwise, within 1% for ``df >= 3`` at the
+    usual 90-99% levels. ``df`` may be an array; the result is NaN where
+    ``df < 1``.
+    """
+    df = np.asarray(df, dtype='float64')
+    z = NormalDist().inv_cdf(p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        q = (z
+             + (z ** 3 + z) / (4 * df)
+             + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+             + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+             + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4))
+    q = np.where(df == 1, math.tan(math.pi * (p - 0.5)), q)
+    q = np.where(df == 2, (2 * p - 1) / math.sqrt(2 * p * (1 - p)), q)
+    return np.where(df >= 1, q, np.nan)
+
+
+def _fit_lines(y):
+    """Least-squares line of every column of ``y`` over the row number, skipping NaN.
+
+    Returns per-column ``count``, ``x_mean``, ``sxx``, ``slope`` and
+    ``intercept``, and the residuals with 0 where a value is missing.
+    """
+    observed = ~np.isnan(y)
+    count = observed.sum(axis=0)
+    x = np.arange(len(y), dtype='float64')[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = (observed * x).sum(axis=0) / count
+        y_mean = np.where(observed, y, 0).sum(axis=0) / count
+        dx = np.where(observed, x - x_mean, 0)
+        dy = np.where(observed, y - y_mean, 0)
+        sxx = (dx ** 2).sum(axis=0)
+        slope = (dx * dy).sum(axis=0) / sxx
+        intercept = y_mean - slope * x_mean
+        residuals = np.where(observed, y - (intercept + slope * x), 0)
+    return count, x_mean, sxx, slope, intercept, residuals
+
+
+def _linear_paths(n, count, x_mean, sxx, slope, intercept, variance, periods, level):
+    """Point forecasts and interval half-widths, ``(periods, k)``, of fitted lines"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        future = np.arange(n, n + periods, dtype='float64')[:, None]
+        forecast = intercept + slope * future
+        spread = np.sqrt(variance * (1 + 1 / count + (future - x_mean) ** 2 / sxx))
+        margin = t_quantile(0.5 + level / 2, count - 2) * spread
+
+    # Columns with too few values to fit give NaN, never inf
+    forecast[:, count < 2] = np.nan
+    margin[:, count < 3] = np.nan
+    return forecast, margin
+
+
+def linear_forecast(values, periods=3, level=DEFAULT_LEVEL):
+    """Fit a line to every column of an ``(n, k)`` array and extend it ``periods`` steps.
+
+    Returns a dict of ``(periods, k)`` arrays ``forecast``, ``lower`` and
+    ``upper``, of per-column ``slope`` and ``intercept``, and the fitted
+    ``states`` that ``evaluate_state`` extends to any horizon. A column
+    needs two values for a forecast and three for an interval; otherwise
+    they are NaN.
+    """
+    y = np.asarray(values, dtype='float64')
+    if y.ndim == 1:
+        y = y[:, None]
+    n = y.shape[0]
+    count, x_mean, sxx, slope, intercept, residuals = _fit_lines(y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (residuals ** 2).sum(axis=0) / (count - 2)
+    forecast, margin = _linear_paths(n, count, x_mean, sxx, slope, intercept, variance, periods, level)
+    return {
+        'forecast': forecast,
+        'lower': forecast - margin,
+        'upper': forecast + margin,
+        'slope': slope,
+        'intercept': intercept,
+        'states': [
+            {'model': 'linear', 'n': n, 'count': int(count[i]), 'x_mean': _number(x_mean[i]),
+             'sxx': _number(sxx[i]), 'slope': _number(slope[i]), 'intercept': _number(intercept[i]),
+             'variance': _number(variance[i])} if count[i] >= 2 else None
+            for i in range(y.shape[1])
+        ],
+    }
+
+
+def _number(value):
+    """A float for JSON, None for NaN or infinity"""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _array(values):
+    return np.array([np.nan if value is None else value for value in values], dtype='float64')
+
+
+# name: (label, trend, seasonality); trend is None, 'additive' or 'damped',
+# seasonality None, 'additive' or 'multiplicative'
+MODELS = {
+    'simple': ('Simple exponential smoothing', None, None),
+    'holt': ("Holt's linear trend", 'additive', None),
+    'damped': ('Damped trend', 'damped', None),
+    'seasonal': ('Seasonal, no trend', None, 'additive'),
+    'seasonal_multiplicative': ('Multiplicative seasonal, no trend', None, 'multiplicative'),
+    'holt_winters': ('Holt-Winters additive', 'additive', 'additive'),
+    'holt_winters_multiplicative': ('Holt-Winters multiplicative', 'additive', 'multiplicative'),
+    'damped_holt_winters': ('Damped Holt-Winters additive', 'damped', 'additive'),
+    'damped_holt_winters_multiplicative': ('Damped Holt-Winters multiplicative', 'damped', 'multiplicative'),
+}
+MODEL_LABELS = dict({'linear': 'Linear trend'}, **{name: spec[0] for name, spec in MODELS.items()})
+MODEL_CHOICES = ('auto', 'linear') + tuple(MODELS)
+
+# Candidate smoothing parameters. beta and gamma are fractions of their
+# admissible ranges, 0 < beta < alpha and 0 < gamma < 1 - alpha.
+ALPHAS = (0.1, 0.3, 0.5, 0.7, 0.9)
+BETA_FRACTIONS = (0.05, 0.15, 0.4)
+GAMMA_FRACTIONS = (0.05, 0.2, 0.5)
+PHIS = (0.8, 0.9, 0.98)
+
+
+def season_length(dates):
+    """Observations per seasonal cycle implied by the spacing of ``dates``, or None"""
+    dates = pd.to_datetime(pd.Series(dates), errors='coerce').dropna().drop_duplicates().sort_values()
+    if len(dates) < 3:
+        return None
+    days = dates.diff().dropna().dt.total_seconds().median() / 86400
+    for low, high, length in ((0.5, 1.5, 7), (6, 8, 52), (27, 32, 12), (85, 95, 4)):
+        if low <= days <= high:
+            return length
+    return None
+
+
+def _parameter_grid(trend, seasonality):
+    grid = []
+    for alpha in ALPHAS:
+        for beta in (BETA_FRACTIONS if trend else (0,)):
+            for gamma in (GAMMA_FRACTIONS if seasonality else (0,)):
+                for phi in (PHIS if trend == 'damped' else (1,)):
+                    grid.append((alpha, alpha * beta, (1 - alpha) * gamma, phi))
+    return np.array(grid)
+
+
+def _initial_states(y, m, trend, seasonality):
+    """Initial level, trend and seasonal indices of every column.
+
+    Seasonal models start from a line fitted to the first two seasons and
+    the average deviation from it at each position of the season; the
+    others from the first two values. The level is set one step before
+    the first row, where the recursions start.
+    """
+    k = y.shape[1]
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        # Columns without values leave NaN states; they are not forecast
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if seasonality:
+            head = y[:2 * m]
+            _, _, _, slope, intercept, _ = _fit_lines(head)
+            if not trend:
+                slope, intercept = np.zeros(k), np.nanmean(head, axis=0)
+            line = intercept + slope * np.arange(len(head))[:, None]
+            deviation = head - line if seasonality == 'additive' else head / line
+            season = np.nanmean(deviation.reshape(2, m, k), axis=0).T
+            season = np.nan_to_num(season, nan=0.0 if seasonality == 'additive' else 1.0)
+            level = intercept - slope
+        else:
+            first = y[np.argmax(~np.isnan(y), axis=0), np.arange(k)]
+            slope = np.nan_to_num(y[1] - y[0]) if trend and len(y) > 1 else np.zeros(k)
+            level = first - slope
+            season = np.zeros((k, 1))
+    return level, np.nan_to_num(slope), season
+
+
+def _smooth(y, m, trend, seasonality, grid):
+    """Run the recursions of one model for every column and parameter set.
+
+    Returns the sum of squared one-step errors, shape ``(sets, columns)``,
+    and the final level, trend and seasonal states.
+    """
+    n, k = y.shape
+    m = m if seasonality else 1
+    alpha, beta, gamma, phi = (grid[:, i:i + 1] for i in range(4))
+    level0, slope0, season0 = _initial_states(y, m, trend, seasonality)
+    level = np.broadcast_to(level0, (len(grid), k)).copy()
+    slope = np.broadcast_to(slope0, (len(grid), k)).copy()
+    season = np.broadcast_to(season0, (len(grid), k, m)).copy()
+    sse = np.zeros((len(grid), k))
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for t in range(n):
+            observed = ~np.isnan(y[t])
+            base = level + phi * slope
+            s = season[:, :, t % m]
+            if seasonality == 'multiplicative':
+                error = np.where(observed, y[t] - base * s, 0)
+                level = base + alpha * error / s
+                slope = phi * slope + beta * error / s
+                season[:, :, t % m] = s + gamma * error / base
+            else:
+                error = np.where(observed, y[t] - base - s, 0)
+                level = base + alpha * error
+                slope = phi * slope + beta * error
+                season[:, :, t % m] = s + gamma * error
+            sse += error ** 2
+    return sse, level, slope, season
+
+
+def smoothing_forecast(values, periods=3, level=DEFAULT_LEVEL, model='auto', season_length=None):
+    """Fit exponential smoothing models to every column of an ``(n, k)`` array.
+
+    ``model`` is a name in ``MODELS`` or ``'auto'``, which keeps the model
+    with the smallest AICc per column among those the column supports:
+    seasonal models need ``season_length`` and two full seasons, and
+    multiplicative ones positive values. Returns the arrays of
+    ``linear_forecast`` and per-column ``model``, ``aicc``, ``params`` and
+    ``states`` lists (None where a column could not be fitted).
+    """
+    y = np.asarray(values, dtype='float64')
+    if y.ndim == 1:
+        y = y[:, None]
+    n, k = y.shape
+    count = (~np.isnan(y)).sum(axis=0)
+    positive = np.all(np.isnan(y) | (y > 0), axis=0)
+    names = list(MODELS) if model == 'auto' else [model]
+
+    best_aicc = np.full(k, np.inf)
+    result = {
+        'forecast': np.full((periods, k), np.nan),
+        'lower': np.full((periods, k), np.nan),
+        'upper': np.full((periods, k), np.nan),
+        'model': [None] * k,
+        'aicc': [None] * k,
+        'params': [None] * k,
+        'states': [None] * k,
+    }
+
+    for name in names:
+        _, trend, seasonality = MODELS[name]
+        m = season_length if seasonality else 1
+        if seasonality and (not m or m < 2 or n < 2 * m):
+            continue
+        grid = _parameter_grid(trend, seasonality)
+        sse, final_level, final_slope, final_season = _smooth(y, m, trend, seasonality, grid)
+        sse = np.where(np.isfinite(sse), sse, np.inf)
+        best = np.argmin(sse, axis=0)
+        columns = np.arange(k)
+        sse = sse[best, columns]
+
+        # Smoothing parameters plus initial states plus the error variance
+        n_params = 1 + (1 if trend else 0) + (1 if trend == 'damped' else 0) + (1 if seasonality else 0)
+        n_params += 1 + (1 if trend else 0) + (m if seasonality else 0) + 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            aic = count * np.log(sse / count) + 2 * n_params
+            aicc = aic + 2 * n_params * (n_params + 1) / (count - n_params - 1)
+        eligible = (count - n_params - 1 > 0) & np.isfinite(aicc)
+        if seasonality == 'multiplicative':
+            eligible &= positive
+        better = eligible & (aicc < best_aicc)
+        if not better.any():
+            continue
+
+        alpha, beta, gamma, phi = grid[best].T
+        final_level, final_slope = final_level[best, columns], final_slope[best, columns]
+        season = final_season[best, columns]
+        sigma = np.sqrt(sse / np.maximum(count - n_params, 1))
+        forecast, margin = _smoothing_paths(n, m, seasonality, final_level, final_slope, season,
+                                            alpha, beta, gamma, phi, sigma, periods, level)
+
+        for i in np.flatnonzero(better):
+            best_aicc[i] = aicc[i]
+            result['forecast'][:, i] = forecast[:, i]
+            result['lower'][:, i] = forecast[:, i] - margin[:, i]
+            result['upper'][:, i] = forecast[:, i] + margin[:, i]
+            result['model'][i] = name
+            result['aicc'][i] = float(aicc[i])
+            result['params'][i] = {'alpha': float(alpha[i]), 'beta': float(beta[i]), 'gamma': float(gamma[i]),
+                                   'phi': float(phi[i]), 'season_length': m if seasonality else None}
+            result['states'][i] = dict(
+                result['params'][i], model=name, n=n, count=int(count[i]), aicc=float(aicc[i]),
+                level=_number(final_level[i]), slope=_number(final_slope[i]),
+                season=[_number(value) for value in season[i]], sigma=_number(sigma[i]))
+    return result
+
+
+def _smoothing_paths(n, m, seasonality, level, slope, season, alpha, beta, gamma, phi, sigma, periods, interval):
+    """Point forecasts and interval half-widths, ``(periods, k)``, from final smoothing states.
+
+    ``season`` is ``(k, m)`` and the other states and parameters have one
+    value per column; ``n`` is the number of rows the states were fitted to.
+    """
+    k = len(level)
+    steps = np.arange(1, periods + 1)
+    with np.errstate(invalid='ignore', over='ignore'):
+        # h-step point forecasts from the final states
+        phi_h = np.cumsum(phi[None, :] ** steps[:, None], axis=0)
+        base = level + phi_h * slope
+        future_season = season[:, (n + steps - 1) % m].T
+        forecast = base * future_season if seasonality == 'multiplicative' else base + future_season
+
+        # Class 1 variance: sigma² (1 + sum over j < h of c_j²)
+        phi_j = np.vstack([np.zeros(k), phi_h[:-1]])
+        c = alpha + beta * phi_j + gamma * ((np.arange(periods) % m == 0) & (np.arange(periods) > 0))[:, None]
+        c[0] = 0
+        margin = NormalDist().inv_cdf(0.5 + interval / 2) * sigma * np.sqrt(1 + np.cumsum(c ** 2, axis=0))
+    return forecast, margin
+
+
+def evaluate_state(state, periods=3, level=DEFAULT_LEVEL):
+    """Forecasts of one fitted column from its stored state, without its data.
+
+    ``state`` is an entry of the ``states`` of ``linear_forecast`` or
+    ``smoothing_forecast``. Returns ``(periods,)`` arrays ``forecast``,
+    ``lower`` and ``upper``.
+    """
+    if state['model'] == 'linear':
+        forecast, margin = _linear_paths(
+            state['n'], np.array([state['count']]), *(_array([state[key]]) for key in
+                                                      ('x_mean', 'sxx', 'slope', 'intercept', 'variance')),
+            periods, level)
+    else:
+        _, _, seasonality = MODELS[state['model']]
+        m = state['season_length'] or 1
+        forecast, margin = _smoothing_paths(
+            state['n'], m, seasonality, *(_array([state[key]]) for key in ('level', 'slope')),
+            _array(state['season'])[None, :],
+            *(_array([state[key]]) for key in ('alpha', 'beta', 'gamma', 'phi', 'sigma')), periods, level)
+    forecast, margin = forecast[:, 0], margin[:, 0]
+    return {'forecast': forecast, 'lower': forecast - margin, 'upper': forecast + margin}
+
+
+def fit_columns(df, columns, model='linear', season_length=None):
+    """Fit one model family to several columns of a frame at once.
+
+    ``model`` is one of ``MODEL_CHOICES``. Returns ``{column: state}`` for
+    ``evaluate_state`` or ``forecast_from_states``, JSON-ready so it can be
+    stored; columns without enough values are left out.
+    """
+    if not columns:
+        return {}
+    values = np.column_stack([df[column].to_numpy(dtype='float64', na_value=np.nan) for column in columns])
+    if model == 'linear':
+        states = linear_forecast(values, 1)['states']
+    else:
+        states = smoothing_forecast(values, 1, model=model, season_length=season_length)['states']
+    return {column: state for column, state in zip(columns, states) if state is not None}
+
+
+def forecast_from_states(states, periods=3, level=DEFAULT_LEVEL):
+    """Forecasts of fitted columns as ``{column: {'model', 'label', 'aicc',
+    'params', 'forecast'}}`` where ``forecast`` lists ``{'period',
+    'forecast', 'lower', 'upper'}`` for periods 1 to ``periods``.
+    """
+    result = {}
+    for column, state in states.items():
+        path = evaluate_state(state, periods, level)
+        smoothing = state['model'] != 'linear'
+        result[column] = {
+            'model': state['model'],
+            'label': MODEL_LABELS[state['model']],
+            'aicc': state.get('aicc'),
+            'params': {key: state[key] for key in ('alpha', 'beta', 'gamma', 'phi', 'season_length')}
+                      if smoothing else None,
+            'forecast': pd.DataFrame({
+                'period': range(1, periods + 1),
+                'forecast': path['forecast'],
+                'lower': path['lower'],
+                'upper': path['upper'],
+            }).to_dict(orient='records'),
+        }
+        if 'selection' in state:
+            result[column]['selection'] = state['selection']
+    return result
+
+
+def forecast_columns(df, columns, periods=3, level=DEFAULT_LEVEL, model='linear', season_length=None):
+    """Forecast several columns of a frame at once; see ``fit_columns`` and ``forecast_from_states``"""
+    return forecast_from_states(fit_columns(df, columns, model, season_length), periods, level)
@@ -0,0 +1,231 @@
+"""Background jobs for file analysis.
+
+Computing ratios, correlations, trends and charts for a large file takes
+longer than a request should hold a gunicorn worker. ``submit_analysis``
+records an ``AnalysisJob`` and hands it to a thread pool in the worker
+process; clients poll the job for its status and progress, and the results
+page renders from the output stored on the finished job. Jobs and their
+``Analysis`` records are addressed by file version, analysis type and a
+hash of the parameters, so asking again for an analysis that is already
+done returns the finished job instead of running a new one; ``recompute``
+runs it again and updates the stored ``Analysis`` in place. Results are
+also cached per file content and role map (see ``app.core.storage``).
+Jobs draw no charts: the results page draws them in the browser from
+``app.analysis.series``, and PDF exports draw PNGs with
+``analysis_charts`` when they need them.
+
+Jobs live in the database so any worker can report on them. A job that has
+made no progress for ``ANALYSIS_JOB_TIMEOUT`` seconds, for example because
+its worker process was restarted, is reported as failed.
+"""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.analysis.service import get_analyzer
+from app.core.charts import cached_charts
+from app.core.models import Analysis, AnalysisJob, FinancialFile
+from app.core.render import PNG_MAX_POINTS
+from app.core.storage import cached_artifact, params_digest
+
+PENDING_STATUSES = ('queued', 'running')
+
+# Charts are limited to the first numeric columns to keep the page light
+MAX_CHARTS = 5
+
+# Bump when the layout of the cached output changes
+METRICS_FORMAT = 4
+
+
+def init_app(app):
+    """Attach the analysis worker pool"""
+    app.extensions['analysis_executor'] = ThreadPoolExecutor(
+        max_workers=app.config.get('ANALYSIS_WORKERS', 2), thread_name_prefix='analysis')
+
+
+def compute_financial_metrics(file, roles, numeric_columns, progress=None, refresh=False):
+    """Compute the financial metrics analysis of a file.
+
+    Returns ratios, ratio series, trends and the columns to chart, cached
+    per file content and role map; ``refresh`` ignores the cache. ``progress``
+    is called with ``(percent, stage)`` as the work advances.
+    """
+    progress = progress or (lambda percent, stage: None)
+
+    def compute():
+        progress(5, 'Loading data')
+        analyzer = get_analyzer(file, roles)
+        progress(20, 'Calculating ratios')
+        result = {
+            'financial_ratios': analyzer.calculate_financial_ratios(),
+            'ratio_series': analyzer.calculate_ratio_series(),
+        }
+        progress(60, 'Finding trends')
+        result['trends'] = analyzer.find_trends()
+        result['chart_columns'] = [column for column in numeric_columns[:MAX_CHARTS]
+                                   if column in analyzer.df.columns]
+        return result
+
+    return cached_artifact(file, 'financial_metrics', compute,
+                           params={'roles': roles, 'numeric_columns': numeric_columns[:MAX_CHARTS],
+                                   'format': METRICS_FORMAT},
+                           refresh=refresh)
+
+
+def draw_charts(file, roles, columns):
+    """Draw the PNG charts of an analysis as ``({column: key}, correlation key)``.
+
+    Charts already stored are reused; the others are drawn as one batch on
+    the chart renderer (see ``app.core.charts``).
+    """
+    analyzer = get_analyzer(file, roles)
+    keys = cached_charts(
+        [([file], {'kind': 'correlation', 'source': analyzer.source}, analyzer.correlation_data)] +
+        [([file], {'kind': 'time_series', 'column': column, 'date': roles.get('date'),
+                   'source': analyzer.source},
+          lambda column=column: analyzer.time_series_data(column, PNG_MAX_POINTS))
+         for column in columns])
+    return {column: key for column, key in zip(columns, keys[1:]) if key}, keys[0]
+
+
+def analysis_charts(analysis):
+    """PNG chart keys of an analysis produced by a job, as ``({column: key}, correlation key)``"""
+    job = (AnalysisJob.query.filter_by(analysis_id=analysis.id, status='complete')
+           .order_by(AnalysisJob.created_date.desc()).first())
+    if job is None or not job.result:
+        return {}, None
+    return draw_charts(job.file, job.params['roles'], job.result.get('chart_columns', []))
+
+
+def submit_analysis(file, user_id, roles, numeric_columns, recompute=False):
+    """Queue a financial metrics analysis of a file and return its job.
+
+    The latest job for the same file version and parameters is returned
+    instead of queueing another one while it is pending or, unless
+    ``recompute`` is set, once it is complete.
+    """
+    params = {'roles': roles, 'numeric_columns': numeric_columns}
+    digest = params_digest(params)
+    existing = (AnalysisJob.query
+                .filter_by(file_id=file.id, version=file.version, analysis_type='financial_metrics',
+                           params_hash=digest)
+                .order_by(AnalysisJob.created_date.desc()).all())
+    for job in existing:
+        if job.status in PENDING_STATUSES and not _is_stale(job):
+            return job
+        if job.status == 'complete' and not recompute:
+            return job
+
+    job = AnalysisJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        file_id=file.id,
+        analysis_type='financial_metrics',
+        params=params,
+        version=file.version,
+        params_hash=digest,
+        status='queued',
+        progress=0
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    if current_app.config['ANALYSIS_IN_BACKGROUND']:
+        app = current_app._get_current_object()
+        current_app.extensions['analysis_executor'].submit(_run_job, app, job.id, recompute)
+    else:
+        run_analysis_job(job, recompute)
+    return job
+
+
+def _run_job(app, job_id, recompute=False):
+    with app.app_context():
+        try:
+            run_analysis_job(AnalysisJob.query.get(job_id), recompute)
+        finally:
+            db.session.remove()
+
+
+def run_analysis_job(job, recompute=False):
+    """Compute a queued job and store its output and ``Analysis`` record.
+
+    The ``Analysis`` of the same file version and parameters is updated if
+    there is one, so the table holds one record per distinct analysis. The
+    output is dropped if the job stopped being ``running`` meanwhile.
+    """
+    job.status = 'running'
+    db.session.commit()
+
+    def progress(percent, stage):
+        job.progress = percent
+        job.stage = stage
+        db.session.commit()
+
+    try:
+        file = FinancialFile.query.get(job.file_id)
+        result = compute_financial_metrics(file, job.params['roles'], job.params['numeric_columns'], progress,
+                                           refresh=recompute)
+
+        # A job that stalled may have been reported as failed meanwhile (see
+        # job_status); its late result is dropped rather than stored
+        db.session.refresh(job, ['status'])
+        if job.status != 'running':
+            current_app.logger.warning(f"Analysis job {job.id} finished after it was marked {job.status}")
+            return
+
+        analysis = Analysis.query.filter_by(file_id=file.id, version=job.version, analysis_type=job.analysis_type,
+                                            params_hash=job.params_hash).first()
+        if analysis is None:
+            analysis = Analysis(file_id=file.id, analysis_type=job.analysis_type, version=job.version,
+                                params_hash=job.params_hash)
+            db.session.add(analysis)
+        analysis.user_id = job.user_id
+        analysis.created_date = datetime.utcnow()
+        analysis.results = {
+            'financial_ratios': result['financial_ratios'],
+            'ratio_series': result['ratio_series'],
+            'trends': result['trends']
+        }
+        db.session.flush()
+        job.analysis_id = analysis.id
+        job.result = result
+        job.status = 'complete'
+        job.progress = 100
+        job.stage = None
+        job.finished_date = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Analysis job {job.id} failed: {str(e)}")
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_date = datetime.utcnow()
+        db.session.commit()
+
+
+def _is_stale(job):
+    timeout = timedelta(seconds=current_app.config['ANALYSIS_JOB_TIMEOUT'])
+    return job.status in PENDING_STATUSES and job.updated_date < datetime.utcnow() - timeout
+
+
+def job_status(job):
+    """JSON-serializable state of a job, without its output"""
+    if _is_stale(job):
+        job.status = 'failed'
+        job.error = 'The analysis stopped making progress; please run it again'
+        db.session.commit()
+    return {
+        'job_id': job.id,
+        'file_id': job.file_id,
+        'analysis_type': job.analysis_type,
+        'status': job.status,
+        'progress': job.progress,
+        'stage': job.stage,
+        'error': job.error,
+        'analysis_id': job.analysis_id,
+        'created_date': job.created_date.isoformat(),
+        'finished_date': job.finished_date.isoformat() if job.finished_date else None,
+    }
@@ -0,0 +1,151 @@
+"""Registry of financial ratios evaluated as one vectorized pass.
+
+Each ratio is declared as a numerator and a denominator, both linear
+combinations of column roles (see ``app.core.schema``). At import the
+registry is compiled into coefficient matrices, so evaluating every ratio a
+file supports is two matrix products over the aligned role columns and a
+new ratio only adds a row to those matrices.
+
+``ratio_series`` returns one value per row (per period for rollups) and
+``aggregate_ratios`` one current value per ratio, with income-statement
+roles summed over the rows and balance-sheet roles taken at their last
+value. ``totals_ratios`` gives the same values from the running column
+totals of a profile, without the rows.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from app.core.schema import STOCK_ROLES
+
+# numerator and denominator map roles to coefficients
+Ratio = namedtuple('Ratio', 'label numerator denominator')
+
+RATIOS = {
+    'profit_margin': Ratio('Profit Margin', {'net_income': 1}, {'revenue': 1}),
+    'gross_margin': Ratio('Gross Margin', {'revenue': 1, 'cost_of_goods_sold': -1}, {'revenue': 1}),
+    'roa': Ratio('Return on Assets', {'net_income': 1}, {'total_assets': 1}),
+    'roe': Ratio('Return on Equity', {'net_income': 1}, {'equity': 1}),
+    'current_ratio': Ratio('Current Ratio', {'current_assets': 1}, {'current_liabilities': 1}),
+    'quick_ratio': Ratio('Quick Ratio', {'current_assets': 1, 'inventory': -1}, {'current_liabilities': 1}),
+    'debt_ratio': Ratio('Debt Ratio', {'total_liabilities': 1}, {'total_assets': 1}),
+    'debt_to_equity': Ratio('Debt to Equity', {'total_debt': 1}, {'equity': 1}),
+}
+
+RATIO_NAMES = np.array(list(RATIOS))
+RATIO_ROLES = tuple(sorted({role for ratio in RATIOS.values()
+                            for role in (*ratio.numerator, *ratio.denominator)}))
+
+
+def _coefficients(side):
+    return np.array([[getattr(ratio, side).get(role, 0) for role in RATIO_ROLES]
+                     for ratio in RATIOS.values()], dtype='float64')
+
+
+_NUMERATORS = _coefficients('numerator')
+_DENOMINATORS = _coefficients('denominator')
+# ratio x role: whether the ratio needs the role
+_REQUIRED = (_NUMERATORS != 0) | (_DENOMINATORS != 0)
+_IS_STOCK = np.array([role in STOCK_ROLES for role in RATIO_ROLES])
+
+
+def _present_roles(df, roles):
+    """The part of a role map whose columns exist in ``df``"""
+    return {role: column for role, column in roles.items() if column in df.columns}
+
+
+def _usable(roles):
+    """Mask of the ratios whose roles are all mapped to a column"""
+    available = np.array([role in roles for role in RATIO_ROLES])
+    return ~(_REQUIRED & ~available).any(axis=1)
+
+
+def _role_matrix(df, roles):
+    """Stack the role columns of a frame into a float64 (role x row) array"""
+    values = np.full((len(RATIO_ROLES), len(df)), np.nan)
+    for i, role in enumerate(RATIO_ROLES):
+        if role in roles:
+            values[i] = df[roles[role]].to_numpy(dtype='float64', na_value=np.nan)
+    return values
+
+
+def _evaluate(values, usable):
+    """Evaluate the usable ratios over the columns of a (role x n) array"""
+    missing = np.isnan(values)
+    filled = np.where(missing, 0.0, values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = (_NUMERATORS[usable] @ filled) / (_DENOMINATORS[usable] @ filled)
+    # A missing input, or a zero denominator, leaves that ratio undefined
+    result[(_REQUIRED[usable].astype('float64') @ missing) > 0] = np.nan
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+
+def ratio_series(df, roles):
+    """Return every ratio ``roles`` supports, per row, as a DataFrame.
+
+    ``roles`` maps roles to columns of ``df``. The frame has the index of
+    ``df`` and one column per ratio, NaN where a ratio is undefined.
+    """
+    roles = _present_roles(df, roles)
+    usable = _usable(roles)
+    if not usable.any():
+        return pd.DataFrame(index=df.index)
+    result = _evaluate(_role_matrix(df, roles), usable)
+    return pd.DataFrame(result.T, index=df.index, columns=RATIO_NAMES[usable])
+
+
+def aggregate_ratios(df, roles):
+    """Return one current value per supported ratio for the whole frame.
+
+    Income-statement roles are summed over the rows and balance-sheet roles
+    take their last non-null value, so margins cover the whole period and
+    liquidity ratios reflect the latest balance sheet. Undefined ratios are
+    None.
+    """
+    roles = _present_roles(df, roles)
+    usable = _usable(roles)
+    if not usable.any():
+        return {}
+    values = _role_matrix(df, roles)
+    present = ~np.isnan(values)
+    any_present = present.any(axis=1)
+    current = np.full(len(RATIO_ROLES), np.nan)
+    if values.shape[1]:
+        last = values.shape[1] - 1 - np.argmax(present[:, ::-1], axis=1)
+        latest = values[np.arange(len(RATIO_ROLES)), last]
+        current = np.where(_IS_STOCK, latest, np.nansum(values, axis=1))
+        current[~any_present] = np.nan
+    return _current_ratios(current, usable)
+
+
+def totals_ratios(sums, latest, roles):
+    """Return ``aggregate_ratios`` of a frame from running totals of its columns.
+
+    ``sums`` and ``latest`` map numeric columns to their sum and last
+    non-null value, None for columns without values.
+    """
+    roles = {role: column for role, column in roles.items() if column in sums}
+    usable = _usable(roles)
+    if not usable.any():
+        return {}
+    current = np.full(len(RATIO_ROLES), np.nan)
+    for i, role in enumerate(RATIO_ROLES):
+        if role in roles:
+            value = (latest if _IS_STOCK[i] else sums)[roles[role]]
+            current[i] = np.nan if value is None else value
+    return _current_ratios(current, usable)
+
+
+def _current_ratios(current, usable):
+    """Evaluate the usable ratios of a role vector as ``{name: value or None}``"""
+    result = _evaluate(current[:, None], usable)[:, 0]
+    return {str(name): None if np.isnan(value) else float(value)
+            for name, value in zip(RATIO_NAMES[usable], result)}
+
+
+def ratio_label(name):
+    """Display label of a ratio"""
+    ratio = RATIOS.get(name)
+    return ratio.label if ratio else ' '.join(name.split('_')).title()
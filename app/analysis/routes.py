@@ -1,11 +1,16 @@
 import os
 import pandas as pd
 import json
-from flask import render_template, request, jsonify, current_app, flash, redirect, url_for, session
+from flask import render_template, request, jsonify, current_app, flash, redirect, url_for, session, abort
 from flask_login import login_required, current_user
 from app.analysis import bp
-from app.analysis.service import FinancialAnalyzer
-from app.core.models import FinancialFile, Analysis, db
+from app.analysis.service import file_forecasts
+from app.analysis.forecasting import MODEL_CHOICES, MODEL_LABELS
+from app.analysis.jobs import job_status, submit_analysis
+from app.core.models import FinancialFile, Analysis, AnalysisJob, db
+from app.core.schema import ensure_column_roles, role_columns
+from app.core.profile import ensure_profile
+from app.core.storage import params_digest
 
 @bp.route('/analyze/<int:file_id>', methods=['GET', 'POST'])
 @login_required
@@ -17,62 +22,60 @@ def analyze_file(file_id):
         flash('You do not have permission to analyze this file')
         return redirect(url_for('core.dashboard'))
     
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-    
-    # Read the file data with pandas
     try:
-        if file.file_type == 'csv':
-            df = pd.read_csv(file_path)
-        else:  # Excel files
-            df = pd.read_excel(file_path)
-        
-        # Basic file stats
-        rows, cols = df.shape
-        column_names = df.columns.tolist()
-        
-        # Get a sample of the data (first 5 rows)
-        sample_data = df.head(5).to_html(classes='table table-striped')
-        
-        # Create financial analyzer instance
-        analyzer = FinancialAnalyzer(df)
-        
-        # Generate analysis results
-        financial_ratios = analyzer.calculate_financial_ratios()
-        correlation_matrix = analyzer.generate_correlation_matrix()
-        trends = analyzer.find_trends()
-        
-        # Generate charts for numeric columns
-        charts = {}
-        numeric_columns = df.select_dtypes(include=['number']).columns.tolist()
-        for column in numeric_columns[:5]:  # Limit to first 5 numeric columns to avoid too many charts
-            charts[column] = analyzer.generate_time_series_chart(column)
+        roles = role_columns(ensure_column_roles(file))
+        numeric_columns = ensure_profile(file)['numeric_columns']
         
-        # Save analysis results to database
-        analysis_results = {
-            'financial_ratios': financial_ratios,
-            'trends': trends
-        }
-        
-        new_analysis = Analysis(
-            file_id=file.id,
-            analysis_type='financial_metrics',
-            results=analysis_results
-        )
-        db.session.add(new_analysis)
-        db.session.commit()
-        
-        return render_template('analysis/analysis_results.html', 
-                              file=file,
-                              ratios=financial_ratios,
-                              correlation_matrix=correlation_matrix,
-                              trends=trends,
-                              charts=charts,
-                              numeric_columns=numeric_columns)
+        # The analysis runs on the worker pool; the job page polls it and
+        # moves on to the results once it is done. An analysis already done
+        # for this version of the file is shown again unless the user asks
+        # to recompute it
+        recompute = request.method == 'POST' and request.form.get('recompute') == '1'
+        job = submit_analysis(file, current_user.id, roles, numeric_columns, recompute=recompute)
+        return redirect(url_for('analysis.analysis_job', job_id=job.id))
                               
     except Exception as e:
         flash(f'Error analyzing file: {str(e)}')
         return redirect(url_for('core.dashboard'))
 
+def _get_job(job_id):
+    job = AnalysisJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        abort(403)
+    return job
+
+@bp.route('/jobs/<job_id>')
+@login_required
+def analysis_job(job_id):
+    """Progress page of an analysis job"""
+    job = _get_job(job_id)
+    status = job_status(job)
+    
+    if status['status'] == 'complete':
+        return redirect(url_for('analysis.analysis_results', job_id=job.id))
+    if status['status'] == 'failed':
+        flash(f"Error analyzing file: {status['error']}")
+        return redirect(url_for('core.view_file', file_id=job.file_id))
+    
+    return render_template('analysis/analysis_job.html', file=job.file, job=status)
+
+@bp.route('/jobs/<job_id>/results')
+@login_required
+def analysis_results(job_id):
+    """Render the output stored on a finished analysis job"""
+    job = _get_job(job_id)
+    if job.status != 'complete':
+        return redirect(url_for('analysis.analysis_job', job_id=job.id))
+    
+    result = job.result
+    return render_template('analysis/analysis_results.html', 
+                          file=job.file,
+                          analysis=job.analysis,
+                          ratios=result['financial_ratios'],
+                          trends=result['trends'],
+                          chart_columns=result.get('chart_columns', []),
+                          numeric_columns=job.params['numeric_columns'])
+
 @bp.route('/forecast/<int:file_id>', methods=['GET', 'POST'])
 @login_required
 def forecast(file_id):
@@ -83,43 +86,47 @@ def forecast(file_id):
         flash('You do not have permission to forecast this file')
         return redirect(url_for('core.dashboard'))
     
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-    
     if request.method == 'POST':
         try:
             column = request.form.get('column')
             periods = int(request.form.get('periods', 3))
+            model = request.form.get('model', 'auto')
+            if model not in MODEL_CHOICES:
+                model = 'auto'
             
-            # Read the file data
-            if file.file_type == 'csv':
-                df = pd.read_csv(file_path)
-            else:  # Excel files
-                df = pd.read_excel(file_path)
+            roles = role_columns(ensure_column_roles(file))
             
-            analyzer = FinancialAnalyzer(df)
-            forecast_result = analyzer.forecasting_simple(column, periods)
+            # Every numeric column is fitted in one pass and cached together,
+            # so forecasting another column of the file is a cache read
+            result = file_forecasts(file, roles, periods, model).get(column)
+            forecast_data = result['forecast'] if result else None
             
-            if forecast_result is not None:
-                forecast_data = forecast_result.to_dict(orient='records')
-                
-                # Save forecast to database
-                analysis_results = {
-                    'forecast_column': column,
-                    'periods': periods,
-                    'forecast_data': forecast_data
-                }
-                
-                new_analysis = Analysis(
-                    file_id=file.id,
-                    analysis_type='forecast',
-                    results=analysis_results
-                )
-                db.session.add(new_analysis)
-                db.session.commit()
+            if forecast_data is not None:
+                # Save the forecast once per file version and parameters
+                digest = params_digest({'roles': roles, 'column': column, 'periods': periods, 'model': model})
+                if Analysis.query.filter_by(file_id=file.id, version=file.version, analysis_type='forecast',
+                                            params_hash=digest).first() is None:
+                    analysis_results = {
+                        'forecast_column': column,
+                        'periods': periods,
+                        'model': result['model'],
+                        'forecast_data': forecast_data
+                    }
+                    
+                    new_analysis = Analysis(
+                        file_id=file.id,
+                        analysis_type='forecast',
+                        results=analysis_results,
+                        version=file.version,
+                        params_hash=digest
+                    )
+                    db.session.add(new_analysis)
+                    db.session.commit()
                 
                 return render_template('analysis/forecast_results.html',
                                       file=file,
                                       column=column,
+                                      model=result,
                                       forecast_data=forecast_data)
             else:
                 flash(f'Unable to forecast column: {column}')
@@ -131,17 +138,12 @@ def forecast(file_id):
     
     # GET request - show forecast form
     try:
-        # Read the file data
-        if file.file_type == 'csv':
-            df = pd.read_csv(file_path)
-        else:  # Excel files
-            df = pd.read_excel(file_path)
-        
-        numeric_columns = df.select_dtypes(include=['number']).columns.tolist()
+        numeric_columns = ensure_profile(file)['numeric_columns']
         
         return render_template('analysis/forecast_form.html',
                               file=file,
-                              numeric_columns=numeric_columns)
+                              numeric_columns=numeric_columns,
+                              models=MODEL_LABELS)
                               
     except Exception as e:
         flash(f'Error reading file: {str(e)}')
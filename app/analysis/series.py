@@ -0,0 +1,91 @@
+"""Chart data as compact JSON series for Chart.js.
+
+Interactive pages draw their charts in the browser from these series
+instead of embedding PNGs drawn on the server; the PNG renderer in
+``app.core.render`` is only used for exports. Long series are downsampled
+with LTTB (see ``app.core.downsample``) to about ``max_points`` points, so
+the payload stays small whatever the size of the file while peaks and
+troughs stay visible.
+
+Every series is ``{'labels': [...], 'datasets': [{'label', 'data'}]}``
+with NaN sent as null.
+"""
+import numpy as np
+
+from app.analysis.service import get_analyzer, date_positions
+from app.core.downsample import downsample_indices
+from app.core.storage import cached_artifact
+
+DEFAULT_MAX_POINTS = 500
+MAX_POINTS_LIMIT = 5000
+
+
+def clamp_max_points(value):
+    """Bound a requested point count to a sensible range"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_POINTS
+    return min(max(value, 3), MAX_POINTS_LIMIT)
+
+
+def _values(values):
+    values = np.asarray(values, dtype='float64')
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+def _labels(dates):
+    labels = np.datetime_as_string(np.asarray(dates, dtype='datetime64[D]'))
+    return [None if label == 'NaT' else str(label) for label in labels]
+
+
+def time_series(file, roles, columns, max_points=DEFAULT_MAX_POINTS):
+    """Series of ``columns`` over the date column of a file, cached per file content"""
+    def compute():
+        analyzer = get_analyzer(file, roles)
+        present = [column for column in columns if column in analyzer.df.columns]
+        if not present:
+            return {'labels': [], 'datasets': []}
+        payloads = [analyzer.time_series_data(column) for column in present]
+        dates = payloads[0]['dates']
+        index = downsample_indices(date_positions(dates), [payload['values'] for payload in payloads],
+                                   max_points)
+        return {
+            'labels': _labels(dates[index]),
+            'datasets': [{'label': payload['column'], 'data': _values(payload['values'][index])}
+                         for payload in payloads],
+            'points': len(dates),
+        }
+
+    return cached_artifact(file, 'time_series', compute,
+                           params={'roles': roles, 'columns': columns, 'max_points': max_points})
+
+
+def correlation(file, roles):
+    """Correlation matrix of a file's numeric columns as ``{'columns', 'matrix'}``"""
+    def compute():
+        payload = get_analyzer(file, roles).correlation_data()
+        if payload is None:
+            return {'columns': [], 'matrix': []}
+        return {'columns': payload['columns'], 'matrix': [_values(row) for row in payload['matrix']]}
+
+    return cached_artifact(file, 'correlation', compute, params={'roles': roles})
+
+
+def comparison_series(comparison, column, max_points=DEFAULT_MAX_POINTS):
+    """Series of one column of every compared dataset over the row position"""
+    payload = comparison.comparison_data(column)
+    if payload is None:
+        return {'labels': [], 'datasets': []}
+    series = [(i, values) for i, values in enumerate(payload['series']) if values is not None]
+    length = max((len(values) for _, values in series), default=0)
+    padded = []
+    for _, values in series:
+        # Shorter datasets end early; pad them so every dataset shares the labels
+        column = np.full(length, np.nan)
+        column[:len(values)] = values
+        padded.append(column)
+    index = downsample_indices(np.arange(length), padded, max_points)
+    datasets = [{'label': f'Dataset {i+1}', 'data': _values(values[index])}
+                for (i, _), values in zip(series, padded)]
+    return {'labels': [int(position) + 1 for position in index], 'datasets': datasets, 'points': length}
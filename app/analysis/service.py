@@ -1,76 +1,159 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import os
-import io
 import base64
 from flask import current_app
 from datetime import datetime
+from app.core.schema import infer_column_roles, role_columns
+from app.core.loader import load_financial_frame
+from app.core.profile import has_running_totals
+from app import db
+from app.core.models import ForecastModel
+from app.core.storage import cached_artifact, params_digest
+from sqlalchemy.exc import IntegrityError
+from app.core.ingest import is_streamed, load_stream_frames
+from app.analysis.ratios import aggregate_ratios, ratio_series, totals_ratios
+from app.analysis.forecasting import (DEFAULT_LEVEL, fit_columns, forecast_columns, forecast_from_states,
+                                     season_length)
+from app.analysis.backtest import DEFAULT_HORIZON, best_models, get_backtest_executor, run_backtest
+from app.core.downsample import lttb_indices
+from app.core.dtypes import as_float64
+from app.core.render import PNG_MAX_POINTS, render_chart
+
+def get_analyzer(file, roles):
+    """Analyzer over the whole file, or over the rollup and sample of a streamed file"""
+    if is_streamed(file):
+        rollup, sample = load_stream_frames(file, roles)
+        return StreamedFinancialAnalyzer(rollup, sample, roles)
+    return FinancialAnalyzer(load_financial_frame(file), roles, file.profile)
+
+def file_forecasts(file, roles, periods=3, model='linear', level=DEFAULT_LEVEL):
+    """Forecasts of every numeric column of a file from its stored fitted models"""
+    return forecast_from_states(fitted_models(file, roles, model), periods, level)
+
+def fitted_models(file, roles, model='linear'):
+    """Fitted forecast models of every numeric column of a file, as ``{column: state}``.
+    
+    Models are fitted together on first use and stored per (file version,
+    model, roles, column), so later forecasts of any horizon or interval
+    level only evaluate the stored states. An append moves the file to a
+    new version and drops the models of the old one (see
+    ``app.core.append``).
+    
+    With ``model='auto'`` each column uses the best model of its backtest
+    (see ``file_backtest``); columns too short to backtest fall back to
+    the model with the lowest AICc.
+    """
+    digest = params_digest({'roles': roles})
+    rows = (ForecastModel.query
+            .filter_by(file_id=file.id, version=file.version, model=model, params_hash=digest)
+            .order_by(ForecastModel.id).all())
+    if rows:
+        return {row.column: row.state for row in rows}
+    
+    states = _fit_models(file, roles, model)
+    for column, state in states.items():
+        db.session.add(ForecastModel(file_id=file.id, version=file.version, model=model,
+                                     params_hash=digest, column=column, state=state))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request stored the same models first
+        db.session.rollback()
+    return states
+
+def _fit_models(file, roles, model):
+    analyzer = get_analyzer(file, roles)
+    if model != 'auto':
+        return analyzer.fit_forecasts(model=model)
+    backtest = file_backtest(file, roles)
+    columns = list(analyzer.df.select_dtypes(include=['number']).columns)
+    groups = {}
+    for column in columns:
+        best = backtest['columns'].get(column, {}).get('best')
+        groups.setdefault(best or 'auto', []).append(column)
+    states = {}
+    for best, group in groups.items():
+        for column, state in analyzer.fit_forecasts(group, model=best).items():
+            state['selection'] = 'aicc' if best == 'auto' else 'backtest'
+            states[column] = state
+    return {column: states[column] for column in columns if column in states}
+
+def file_backtest(file, roles, horizon=DEFAULT_HORIZON):
+    """Rolling-origin backtest of every forecast model on a file, cached per file content"""
+    def compute():
+        return get_analyzer(file, roles).backtest(horizon=horizon, executor=get_backtest_executor())
+    
+    return cached_artifact(file, 'backtest', compute, params={'roles': roles, 'horizon': horizon})
+
+def date_positions(dates):
+    """Dates as float nanoseconds, NaN for NaT, for use as chart x values"""
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    positions = dates.view('int64').astype('float64')
+    positions[np.isnat(dates)] = np.nan
+    return positions
+
+def _data_uri(kind, payload):
+    if payload is None:
+        return None
+    png = render_chart(kind, payload)
+    return 'data:image/png;base64,' + base64.b64encode(png).decode('utf-8')
 
 class FinancialAnalyzer:
-    def __init__(self, dataframe):
+    # What the frame holds; part of the spec of cached charts
+    source = 'rows'
+    
+    def __init__(self, dataframe, column_roles=None, profile=None):
         self.df = dataframe
-        
+        # Role map {role: column}, normally the one stored on the FinancialFile
+        if column_roles is None:
+            column_roles = role_columns(infer_column_roles(dataframe))
+        self.roles = column_roles
+        # Statistics profile of the same rows; ratios and trends are read from
+        # its running totals, which appends extend (see app.core.profile)
+        self.totals = None
+        if profile is not None and has_running_totals(profile):
+            self.totals = {col: profile['stats'][col] for col in profile['numeric_columns']}
+    
+    def ratio_series(self):
+        """Per-row series of every ratio the column roles support, see ``app.analysis.ratios``"""
+        return ratio_series(self.df, self.roles)
+    
     def calculate_financial_ratios(self):
-        """Calculate common financial ratios based on the available columns"""
-        ratios = {}
-        columns = self.df.columns
-        
-        # Standardize column names (lowercase)
-        std_columns = [col.lower() for col in columns]
-        col_map = dict(zip(std_columns, columns))
-        
-        # Profit Margin
-        if all(x in std_columns for x in ['revenue', 'net income']):
-            revenue_col = col_map['revenue']
-            net_income_col = col_map['net income']
-            ratios['profit_margin'] = (self.df[net_income_col] / self.df[revenue_col]).mean()
-        
-        # Gross Margin
-        if all(x in std_columns for x in ['revenue', 'cost of goods sold']):
-            revenue_col = col_map['revenue']
-            cogs_col = col_map['cost of goods sold']
-            ratios['gross_margin'] = ((self.df[revenue_col] - self.df[cogs_col]) / self.df[revenue_col]).mean()
-        
-        # Return on Assets (ROA)
-        if all(x in std_columns for x in ['net income', 'total assets']):
-            net_income_col = col_map['net income']
-            assets_col = col_map['total assets']
-            ratios['roa'] = (self.df[net_income_col] / self.df[assets_col]).mean()
-        
-        # Return on Equity (ROE)
-        if all(x in std_columns for x in ['net income', 'equity']):
-            net_income_col = col_map['net income']
-            equity_col = col_map['equity']
-            ratios['roe'] = (self.df[net_income_col] / self.df[equity_col]).mean()
-        
-        # Current Ratio
-        if all(x in std_columns for x in ['current assets', 'current liabilities']):
-            current_assets_col = col_map['current assets']
-            current_liabilities_col = col_map['current liabilities']
-            ratios['current_ratio'] = (self.df[current_assets_col] / self.df[current_liabilities_col]).mean()
-        
-        # Debt to Equity
-        if all(x in std_columns for x in ['total debt', 'equity']):
-            debt_col = col_map['total debt']
-            equity_col = col_map['equity']
-            ratios['debt_to_equity'] = (self.df[debt_col] / self.df[equity_col]).mean()
-        
-        # Try to calculate any available ratio even if column names don't match standard names
-        # Look for columns containing 'revenue' or 'income'
-        revenue_cols = [col for col in columns if 'revenue' in col.lower() or 'income' in col.lower()]
-        # Look for columns containing 'profit'
-        profit_cols = [col for col in columns if 'profit' in col.lower() or 'margin' in col.lower()]
-        
-        if revenue_cols and profit_cols:
-            ratios['estimated_profit_margin'] = (self.df[profit_cols[0]] / self.df[revenue_cols[0]]).mean()
-        
-        return ratios
+        """Current value of every supported ratio, see ``app.analysis.ratios.aggregate_ratios``"""
+        if self.totals is not None:
+            ratios = totals_ratios({col: stats['sum'] for col, stats in self.totals.items()},
+                                   {col: stats['latest'] for col, stats in self.totals.items()}, self.roles)
+        else:
+            ratios = aggregate_ratios(self.df, self.roles)
+        # Undefined ratios are left out
+        return {name: value for name, value in ratios.items() if value is not None}
+    
+    def calculate_ratio_series(self):
+        """Ratio series with period labels, as ``{'periods': [...], 'ratios': {name: [...]}}``"""
+        series = self.ratio_series()
+        if 'date' in self.roles:
+            dates = pd.to_datetime(self.df[self.roles['date']], errors='coerce', format='mixed')
+            periods = [None if pd.isna(date) else date.strftime('%Y-%m-%d') for date in dates]
+        else:
+            periods = list(range(1, len(series) + 1))
+        return {
+            'periods': periods,
+            'ratios': {name: [None if pd.isna(value) else float(value) for value in values]
+                       for name, values in series.items()},
+        }
     
     def generate_time_series_chart(self, column_name):
-        """Generate a time series chart for a specified column"""
-        # Try to find date column
-        date_cols = [col for col in self.df.columns if 'date' in col.lower() or 'period' in col.lower()]
+        """Generate a time series chart for a specified column as a data URI"""
+        return _data_uri('time_series', self.time_series_data(column_name, PNG_MAX_POINTS))
+    
+    def time_series_data(self, column_name, max_points=None):
+        """Data of the time series chart of a column, for ``app.core.render``.
+        
+        With ``max_points`` the series is downsampled with LTTB.
+        """
+        # Use the detected date column, if any
+        date_cols = [self.roles['date']] if 'date' in self.roles else []
         
         if not date_cols:
             # If no date column is found, try to use the index if it's datetime
@@ -89,26 +172,20 @@ class FinancialAnalyzer:
                     # If conversion fails, use a sequence
                     date_col = pd.date_range(start='1/1/2023', periods=len(self.df), freq='M')
         
-        # Create matplotlib figure
-        plt.figure(figsize=(10, 6))
-        plt.plot(date_col, self.df[column_name])
-        plt.title(f'{column_name} Over Time')
-        plt.xlabel('Date')
-        plt.ylabel(column_name)
-        plt.grid(True)
-        plt.tight_layout()
-        
-        # Save figure to a base64 string
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        img_str = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close()
-        
-        return f'data:image/png;base64,{img_str}'
+        # Plain arrays pickle cheaply to the renderer processes
+        dates = np.asarray(date_col, dtype='datetime64[ns]')
+        values = self.df[column_name].to_numpy(dtype='float64', na_value=np.nan)
+        if max_points is not None and len(values) > max_points:
+            index = lttb_indices(date_positions(dates), values, max_points)
+            dates, values = dates[index], values[index]
+        return {'column': str(column_name), 'dates': dates, 'values': values}
     
     def generate_correlation_matrix(self):
-        """Generate a correlation matrix for numeric columns"""
+        """Generate a correlation matrix for numeric columns as a data URI"""
+        return _data_uri('correlation', self.correlation_data())
+    
+    def correlation_data(self):
+        """Data of the correlation matrix chart, or None without numeric columns"""
         # Select only numeric columns
         numeric_df = self.df.select_dtypes(include=['number'])
         
@@ -117,72 +194,102 @@ class FinancialAnalyzer:
         
         # Calculate correlation matrix
         corr_matrix = numeric_df.corr()
-        
-        # Create heatmap
-        plt.figure(figsize=(10, 8))
-        plt.matshow(corr_matrix, fignum=1)
-        plt.colorbar()
-        
-        # Add column names as ticks
-        plt.xticks(range(len(corr_matrix.columns)), corr_matrix.columns, rotation=90)
-        plt.yticks(range(len(corr_matrix.columns)), corr_matrix.columns)
-        
-        # Save figure to a base64 string
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        img_str = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close()
-        
-        return f'data:image/png;base64,{img_str}'
+        return {
+            'columns': [str(column) for column in corr_matrix.columns],
+            'matrix': corr_matrix.to_numpy(),
+        }
     
     def find_trends(self):
         """Identify trends in the financial data"""
-        # Select only numeric columns
-        numeric_df = self.df.select_dtypes(include=['number'])
-        
-        if numeric_df.empty:
-            return {}
+        if self.totals is not None:
+            ends = {col: tuple(np.nan if stats[key] is None else stats[key] for key in ('first', 'last'))
+                    for col, stats in self.totals.items()} if len(self.df) > 1 else {}
+        else:
+            # Select only numeric columns
+            numeric_df = as_float64(self.df.select_dtypes(include=['number']))
+            ends = {col: (float(numeric_df[col].iloc[0]), float(numeric_df[col].iloc[-1]))
+                    for col in numeric_df.columns if len(numeric_df[col]) > 1}
         
         trends = {}
         
         # Calculate growth rates for each numeric column
-        for col in numeric_df.columns:
-            if len(numeric_df[col]) > 1:
-                # Calculate growth rate
-                first_val = numeric_df[col].iloc[0]
-                last_val = numeric_df[col].iloc[-1]
-                
-                if first_val != 0:
-                    growth_rate = ((last_val - first_val) / first_val) * 100
-                    trends[col] = {
-                        'growth_rate': growth_rate,
-                        'trend': 'increasing' if growth_rate > 0 else 'decreasing'
-                    }
+        for col, (first_val, last_val) in ends.items():
+            if first_val != 0:
+                growth_rate = ((last_val - first_val) / first_val) * 100
+                trends[col] = {
+                    'growth_rate': growth_rate,
+                    'trend': 'increasing' if growth_rate > 0 else 'decreasing'
+                }
         
         return trends
     
     def forecasting_simple(self, column_name, periods=3):
-        """Simple forecasting using linear regression"""
+        """Simple forecasting using linear regression, with 95% prediction intervals"""
         if column_name not in self.df.columns:
             return None
-            
-        # Create a sequence of periods
-        x = np.array(range(len(self.df))).reshape(-1, 1)
-        y = self.df[column_name].values
-        
-        # Linear regression
-        from sklearn.linear_model import LinearRegression
-        model = LinearRegression()
-        model.fit(x, y)
+        result = self.forecast_all([column_name], periods).get(column_name)
+        return None if result is None else pd.DataFrame(result['forecast'])
+    
+    def forecast_all(self, columns=None, periods=3, level=DEFAULT_LEVEL, model='linear'):
+        """Forecasts of several columns, by default every numeric one, fitted at once.
         
-        # Predict future periods
-        future_x = np.array(range(len(self.df), len(self.df) + periods)).reshape(-1, 1)
-        future_y = model.predict(future_x)
+        ``model`` is one of ``MODEL_CHOICES``; the season length of seasonal
+        models follows the spacing of the date column. Returns the
+        JSON-ready results of ``app.analysis.forecasting.forecast_columns``.
+        """
+        if columns is None:
+            columns = list(self.df.select_dtypes(include=['number']).columns)
+        return forecast_columns(self.df, columns, periods, level, model, self._season_length())
+    
+    def fit_forecasts(self, columns=None, model='linear'):
+        """Fitted forecast models of several columns, by default every numeric one.
         
-        # Create DataFrame for results
-        result = pd.DataFrame()
-        result['period'] = range(1, periods + 1)
-        result['forecast'] = future_y
+        Returns the JSON-ready states of ``app.analysis.forecasting.fit_columns``.
+        """
+        if columns is None:
+            columns = list(self.df.select_dtypes(include=['number']).columns)
+        return fit_columns(self.df, columns, model, self._season_length())
+    
+    def backtest(self, columns=None, horizon=DEFAULT_HORIZON, executor=None):
+        """Rolling-origin backtest of every forecast model on several columns.
         
+        Returns the horizon, number of origins and season length with
+        ``columns`` mapping each column to ``{'models': {model: {'mape',
+        'mase'}}, 'best'}``; see ``app.analysis.backtest``.
+        """
+        if columns is None:
+            columns = list(self.df.select_dtypes(include=['number']).columns)
+        seasons = self._season_length()
+        values = np.column_stack([self.df[column].to_numpy(dtype='float64', na_value=np.nan)
+                                  for column in columns]) if columns else np.empty((len(self.df), 0))
+        result = run_backtest(values, horizon, season_length=seasons, executor=executor)
+        best = best_models(result, columns)
+        models = result.pop('models')
+        result['columns'] = {
+            column: {'models': {model: {'mape': scores['mape'][i], 'mase': scores['mase'][i]}
+                                for model, scores in models.items()},
+                     'best': best[column]}
+            for i, column in enumerate(columns)
+        }
         return result
+    
+    def _season_length(self):
+        return season_length(self.df[self.roles['date']]) if 'date' in self.roles else None
+
+
+class StreamedFinancialAnalyzer(FinancialAnalyzer):
+    """Analyzer for files ingested in chunks (see ``app.core.ingest``).
+
+    Ratios, trends, charts and forecasts run on the monthly rollup and the
+    correlation matrix on the uniform row sample, so nothing ever holds the
+    full file. Without a date column the sample stands in for the rollup.
+    """
+    source = 'rollup'
+    
+    def __init__(self, rollup, sample, column_roles):
+        super().__init__(rollup if rollup is not None else sample, column_roles)
+        self.sample = sample
+    
+    def correlation_data(self):
+        """Correlation matrix of the row sample"""
+        return FinancialAnalyzer(self.sample, self.roles).correlation_data()
@@ -1,7 +1,25 @@
-from flask import jsonify, request, current_app
+from flask import jsonify, request, current_app, abort
 from app.api import bp
-from app.core.models import FinancialFile, Analysis
+from app.core.models import FinancialFile, Analysis, AnalysisJob, UploadSession, db
+from app.core.loader import financial_file_path, get_frame_cache, read_financial_file, read_financial_window
+from app.core.ingest import ROLLUP_GRANULARITIES, load_period_rollup
+from app.core.render import get_chart_renderer
+from app.core.schema import ROLES, ensure_column_roles, role_columns
+from app.core.profile import ensure_profile
+from app.core.dtypes import frame_records
+from app.core.routes import allowed_file
+from app.core.sheets import workbook_sheets
+from app.analysis.ratios import RATIO_ROLES, aggregate_ratios, ratio_label
+from app.analysis.jobs import MAX_CHARTS, job_status, submit_analysis
+from app.analysis.series import clamp_max_points, comparison_series, correlation, time_series
+from app.analysis.service import file_backtest, file_forecasts
+from app.analysis.forecasting import DEFAULT_LEVEL, MODEL_CHOICES
+from app.comparison.service import ComparisonService
+from app.core.append import AppendError, append_rows
+from app.core.uploads import (UploadError, create_upload, append_chunk, finalize_upload,
+                              upload_status)
 from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
 import os
 import pandas as pd
 from datetime import datetime, timedelta
@@ -20,6 +38,9 @@ def get_files():
                 'filename': file.filename,
                 'file_type': file.file_type,
                 'upload_date': file.upload_date.isoformat(),
+                'version': file.version,
+                'sheet_name': file.sheet_name,
+                'parent_id': file.parent_id,
             } for file in files
         ]
     })
@@ -27,28 +48,34 @@ def get_files():
 @bp.route('/file/<int:file_id>', methods=['GET'])
 @login_required
 def get_file_data(file_id):
-    """Get data for a specific file"""
+    """Get data for a specific file.
+    
+    Optional query parameters select a slice: ``columns`` (comma separated),
+    ``offset`` and ``limit`` (default 100 rows).
+    """
     file = FinancialFile.query.get_or_404(file_id)
     
     # Check if user owns the file
     if file.user_id != current_user.id:
         return jsonify({'error': 'Access denied'}), 403
     
-    # Get file path
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
+    # Shape and column names come from the stored profile
+    profile = ensure_profile(file)
+    shape = (profile['rows'], len(profile['columns']))
     
-    # Read data
-    if file.file_type == 'csv':
-        df = pd.read_csv(file_path)
-    else:  # excel
-        df = pd.read_excel(file_path)
+    columns = request.args.get('columns')
+    columns = columns.split(',') if columns else profile['columns']
+    unknown_columns = [col for col in columns if col not in profile['columns']]
+    if unknown_columns:
+        return jsonify({'error': f"Unknown columns: {', '.join(unknown_columns)}"}), 400
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 100, type=int), 0), 1000)
     
-    # Get basic stats
-    columns = df.columns.tolist()
-    shape = df.shape
+    # Read only the requested slice
+    df = read_financial_window(file, columns=columns, offset=offset, limit=limit)
     
     # Convert to JSON-serializable format
-    data = df.head(100).to_dict(orient='records')
+    data = frame_records(df)
     
     return jsonify({
         'file': {
@@ -56,14 +83,146 @@ def get_file_data(file_id):
             'filename': file.filename,
             'file_type': file.file_type,
             'upload_date': file.upload_date.isoformat(),
+            'version': file.version,
+            'sheet_name': file.sheet_name,
+            'parent_id': file.parent_id,
+            'sheets': workbook_sheets(file),
         },
         'data': {
             'columns': columns,
             'shape': shape,
+            'offset': offset,
             'records': data
-        }
+        },
+        'memory': profile.get('memory'),
+        'column_roles': ensure_column_roles(file)
+    })
+
+@bp.route('/file/<int:file_id>/column-roles', methods=['GET', 'PUT'])
+@login_required
+def column_roles(file_id):
+    """Get the column-role map of a file, or override roles with {role: column or null}"""
+    file = FinancialFile.query.get_or_404(file_id)
+    
+    # Check if user owns the file
+    if file.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    columns = ensure_profile(file)['columns']
+    
+    if request.method == 'PUT':
+        changes = request.get_json(silent=True)
+        if not isinstance(changes, dict):
+            return jsonify({'error': 'Expected a JSON object of {role: column}'}), 400
+        
+        unknown_roles = [role for role in changes if role not in ROLES]
+        if unknown_roles:
+            return jsonify({'error': f"Unknown roles: {', '.join(unknown_roles)}"}), 400
+        unknown_columns = [col for col in changes.values() if col is not None and col not in columns]
+        if unknown_columns:
+            return jsonify({'error': f"Unknown columns: {', '.join(map(str, unknown_columns))}"}), 400
+        
+        # Reassign the JSON value so SQLAlchemy notices the change
+        file.column_role_overrides = {**(file.column_role_overrides or {}), **changes}
+        db.session.commit()
+    
+    return jsonify({
+        'file_id': file.id,
+        'roles': list(ROLES),
+        'column_roles': ensure_column_roles(file)
     })
 
+@bp.route('/file/<int:file_id>/append', methods=['POST'])
+@login_required
+def append_file(file_id):
+    """Append the rows of an uploaded CSV/Excel file with the same columns.
+    
+    An optional ``version`` form field makes the append conditional on the
+    file still being at that version.
+    """
+    file = FinancialFile.query.get_or_404(file_id)
+    
+    # Check if user owns the file
+    if file.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    upload = request.files.get('file')
+    if upload is None or not allowed_file(upload.filename):
+        return jsonify({'error': 'Allowed file types are csv, xlsx, xls'}), 400
+    
+    try:
+        rows = read_financial_file(upload.stream, upload.filename.rsplit('.', 1)[1].lower())
+    except (ValueError, pd.errors.ParserError) as e:
+        return jsonify({'error': f'Could not read rows: {str(e)}'}), 400
+    
+    try:
+        appended = append_rows(file, rows, request.form.get('version', type=int))
+    except AppendError as e:
+        return jsonify({'error': str(e), 'version': file.version}), e.status_code
+    
+    return jsonify({
+        'file_id': file.id,
+        'version': file.version,
+        'rows': file.profile['rows'],
+        'appended_rows': appended
+    })
+
+def _get_upload_session(upload_id):
+    session = UploadSession.query.get_or_404(upload_id)
+    if session.user_id != current_user.id:
+        abort(403)
+    return session
+
+@bp.route('/uploads', methods=['POST'])
+@login_required
+def create_upload_session():
+    """Start a resumable upload: {"filename": ..., "size": bytes}"""
+    payload = request.get_json(silent=True) or {}
+    filename = secure_filename(payload.get('filename') or '')
+    if not allowed_file(filename):
+        return jsonify({'error': 'Allowed file types are csv, xlsx, xls'}), 400
+    size = payload.get('size')
+    if size is not None and (not isinstance(size, int) or size < 0):
+        return jsonify({'error': 'size must be a non-negative integer'}), 400
+    
+    try:
+        session = create_upload(current_user.id, filename, filename.rsplit('.', 1)[1].lower(), size)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    return jsonify(upload_status(session)), 201
+
+@bp.route('/uploads/<upload_id>', methods=['GET', 'PUT'])
+@login_required
+def upload_session(upload_id):
+    """Get the state of an upload, or PUT the next chunk as the raw body at ?offset="""
+    session = _get_upload_session(upload_id)
+    
+    if request.method == 'PUT':
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({'error': 'offset is required'}), 400
+        try:
+            append_chunk(session, offset, request.stream)
+        except UploadError as e:
+            return jsonify(dict(upload_status(session), error=str(e))), e.status_code
+    
+    return jsonify(upload_status(session))
+
+@bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    """Finish an upload: {"sha256": hex digest of the whole file}"""
+    session = _get_upload_session(upload_id)
+    payload = request.get_json(silent=True) or {}
+    
+    try:
+        finalize_upload(session, payload.get('sha256'))
+    except UploadError as e:
+        return jsonify(dict(upload_status(session), error=str(e))), e.status_code
+    # Verification and ingestion continue in the background; poll the session
+    # for file_id, or for an error and status uploading on a checksum mismatch
+    return jsonify(upload_status(session)), 202
+
 @bp.route('/analysis/<int:file_id>', methods=['GET'])
 @login_required
 def get_analysis(file_id):
@@ -87,6 +246,34 @@ def get_analysis(file_id):
         'results': analysis.results
     })
 
+@bp.route('/analysis/<int:file_id>/jobs', methods=['POST'])
+@login_required
+def create_analysis_job(file_id):
+    """Queue a financial metrics analysis of a file; poll the returned job.
+    
+    A finished job for the same file version and parameters is returned
+    instead, unless ``recompute`` is ``1`` or ``true``.
+    """
+    file = FinancialFile.query.get_or_404(file_id)
+    
+    # Check if user owns the file
+    if file.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    roles = role_columns(ensure_column_roles(file))
+    recompute = request.values.get('recompute', '').lower() in ('1', 'true')
+    job = submit_analysis(file, current_user.id, roles, ensure_profile(file)['numeric_columns'], recompute)
+    return jsonify(job_status(job)), 202
+
+@bp.route('/analysis-jobs/<job_id>', methods=['GET'])
+@login_required
+def get_analysis_job(job_id):
+    """Status and progress of an analysis job; finished jobs include their analysis_id"""
+    job = AnalysisJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify(job_status(job))
+
 @bp.route('/health', methods=['GET'])
 def health_check():
     """Simple health check endpoint"""
@@ -96,6 +283,114 @@ def health_check():
         'version': '1.0.0'
     })
 
+@bp.route('/diagnostics/frame-cache', methods=['GET'])
+@login_required
+def frame_cache_stats():
+    """Hit/miss/eviction counters of this worker's parsed-file cache"""
+    return jsonify(get_frame_cache().stats())
+
+@bp.route('/diagnostics/chart-renderer', methods=['GET'])
+@login_required
+def chart_renderer_stats():
+    """Charts drawn by this worker's renderer pool and its throughput"""
+    return jsonify(get_chart_renderer().stats())
+
+@bp.route('/file/<int:file_id>/series', methods=['GET'])
+@login_required
+def file_series(file_id):
+    """Downsampled time series of numeric columns, by default the first MAX_CHARTS"""
+    file = FinancialFile.query.get_or_404(file_id)
+    if file.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    roles = role_columns(ensure_column_roles(file))
+    columns = request.args.getlist('column') or ensure_profile(file)['numeric_columns'][:MAX_CHARTS]
+    return jsonify(time_series(file, roles, columns, clamp_max_points(request.args.get('max_points'))))
+
+@bp.route('/file/<int:file_id>/correlation', methods=['GET'])
+@login_required
+def file_correlation(file_id):
+    """Correlation matrix of the numeric columns of a file"""
+    file = FinancialFile.query.get_or_404(file_id)
+    if file.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(correlation(file, role_columns(ensure_column_roles(file))))
+
+@bp.route('/file/<int:file_id>/forecast', methods=['GET'])
+@login_required
+def file_forecast(file_id):
+    """Forecasts with prediction intervals of the numeric columns of a file.
+    
+    ``periods`` (1-60, default 3), ``model`` (one of MODEL_CHOICES, default
+    auto), ``level`` of the intervals (0.5-0.999, default 0.95) and
+    optionally ``column``, repeated, to limit the response. Models are
+    fitted once per file version; other horizons and levels reuse them.
+    """
+    file = FinancialFile.query.get_or_404(file_id)
+    if file.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    periods = request.args.get('periods', 3, type=int)
+    model = request.args.get('model', 'auto')
+    level = request.args.get('level', DEFAULT_LEVEL, type=float)
+    if not 1 <= periods <= 60:
+        return jsonify({'error': 'periods must be between 1 and 60'}), 400
+    if not 0.5 <= level <= 0.999:
+        return jsonify({'error': 'level must be between 0.5 and 0.999'}), 400
+    if model not in MODEL_CHOICES:
+        return jsonify({'error': f"model must be one of {', '.join(MODEL_CHOICES)}"}), 400
+    
+    forecasts = file_forecasts(file, role_columns(ensure_column_roles(file)), periods, model, level)
+    columns = request.args.getlist('column')
+    if columns:
+        forecasts = {column: forecasts[column] for column in columns if column in forecasts}
+    return jsonify({'file_id': file.id, 'version': file.version, 'periods': periods, 'model': model,
+                    'level': level, 'forecasts': forecasts})
+
+@bp.route('/file/<int:file_id>/backtest', methods=['GET'])
+@login_required
+def file_backtest_scores(file_id):
+    """MAPE and MASE of every forecast model on each numeric column of a file, and the best model"""
+    file = FinancialFile.query.get_or_404(file_id)
+    if file.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    backtest = file_backtest(file, role_columns(ensure_column_roles(file)))
+    return jsonify(dict(backtest, file_id=file.id, version=file.version))
+
+@bp.route('/comparison/series', methods=['GET'])
+@login_required
+def comparison_chart_series():
+    """Downsampled series of one column in each of several files (``file_id`` repeated)"""
+    file_ids = request.args.getlist('file_id', type=int)
+    column = request.args.get('column')
+    if len(file_ids) < 2 or not column:
+        return jsonify({'error': 'Two or more file_id values and a column are required'}), 400
+    
+    files = [FinancialFile.query.get_or_404(file_id) for file_id in file_ids]
+    if any(file.user_id != current_user.id for file in files):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # Only the charted column is read, so streamed files are never loaded whole
+    profiles = [ensure_profile(file) for file in files]
+    if any(column not in profile['columns'] for profile in profiles):
+        return jsonify({'labels': [], 'datasets': []})
+    comparison = ComparisonService([read_financial_window(file, columns=[column]) for file in files], profiles)
+    return jsonify(comparison_series(comparison, column, clamp_max_points(request.args.get('max_points'))))
+
+# timeRange: (rollup granularity, days back from today or None for all,
+# labels of the period starts)
+CHART_RANGES = {
+    'month': ('week', 30, lambda starts: 'Week ' + starts.dt.isocalendar().week.astype(str)),
+    'quarter': ('month', 90, lambda starts: starts.dt.strftime('%b')),
+    'year': ('quarter', 365, lambda starts: 'Q' + starts.dt.quarter.astype(str)),
+    'all': ('year', None, lambda starts: starts.dt.year.astype(str)),
+}
+
+def _chart_values(series):
+    return [None if pd.isna(value) else float(value) for value in series]
+
 @bp.route('/charts/financial-data', methods=['GET'])
 @login_required
 def get_chart_data():
@@ -119,157 +414,55 @@ def get_chart_data():
             }
         })
     
-    # Get file path
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], latest_file.filename)
-    
     try:
-        # Read data
-        if latest_file.file_type == 'csv':
-            df = pd.read_csv(file_path)
-        else:  # excel
-            df = pd.read_excel(file_path)
-        
-        # Check if data has date column
-        date_column = None
-        for col in df.columns:
-            if 'date' in col.lower() or 'time' in col.lower():
-                try:
-                    # Confirm it can be parsed as date
-                    pd.to_datetime(df[col])
-                    date_column = col
-                    break
-                except:
-                    continue
-        
-        if date_column:
-            # Convert date column to datetime
-            df[date_column] = pd.to_datetime(df[date_column])
-            
-            # Filter data based on time range
-            now = datetime.now()
-            if time_range == 'month':
-                start_date = now - timedelta(days=30)
-                df_filtered = df[df[date_column] >= start_date]
-                # Group by week
-                df_filtered['period'] = df_filtered[date_column].dt.isocalendar().week
-                period_format = 'Week {}'
-            elif time_range == 'quarter':
-                start_date = now - timedelta(days=90)
-                df_filtered = df[df[date_column] >= start_date]
-                # Group by month
-                df_filtered['period'] = df_filtered[date_column].dt.month
-                period_format = lambda x: datetime(2000, x, 1).strftime('%b')
-            elif time_range == 'year':
-                start_date = now - timedelta(days=365)
-                df_filtered = df[df[date_column] >= start_date]
-                # Group by quarter
-                df_filtered['period'] = (df_filtered[date_column].dt.month - 1) // 3 + 1
-                period_format = 'Q{}'
-            else:  # all time
-                df_filtered = df
-                # Group by year
-                df_filtered['period'] = df_filtered[date_column].dt.year
-                period_format = '{}'
-        else:
-            # If no date column, use all data
-            df_filtered = df
-            # Create a simple index as period
-            df_filtered['period'] = range(1, len(df) + 1)
-            period_format = 'Period {}'
+        # Columns detected once at upload
+        roles = role_columns(ensure_column_roles(latest_file))
+        date_column = roles.get('date')
         
         # Identify revenue and expense columns
-        revenue_col = None
-        expense_col = None
-        
-        for col in df.columns:
-            if 'revenue' in col.lower() or 'income' in col.lower() or 'sales' in col.lower():
-                revenue_col = col
-            elif 'expense' in col.lower() or 'cost' in col.lower() or 'expenditure' in col.lower():
-                expense_col = col
+        revenue_col = roles.get('revenue')
+        expense_col = roles.get('expense') or roles.get('cost_of_goods_sold')
         
         # If columns are not found, use numerical columns
         if not revenue_col or not expense_col:
-            numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+            numeric_cols = ensure_profile(latest_file)['numeric_columns']
             if len(numeric_cols) >= 2:
                 revenue_col = numeric_cols[0]
                 expense_col = numeric_cols[1]
         
+        if date_column:
+            # Slice the rollup stored at ingest; no parsing or grouping of rows
+            granularity, days, label = CHART_RANGES.get(time_range, CHART_RANGES['all'])
+            df_filtered = load_period_rollup(latest_file, roles, granularity)
+            periods = df_filtered[date_column]
+            if days is not None:
+                freq = ROLLUP_GRANULARITIES[granularity]
+                start = pd.Timestamp(datetime.now() - timedelta(days=days)).to_period(freq).start_time
+                df_filtered = df_filtered.iloc[periods.searchsorted(start):]
+                periods = df_filtered[date_column]
+            labels = label(periods).tolist()
+        else:
+            # Read only the columns the charts use
+            chart_columns = [revenue_col, expense_col] + [roles.get(role) for role in RATIO_ROLES]
+            df_filtered = read_financial_window(latest_file,
+                                                columns=list(dict.fromkeys(col for col in chart_columns if col)))
+            # Without a date column every row is its own period
+            labels = [f'Period {i}' for i in range(1, len(df_filtered) + 1)]
+        
         # Prepare revenue vs expenses data
         revenue_expenses_data = {'labels': [], 'revenue': [], 'expenses': []}
         
-        if revenue_col and expense_col:
-            # Group by period
-            grouped_data = df_filtered.groupby('period').agg({
-                revenue_col: 'sum',
-                expense_col: 'sum'
-            }).reset_index()
-            
-            # Sort by period
-            grouped_data = grouped_data.sort_values('period')
-            
-            # Format labels based on period type
-            if callable(period_format):
-                revenue_expenses_data['labels'] = [period_format(p) for p in grouped_data['period']]
-            else:
-                revenue_expenses_data['labels'] = [period_format.format(p) for p in grouped_data['period']]
-                
-            revenue_expenses_data['revenue'] = grouped_data[revenue_col].tolist()
-            revenue_expenses_data['expenses'] = grouped_data[expense_col].tolist()
+        if revenue_col in df_filtered and expense_col in df_filtered:
+            revenue_expenses_data['labels'] = labels
+            revenue_expenses_data['revenue'] = _chart_values(df_filtered[revenue_col])
+            revenue_expenses_data['expenses'] = _chart_values(df_filtered[expense_col])
         
-        # Calculate financial ratios
+        # Current ratios over the selected time range, from the ratio registry
         ratios_data = {'labels': [], 'values': []}
-        
-        # Try to get the latest analysis
-        analysis = Analysis.query.filter_by(file_id=latest_file.id).order_by(Analysis.created_date.desc()).first()
-        
-        if analysis and 'financial_ratios' in analysis.results:
-            # Use ratios from analysis
-            ratios = analysis.results['financial_ratios']
-            for label, value in ratios.items():
-                # Format label for display
-                display_label = ' '.join(label.split('_')).title()
-                ratios_data['labels'].append(display_label)
-                ratios_data['values'].append(value)
-        else:
-            # Calculate some basic ratios from data
-            try:
-                # Find relevant columns
-                assets_col = next((col for col in df.columns if 'asset' in col.lower()), None)
-                liabilities_col = next((col for col in df.columns if 'liab' in col.lower()), None)
-                current_assets_col = next((col for col in df.columns if 'current' in col.lower() and 'asset' in col.lower()), None)
-                current_liabilities_col = next((col for col in df.columns if 'current' in col.lower() and 'liab' in col.lower()), None)
-                inventory_col = next((col for col in df.columns if 'inventory' in col.lower()), None)
-                profit_col = next((col for col in df.columns if 'profit' in col.lower() or 'net income' in col.lower()), None)
-                
-                # Calculate ratios if data is available
-                if revenue_col and profit_col:
-                    profit_margin = df_filtered[profit_col].sum() / df_filtered[revenue_col].sum()
-                    ratios_data['labels'].append('Profit Margin')
-                    ratios_data['values'].append(round(profit_margin, 2))
-                
-                if current_assets_col and current_liabilities_col:
-                    current_ratio = df_filtered[current_assets_col].iloc[-1] / df_filtered[current_liabilities_col].iloc[-1]
-                    ratios_data['labels'].append('Current Ratio')
-                    ratios_data['values'].append(round(current_ratio, 2))
-                
-                if current_assets_col and inventory_col and current_liabilities_col:
-                    quick_ratio = (df_filtered[current_assets_col].iloc[-1] - df_filtered[inventory_col].iloc[-1]) / df_filtered[current_liabilities_col].iloc[-1]
-                    ratios_data['labels'].append('Quick Ratio')
-                    ratios_data['values'].append(round(quick_ratio, 2))
-                
-                if liabilities_col and assets_col:
-                    debt_ratio = df_filtered[liabilities_col].iloc[-1] / df_filtered[assets_col].iloc[-1]
-                    ratios_data['labels'].append('Debt Ratio')
-                    ratios_data['values'].append(round(debt_ratio, 2))
-                
-                if profit_col and assets_col:
-                    roa = df_filtered[profit_col].sum() / df_filtered[assets_col].iloc[-1]
-                    ratios_data['labels'].append('Return on Assets')
-                    ratios_data['values'].append(round(roa, 2))
-            except:
-                # If calculations fail, use dummy data
-                ratios_data['labels'] = ['Current Ratio', 'Quick Ratio', 'Debt Ratio', 'Profit Margin', 'ROI']
-                ratios_data['values'] = [2.1, 1.8, 0.4, 0.2, 0.15]
+        for name, value in aggregate_ratios(df_filtered, roles).items():
+            if value is not None:
+                ratios_data['labels'].append(ratio_label(name))
+                ratios_data['values'].append(round(value, 2))
         
         return jsonify({
             'revenueExpenses': revenue_expenses_data,
@@ -307,7 +500,7 @@ def get_ai_insights():
             }), 404
         
         # Get the file path
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], latest_file.filename)
+        file_path = financial_file_path(latest_file)
         current_app.logger.info(f"Generating insights for file: {file_path}")
         
         # Check if file exists
@@ -318,12 +511,9 @@ def get_ai_insights():
                 'message': 'File not found. It may have been deleted.'
             }), 404
         
-        # Read the file
+        # Read the rows the insights prompt uses
         try:
-            if latest_file.file_type == 'csv':
-                df = pd.read_csv(file_path)
-            else:
-                df = pd.read_excel(file_path)
+            df = read_financial_window(latest_file, limit=10)
                 
             current_app.logger.info(f"Loaded data with shape: {df.shape}")
         except Exception as e:
@@ -1,6 +1,7 @@
 import importlib.util
 import json
 from flask import current_app
+from app.core.dtypes import frame_records
 import logging
 import os
 
@@ -229,7 +230,7 @@ class ClaudeClient:
             return "Claude AI integration is not available. Please check your API key configuration."
         
         # Convert dataframe to dictionary for JSON serialization
-        data_sample = dataframe.head(10).to_dict('records')
+        data_sample = frame_records(dataframe.head(10))
         prompt = f"""
         You are a financial analyst. Provide 5 key insights about this financial data.
         
@@ -4,6 +4,7 @@ import logging
 import os
 import sys
 from flask import current_app
+from app.core.dtypes import frame_records
 
 # Setup basic logging
 logging.basicConfig(level=logging.INFO)
@@ -173,7 +174,7 @@ class DeepSeekClient:
         
         try:
             # Convert dataframe to dictionary for JSON serialization
-            data_sample = dataframe.head(10).to_dict('records')
+            data_sample = frame_records(dataframe.head(10))
             
             # Prepare a more specific prompt for financial insights
             prompt = f"""
@@ -4,33 +4,12 @@ from app.chat import bp
 # Update import to use DeepSeek client instead of Claude
 from app.chat.deepseek_client import DeepSeekClient, openai_available
 from app.core.models import FinancialFile, Analysis, db
-import pandas as pd
-import numpy as np
+from app.core.loader import read_financial_window
+from app.core.schema import ensure_column_roles
+from app.core.profile import ensure_profile
 import os
-import json
 from datetime import datetime
 
-# Custom JSON encoder to handle pandas Timestamp and numpy types
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (pd.Timestamp, datetime)):
-            return obj.strftime('%Y-%m-%d %H:%M:%S')
-        elif isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif pd.isna(obj):
-            return None
-        return super().default(obj)
-
-def serialize_dataframe(df):
-    """Safely convert DataFrame to JSON-serializable dictionary"""
-    # Convert DataFrame to records and handle special data types
-    records = json.loads(json.dumps(df.head(5).to_dict('records'), cls=CustomJSONEncoder))
-    return records
-
 @bp.route('/discuss/<int:file_id>')
 @login_required
 def discuss(file_id):
@@ -41,14 +20,19 @@ def discuss(file_id):
         return redirect(url_for('core.dashboard'))
     
     # Get file metadata for display in the chat interface
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
     try:
-        # Read basic file info to show in the chat interface
-        df = pd.read_csv(file_path) if file.file_type == 'csv' else pd.read_excel(file_path)
+        # Basic file info from the stored profile; only the date column is read
+        profile = ensure_profile(file)
+        date_role = ensure_column_roles(file).get('date')
+        if date_role:
+            dates = read_financial_window(file, columns=[date_role['column']])[date_role['column']]
+            date_range = f"{dates.min()} to {dates.max()}"
+        else:
+            date_range = 'N/A'
         file_stats = {
-            'rows': len(df),
-            'columns': list(df.columns),
-            'date_range': f"{df['date'].min()} to {df['date'].max()}" if 'date' in df.columns else 'N/A'
+            'rows': profile['rows'],
+            'columns': profile['columns'],
+            'date_range': date_range
         }
     except Exception as e:
         file_stats = {'error': str(e)}
@@ -66,26 +50,24 @@ def ask():
         if file.user_id != current_user.id:
             return jsonify({'error': 'Access denied'}), 403
             
-        # Get file data
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-        df = pd.read_csv(file_path) if file.file_type == 'csv' else pd.read_excel(file_path)
+        # Statistics and sample rows were computed at upload
+        profile = ensure_profile(file)
         
         # Get latest analysis
         analysis = Analysis.query.filter_by(file_id=file_id).order_by(Analysis.created_date.desc()).first()
         
         # Prepare data summary with more detailed information
-        numeric_columns = df.select_dtypes(include=['number']).columns.tolist()
+        numeric_columns = profile['numeric_columns']
         
-        # Use custom serialization to handle special data types
         data_summary = {
             'filename': file.filename,
             'file_type': file.file_type,
             'upload_date': file.upload_date.strftime('%Y-%m-%d'),
-            'shape': df.shape,
-            'columns': df.columns.tolist(),
+            'shape': (profile['rows'], len(profile['columns'])),
+            'columns': profile['columns'],
             'numeric_columns': numeric_columns,
-            'sample_data': serialize_dataframe(df),
-            'summary_stats': json.loads(json.dumps(df[numeric_columns].describe().to_dict(), cls=CustomJSONEncoder)),
+            'sample_data': profile['sample'],
+            'summary_stats': {col: profile['stats'][col] for col in numeric_columns},
             'analysis_results': analysis.results if analysis else None
         }
         
@@ -128,9 +110,8 @@ def get_insights(file_id):
         if file.user_id != current_user.id:
             return jsonify({'error': 'Access denied'}), 403
             
-        # Load file data
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-        df = pd.read_csv(file_path) if file.file_type == 'csv' else pd.read_excel(file_path)
+        # The insights prompt only uses the first rows
+        df = read_financial_window(file, limit=10)
         
         # Get latest analysis
         analysis = Analysis.query.filter_by(file_id=file_id).order_by(Analysis.created_date.desc()).first()
@@ -3,8 +3,13 @@ from flask_login import login_required, current_user
 from app.comparison import bp
 from app.comparison.service import ComparisonService
 from app.core.models import FinancialFile
+from app.core.ingest import load_row_frame
+from app.core.profile import ensure_profile
 import pandas as pd
-import os
+
+# Correlation changes are shown as full matrices up to this many columns
+MAX_MATRIX_COLUMNS = 20
+TOP_CORRELATION_SHIFTS = 10
 
 @bp.route('/select')
 @login_required
@@ -33,33 +38,39 @@ def compare_files():
                 flash('Access denied to one or more files')
                 return redirect(url_for('comparison.select_files'))
                 
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-            df = pd.read_csv(file_path) if file.file_type == 'csv' else pd.read_excel(file_path)
+            # Streamed files are compared on their row sample; their summary
+            # statistics still come from the full profile
+            df = load_row_frame(file)
             
             dataframes.append(df)
             files.append(file)
             
         # Create comparison service
-        comparison = ComparisonService(dataframes)
+        comparison = ComparisonService(dataframes, [ensure_profile(file) for file in files])
         
         # Generate comparisons
         summary_stats = comparison.compare_summary_statistics()
         differences = comparison.calculate_differences()
         
-        # Generate charts for common numeric columns
-        charts = {}
-        for col in comparison.common_columns:
-            if pd.api.types.is_numeric_dtype(dataframes[0][col]):
-                charts[col] = comparison.generate_comparison_chart(col)
+        # Common numeric columns are charted in the browser from the
+        # comparison series API
+        chart_columns = [col for col in comparison.common_columns
+                         if pd.api.types.is_numeric_dtype(dataframes[0][col])]
                 
-        correlation_diffs = comparison.generate_correlation_comparison()
+        # Full matrices of wide files would be unreadable; they only show
+        # the pairs whose correlation moved most
+        correlation_columns, _ = comparison.correlation_stack()
+        correlation_diffs = (comparison.generate_correlation_comparison()
+                             if len(correlation_columns) <= MAX_MATRIX_COLUMNS else {})
+        correlation_shifts = comparison.top_correlation_shifts(TOP_CORRELATION_SHIFTS)
         
         return render_template('comparison/results.html',
                              files=files,
                              summary_stats=summary_stats,
                              differences=differences,
-                             charts=charts,
-                             correlation_diffs=correlation_diffs)
+                             chart_columns=chart_columns,
+                             correlation_diffs=correlation_diffs,
+                             correlation_shifts=correlation_shifts)
                              
     except Exception as e:
         flash(f'Error comparing files: {str(e)}')
@@ -1,39 +1,75 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import io
 import base64
+import warnings
+
+from app.core.downsample import lttb_indices
+from app.core.dtypes import as_float64
+from app.core.render import PNG_MAX_POINTS, render_chart
 
 class ComparisonService:
-    def __init__(self, dataframes):
-        """Initialize with list of dataframes to compare"""
+    def __init__(self, dataframes, profiles=None):
+        """Initialize with list of dataframes to compare.
+        
+        ``profiles`` are the stored statistics profiles of the same files (see
+        app.core.profile); when given, summary statistics and differences are
+        read from them instead of being recomputed.
+        """
         self.dfs = dataframes
+        self.profiles = profiles
         self.common_columns = self._get_common_columns()
+        self._correlations = None
         
     def _get_common_columns(self):
-        """Find columns that exist in all dataframes"""
+        """Find columns that exist in all dataframes, in the order of the first"""
         if not self.dfs:
             return []
         common = set(self.dfs[0].columns)
         for df in self.dfs[1:]:
             common = common.intersection(set(df.columns))
-        return list(common)
+        return [col for col in self.dfs[0].columns if col in common]
+        
+    def _is_numeric(self, col):
+        if self.profiles:
+            return col in self.profiles[0]['numeric_columns']
+        return pd.api.types.is_numeric_dtype(self.dfs[0][col])
+    
+    def _profile_stat(self, i, col, metric):
+        # Profiles store missing statistics as None; report them as NaN like pandas
+        value = self.profiles[i]['stats'][col].get(metric)
+        return np.nan if value is None else value
+    
+    def _mean(self, i, col):
+        if self.profiles:
+            return self._profile_stat(i, col, 'mean')
+        return as_float64(self.dfs[i][col]).mean()
         
     def compare_summary_statistics(self):
         """Compare basic statistics for common numeric columns"""
         results = {}
         
         for col in self.common_columns:
-            if pd.api.types.is_numeric_dtype(self.dfs[0][col]):
+            if self._is_numeric(col):
                 stats = []
-                for i, df in enumerate(self.dfs):
-                    stats.append({
-                        'mean': df[col].mean(),
-                        'median': df[col].median(),
-                        'std': df[col].std(),
-                        'min': df[col].min(),
-                        'max': df[col].max()
-                    })
+                if self.profiles:
+                    for i in range(len(self.profiles)):
+                        stats.append({
+                            'mean': self._profile_stat(i, col, 'mean'),
+                            'median': self._profile_stat(i, col, '50%'),
+                            'std': self._profile_stat(i, col, 'std'),
+                            'min': self._profile_stat(i, col, 'min'),
+                            'max': self._profile_stat(i, col, 'max')
+                        })
+                else:
+                    for df in self.dfs:
+                        values = as_float64(df[col])
+                        stats.append({
+                            'mean': values.mean(),
+                            'median': values.median(),
+                            'std': values.std(),
+                            'min': values.min(),
+                            'max': values.max()
+                        })
                 results[col] = stats
                 
         return results
@@ -45,12 +81,12 @@ class ComparisonService:
             
         differences = {}
         for col in self.common_columns:
-            if pd.api.types.is_numeric_dtype(self.dfs[0][col]):
-                base_mean = self.dfs[0][col].mean()
+            if self._is_numeric(col):
+                base_mean = self._mean(0, col)
                 if base_mean != 0:
                     diffs = []
-                    for df in self.dfs[1:]:
-                        curr_mean = df[col].mean()
+                    for i in range(1, len(self.dfs)):
+                        curr_mean = self._mean(i, col)
                         pct_diff = ((curr_mean - base_mean) / base_mean) * 100
                         diffs.append(pct_diff)
                     differences[col] = diffs
@@ -58,52 +94,127 @@ class ComparisonService:
         return differences
         
     def generate_comparison_chart(self, column):
-        """Generate a comparative visualization for a specific column"""
+        """Generate a comparative visualization for a specific column as a data URI"""
+        payload = self.comparison_data(column, PNG_MAX_POINTS)
+        if payload is None:
+            return None
+        png = render_chart('comparison', payload)
+        return 'data:image/png;base64,' + base64.b64encode(png).decode('utf-8')
+    
+    def comparison_data(self, column, max_points=None):
+        """Data of the comparison chart of a column, for ``app.core.render``.
+        
+        ``positions`` holds the row position of every value in ``series``;
+        with ``max_points`` each dataset is downsampled with LTTB.
+        """
         if column not in self.common_columns:
             return None
-            
-        plt.figure(figsize=(10, 6))
         
-        for i, df in enumerate(self.dfs):
-            if pd.api.types.is_numeric_dtype(df[column]):
-                plt.plot(range(len(df)), df[column], label=f'Dataset {i+1}')
-                
-        plt.title(f'Comparison of {column}')
-        plt.xlabel('Data Points')
-        plt.ylabel(column)
-        plt.legend()
-        plt.grid(True)
+        series, positions = [], []
+        for df in self.dfs:
+            # Non-numeric datasets are left out of the chart
+            if not pd.api.types.is_numeric_dtype(df[column]):
+                series.append(None)
+                positions.append(None)
+                continue
+            values = df[column].to_numpy(dtype='float64', na_value=np.nan)
+            index = np.arange(len(values))
+            if max_points is not None and len(values) > max_points:
+                index = lttb_indices(index, values, max_points)
+            series.append(values[index])
+            positions.append(index)
+        return {'column': str(column), 'series': series, 'positions': positions}
         
-        # Convert plot to base64 string
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        img_str = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close()
+    def correlation_stack(self):
+        """Correlation matrices of every dataset as one ``(datasets, k, k)`` array.
         
-        return f'data:image/png;base64,{img_str}'
+        Covers the ``k`` numeric columns common to all datasets, in the
+        order of the first one, which are returned alongside. Like
+        ``DataFrame.corr`` each pair of columns uses the rows where both are
+        present, and pairs with fewer than two such rows or no variance are
+        NaN. The datasets are padded with missing rows to one length so the
+        pairwise sums of all of them are batched matrix products. The result
+        is kept on the service.
+        """
+        if self._correlations is None:
+            self._correlations = self._correlation_stack()
+        return self._correlations
+    
+    def _correlation_stack(self):
+        numeric = [set(df.select_dtypes(include=[np.number]).columns) for df in self.dfs]
+        columns = [col for col in self.common_columns if all(col in cols for cols in numeric)]
+        if not columns or not self.dfs:
+            return columns, np.empty((len(self.dfs), len(columns), len(columns)))
         
+        length = max(len(df) for df in self.dfs)
+        values = np.full((len(self.dfs), length, len(columns)), np.nan)
+        for i, df in enumerate(self.dfs):
+            values[i, :len(df)] = df[columns].to_numpy(dtype='float64', na_value=np.nan)
+        present = ~np.isnan(values)
+        with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            # Centring on the column means keeps the sums of products small
+            centred = np.where(present, values - np.nanmean(values, axis=1, keepdims=True), 0.0)
+            centred_t = np.ascontiguousarray(centred.transpose(0, 2, 1))
+            products = centred_t @ centred
+            if present.all():
+                # Complete data: every pair uses every row and the centred sums are zero
+                count = np.full(products.shape, float(length))
+                scale = np.sqrt(np.diagonal(products, axis1=1, axis2=2))
+                corr = products / (scale[:, :, None] * scale[:, None, :])
+            else:
+                mask = present.astype('float64')
+                count = np.ascontiguousarray(mask.transpose(0, 2, 1)) @ mask
+                # sums[d, a, b]: sum of column a over the rows where b is present
+                sums = centred_t @ mask
+                squares = (centred_t * centred_t) @ mask
+                covariance = count * products - sums * sums.transpose(0, 2, 1)
+                variance = count * squares - sums ** 2
+                corr = covariance / np.sqrt(variance * variance.transpose(0, 2, 1))
+        corr[(count < 2) | ~np.isfinite(corr)] = np.nan
+        return columns, np.clip(corr, -1.0, 1.0)
+    
+    def correlation_differences(self):
+        """Change of every correlation from the first dataset, as ``(columns, (datasets - 1, k, k))``"""
+        columns, corr = self.correlation_stack()
+        return columns, corr[1:] - corr[:1]
+    
     def generate_correlation_comparison(self):
         """Compare correlation matrices between datasets"""
-        correlation_diffs = {}
-        
         if len(self.dfs) < 2:
             return {}
-            
-        base_corr = self.dfs[0].select_dtypes(include=[np.number]).corr()
+        columns, diffs = self.correlation_differences()
+        if not columns:
+            return {}
+        return {
+            f'dataset_{i+2}_vs_1': {col: dict(zip(columns, diff[:, j].tolist())) for j, col in enumerate(columns)}
+            for i, diff in enumerate(diffs)
+        }
+    
+    def top_correlation_shifts(self, top_k=10):
+        """The ``top_k`` pairs of columns whose correlation moved most from the first dataset.
         
-        for i, df in enumerate(self.dfs[1:], 1):
-            curr_corr = df.select_dtypes(include=[np.number]).corr()
-            common_cols = set(base_corr.columns) & set(curr_corr.columns)
-            
-            if common_cols:
-                diff_matrix = pd.DataFrame(index=common_cols, columns=common_cols)
-                for col1 in common_cols:
-                    for col2 in common_cols:
-                        base_val = base_corr.loc[col1, col2]
-                        curr_val = curr_corr.loc[col1, col2]
-                        diff_matrix.loc[col1, col2] = curr_val - base_val
-                        
-                correlation_diffs[f'dataset_{i+1}_vs_1'] = diff_matrix.to_dict()
-                
-        return correlation_diffs
+        Returns ``{'dataset_N_vs_1': [{'columns', 'base', 'current',
+        'change'}]}`` ordered by the size of the change, largest first.
+        """
+        if len(self.dfs) < 2:
+            return {}
+        columns, corr = self.correlation_stack()
+        if len(columns) < 2:
+            return {}
+        rows, cols = np.triu_indices(len(columns), k=1)
+        base = corr[0, rows, cols]
+        shifts = {}
+        for i in range(1, len(corr)):
+            current = corr[i, rows, cols]
+            change = np.abs(current - base)
+            valid = np.flatnonzero(np.isfinite(change))
+            if len(valid) > top_k:
+                valid = valid[np.argpartition(-change[valid], top_k - 1)[:top_k]]
+            order = valid[np.argsort(-change[valid], kind='stable')]
+            shifts[f'dataset_{i+1}_vs_1'] = [
+                {'columns': [columns[rows[p]], columns[cols[p]]], 'base': float(base[p]),
+                 'current': float(current[p]), 'change': float(current[p] - base[p])}
+                for p in order
+            ]
+        return shifts
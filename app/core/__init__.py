@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('core', __name__)
 
-from app.core import routes
+from app.core import routes, commands
@@ -0,0 +1,160 @@
+"""Appending new rows to an existing financial file.
+
+Adding a month of data should not mean re-uploading and re-profiling the
+whole history. ``append_rows`` resumes the accumulators saved at ingestion
+(see ``app.core.ingest``) with the new rows only, so the profile statistics,
+the running column totals and the period rollups are updated with running
+sums and Chan's online variance update instead of being recomputed from row
+zero. Aggregate ratios and trends are read from those totals, and the ratio
+series of streamed files from the rollups. The per-row ratio series of other
+files has one value per row and is evaluated from the mapped role columns
+of the new version.
+
+Only CSV files can be appended to: a sheet of a workbook is one dataset of
+a shared upload and stays an Excel file.
+
+Blobs are immutable: an append writes a new content-addressed blob (the old
+bytes followed by the new rows) and a columnar copy extended with the new
+rows, moves the file onto it and increments ``FinancialFile.version``.
+Results cached for the previous version stay with the previous blob, and
+analyses of the new version are computed against the new blob.
+"""
+import hashlib
+import os
+import tempfile
+
+import pandas as pd
+from flask import current_app
+
+from app import db
+from app.core import columnar
+from app.core.dtypes import compact_frame
+from app.core.ingest import (build_ingest_state, is_streamed, load_ingest_state, save_ingest_state,
+                             _read_chunks)
+from app.core.loader import columnar_file_path, financial_file_path, load_financial_frame
+from app.core.models import ForecastModel
+from app.core.profile import ensure_profile
+from app.core.storage import HASH_CHUNK_SIZE, place_blob
+
+
+class AppendError(Exception):
+    """An append that does not fit the file it targets"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _ingest_state(file):
+    """Saved accumulators of a file, built with one pass over it if missing"""
+    state = load_ingest_state(file)
+    if state is not None:
+        return state
+    if is_streamed(file):
+        return build_ingest_state(file, _read_chunks(file))
+    frame = load_financial_frame(file)
+    size = current_app.config['INGEST_CHUNK_ROWS']
+    return build_ingest_state(file, (frame.iloc[start:start + size] for start in range(0, len(frame), size)))
+
+
+def _match_dtypes(rows, dtypes):
+    """Convert new rows to the dtypes the file was profiled with where they differ"""
+    rows = rows.copy(deep=False)
+    for col, dtype in dtypes.items():
+        if rows[col].dtype == dtype:
+            continue
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            rows[col] = pd.to_datetime(rows[col], errors='coerce', format='mixed')
+        elif isinstance(dtype, pd.CategoricalDtype):
+            rows[col] = rows[col].astype('category')
+    return rows
+
+
+def _write_appended_blob(file, rows):
+    """Store the file's bytes followed by ``rows`` as a new CSV blob.
+
+    Returns ``(content_hash, relpath)``.
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=current_app.config['UPLOAD_FOLDER'], suffix='.upload')
+
+    def write(out, data):
+        digest.update(data)
+        out.write(data)
+
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            last = b'\n'
+            with open(financial_file_path(file), 'rb') as source:
+                for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+                    write(out, chunk)
+                    last = chunk[-1:]
+            if last != b'\n':
+                write(out, b'\n')
+            write(out, rows.to_csv(header=False, index=False).encode('utf-8'))
+        content_hash = digest.hexdigest()
+        return content_hash, place_blob(tmp_path, content_hash, 'csv')
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _extend_columnar_copy(file, old_path, rows):
+    """Write the columnar copy of the new version; the old copy is left untouched"""
+    name = columnar.columnar_filename_for(file.storage_path)
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], name)
+    if old_path is None:
+        return None
+    if columnar.append_columnar_copy(old_path, rows, path):
+        return name
+    # The new rows do not fit the old schema; write the whole frame once
+    old, _ = columnar.read_columnar_copy(old_path)
+    df, _ = compact_frame(pd.concat([old, rows], ignore_index=True))
+    return name if columnar.write_columnar_copy(df, path) else None
+
+
+def append_rows(file, rows, expected_version=None):
+    """Append the rows of a DataFrame to a file and update its profile.
+
+    ``rows`` must have the file's columns, in any order. With
+    ``expected_version`` the append only happens if the file is still at
+    that version, otherwise a 409 is raised. Returns the number of rows
+    appended; the file is committed at its new version.
+    """
+    if expected_version is not None and expected_version != file.version:
+        raise AppendError(f'File is at version {file.version}', 409)
+    if not file.storage_path:
+        raise AppendError('Files uploaded before content addressing cannot be appended to')
+    if file.file_type != 'csv':
+        raise AppendError('Only CSV files can be appended to')
+
+    columns = ensure_profile(file)['columns']
+    if sorted(map(str, rows.columns)) != sorted(columns):
+        raise AppendError(f"Appended rows must have the columns {', '.join(columns)}")
+    if rows.empty:
+        raise AppendError('No rows to append')
+    rows = rows[columns]
+
+    streamed = is_streamed(file)
+    profile, rollup = _ingest_state(file)
+    typed_rows = _match_dtypes(rows, profile.dtypes)
+    old_columnar = columnar_file_path(file)
+
+    file.content_hash, file.storage_path = _write_appended_blob(file, rows)
+    file.columnar_filename = _extend_columnar_copy(file, old_columnar, typed_rows)
+
+    profile.update(typed_rows)
+    if rollup is not None:
+        rollup.update(typed_rows)
+    save_ingest_state(file, profile, rollup)
+
+    result = profile.result()
+    if streamed:
+        result['ingest'].update(mode='streaming', rollup=rollup.spec if rollup is not None else None)
+    file.profile = result
+    # Forecast models fitted to the old version no longer describe the data
+    ForecastModel.query.filter_by(file_id=file.id).delete()
+    file.version += 1
+    db.session.commit()
+    return len(rows)
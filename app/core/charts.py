@@ -0,0 +1,99 @@
+"""Rendered charts stored as content-addressed PNG files.
+
+A chart is identified by the data it is drawn from and by its spec (chart
+type, columns, role map and drawing style). ``cached_charts`` hashes both
+into a key, draws only the charts whose ``UPLOAD_FOLDER/charts/<k[:2]>/<k>.png``
+does not exist yet, on the process pool of ``app.core.render``, and returns
+the keys. Pages link to ``chart_url(key)``, which is served with the key as
+ETag and a long-lived Cache-Control since the bytes behind a key never
+change; PDF exports read the same files.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from flask import current_app, url_for
+
+from app.core.loader import financial_file_path
+from app.core.render import get_chart_renderer
+from app.core.storage import sheet_suffix
+
+CHART_FOLDER = 'charts'
+CHART_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Bump when the drawing code changes so old renders are not reused
+CHART_STYLE_VERSION = 3
+
+
+def dataset_key(file):
+    """Identify the data of a file: its content hash, or its id and mtime for older uploads"""
+    if file.content_hash:
+        return file.content_hash + sheet_suffix(file.sheet_name)
+    return f'file-{file.id}-{os.stat(financial_file_path(file)).st_mtime_ns}'
+
+
+def chart_key(files, spec):
+    """Key of a chart drawn from ``files`` according to ``spec``"""
+    encoded = json.dumps({
+        'data': [dataset_key(file) for file in files],
+        'spec': spec,
+        'style': CHART_STYLE_VERSION,
+    }, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def chart_path(key):
+    """Path of the PNG file of a chart key"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], CHART_FOLDER, key[:2], f'{key}.png')
+
+
+def _store_chart(path, png):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def cached_charts(charts):
+    """Return the keys of ``[(files, spec, payload)]`` charts, drawing the missing ones.
+
+    ``spec['kind']`` names the renderer (see ``app.core.render``) and
+    ``payload()`` returns the data it draws, or None when there is nothing
+    to draw, in which case the key is None. Payloads are only built for
+    charts not stored yet, and those are drawn as one batch on the chart
+    renderer's process pool.
+    """
+    keys = []
+    missing = []
+    for files, spec, payload in charts:
+        key = chart_key(files, spec)
+        if not os.path.exists(chart_path(key)):
+            data = payload()
+            if data is None:
+                key = None
+            else:
+                missing.append((key, spec['kind'], data))
+        keys.append(key)
+
+    pngs = get_chart_renderer().render_many([(kind, data) for _, kind, data in missing])
+    for (key, _, _), png in zip(missing, pngs):
+        _store_chart(chart_path(key), png)
+    return keys
+
+
+def chart_url(key):
+    """URL a page links to for a chart key"""
+    return url_for('core.chart_image', key=key) if key else None
+
+
+def chart_file_url(key):
+    """file:// URL of a chart, for PDF rendering without another HTTP request"""
+    return 'file://' + os.path.abspath(chart_path(key)) if key else None
@@ -0,0 +1,188 @@
+"""Typed columnar copies of uploaded files.
+
+At upload time the raw CSV/Excel file is parsed once and written next to the
+original as an uncompressed Arrow IPC (Feather v2) file. Later reads
+memory-map that file instead of re-parsing text or XLSX XML, so gunicorn
+workers share the same page-cache pages for the column data.
+"""
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    pyarrow_available = True
+except ImportError:
+    pyarrow_available = False
+    logger.warning("pyarrow is not installed. Uploads will be read from the original files.")
+
+COLUMNAR_SUFFIX = '.arrow'
+
+
+def columnar_filename_for(filename):
+    """Name of the columnar copy stored next to an upload"""
+    return filename + COLUMNAR_SUFFIX
+
+
+def write_columnar_copy(df, path):
+    """Write a DataFrame as an uncompressed Arrow IPC file.
+
+    Returns True on success. Frames that Arrow cannot represent (for example
+    object columns mixing numbers and text) are skipped, and the caller keeps
+    reading the original file.
+    """
+    if not pyarrow_available:
+        return False
+    tmp_path = path + '.tmp'
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # A single record batch keeps every column contiguous, which is what
+        # allows zero-copy conversion back to pandas when the file is mapped
+        feather.write_feather(table, tmp_path, compression='uncompressed',
+                              chunksize=max(len(df), 1))
+        os.replace(tmp_path, path)
+        return True
+    except (pa.ArrowException, TypeError, ValueError) as e:
+        logger.warning(f"Could not write columnar copy {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+class ColumnarWriter:
+    """Write an Arrow IPC file one DataFrame chunk at a time.
+
+    The schema is fixed by the first chunk. If a later chunk cannot be cast
+    to it (for example an integer column that gains nulls), the copy is
+    abandoned and ``close`` returns False.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.failed = not pyarrow_available
+        self._tmp_path = path + '.tmp'
+        self._writer = None
+        self._schema = None
+
+    def write(self, df):
+        if self.failed:
+            return
+        try:
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                self._writer = pa.ipc.new_file(self._tmp_path, self._schema)
+            self._writer.write_table(table)
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            logger.warning(f"Abandoning columnar copy {self.path}: {e}")
+            self._abort()
+
+    def close(self):
+        """Finish the file and move it into place; returns True on success"""
+        if self.failed or self._writer is None:
+            self._abort()
+            return False
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+        return True
+
+    def _abort(self):
+        self.failed = True
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def append_columnar_copy(path, df, target):
+    """Write the rows of the Arrow IPC copy at ``path`` followed by ``df`` to ``target``.
+
+    ``df`` is cast to the schema of the existing copy, so only the new rows
+    are converted. Returns False when they cannot be cast (for example an
+    integer column that needs a wider type, or a float32 column given a
+    value float32 cannot hold exactly); the caller then rebuilds the copy
+    from the whole frame.
+    """
+    if not pyarrow_available:
+        return False
+    tmp_path = target + '.tmp'
+    try:
+        _, table = _open_mapped_table(path)
+        if not _floats_fit(df, table.schema):
+            logger.info(f"New rows need wider float columns than {path}")
+            return False
+        new = pa.Table.from_pandas(df, schema=table.schema, preserve_index=False)
+        combined = pa.concat_tables([table, new]).combine_chunks()
+        with pa.ipc.new_file(tmp_path, combined.schema) as writer:
+            writer.write_table(combined, max_chunksize=max(combined.num_rows, 1))
+        os.replace(tmp_path, target)
+        return True
+    except (pa.ArrowException, TypeError, ValueError) as e:
+        logger.info(f"Could not append to columnar copy {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def _floats_fit(df, schema):
+    """Whether the values of ``df`` survive the narrowing float casts to ``schema``.
+
+    Arrow casts float64 to float32 without checking for lost precision.
+    """
+    for field in schema:
+        if not pa.types.is_floating(field.type) or field.name not in df.columns:
+            continue
+        values = pd.to_numeric(df[field.name], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        narrowed = values.astype(field.type.to_pandas_dtype())
+        if not np.array_equal(narrowed, values, equal_nan=True):
+            return False
+    return True
+
+
+def _open_mapped_table(path):
+    """Memory-map an Arrow IPC file and return the mapping and its table"""
+    source = pa.memory_map(path, 'r')
+    return source, pa.ipc.open_file(source).read_all()
+
+
+def read_columnar_window(path, columns=None, offset=0, limit=None):
+    """Convert only some columns and a row window of an Arrow IPC copy.
+
+    Selecting and slicing a mapped table is zero-copy, so only the requested
+    cells are ever read from disk and converted to pandas.
+    """
+    _, table = _open_mapped_table(path)
+    if columns is not None:
+        table = table.select(list(columns))
+    if offset or limit is not None:
+        table = table.slice(offset, limit)
+    return table.to_pandas(split_blocks=True)
+
+
+def read_columnar_copy(path):
+    """Memory-map an Arrow IPC copy and convert it to a DataFrame.
+
+    Numeric and datetime columns without nulls become read-only numpy views
+    of the mapped file rather than private copies. Returns the frame and the
+    number of column bytes backed by the mapping, i.e. the resident memory
+    each worker saves compared to parsing the file itself.
+    """
+    source, table = _open_mapped_table(path)
+    size = source.size()
+    source.seek(0)
+    start = source.read_buffer(size).address if size else 0
+    df = table.to_pandas(split_blocks=True)
+
+    mapped_bytes = 0
+    for _, column in df.items():
+        values = column.values
+        interface = getattr(values, '__array_interface__', None)
+        if interface and start <= interface['data'][0] < start + size:
+            mapped_bytes += values.nbytes
+    return df, mapped_bytes
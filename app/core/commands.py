@@ -0,0 +1,35 @@
+import click
+from flask import current_app
+from app import db
+from app.core import bp
+from app.core.models import FinancialFile
+from app.core.loader import build_columnar_copy, columnar_file_path
+
+@bp.cli.command('backfill-columnar')
+@click.option('--force', is_flag=True, help='Rebuild copies that already exist.')
+def backfill_columnar(force):
+    """Write columnar copies for files uploaded before they existed.
+    
+    Copies are written with compact dtypes; use --force to rebuild older ones.
+    """
+    built = skipped = failed = 0
+    
+    for file in FinancialFile.query.order_by(FinancialFile.id).all():
+        if not force and columnar_file_path(file):
+            skipped += 1
+            continue
+        try:
+            _, memory = build_columnar_copy(file)
+        except Exception as e:
+            current_app.logger.error(f"Could not read file {file.id} ({file.filename}): {str(e)}")
+            failed += 1
+            continue
+        if file.profile:
+            file.profile = dict(file.profile, memory=memory)
+        if file.columnar_filename:
+            built += 1
+        else:
+            failed += 1
+    
+    db.session.commit()
+    click.echo(f'Columnar copies built: {built}, already present: {skipped}, failed: {failed}')
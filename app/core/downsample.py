@@ -0,0 +1,62 @@
+"""Downsampling of long series for charts.
+
+A chart a thousand pixels wide cannot show a million points, yet drawing
+or shipping them costs time proportional to the rows. Largest-Triangle-
+Three-Buckets (Steinarsson, 2013) keeps a fixed number of points that
+preserve the visual shape of a line: the series is cut into equal buckets
+and from each bucket the point forming the largest triangle with the point
+kept from the previous bucket and the average of the next bucket is kept,
+so peaks and troughs survive where evenly spaced picks would skip them.
+"""
+import numpy as np
+
+
+def lttb_indices(x, y, max_points):
+    """Positions of at most ``max_points`` points of ``(x, y)`` chosen by LTTB.
+
+    ``x`` is normally increasing, such as dates or row positions. Points
+    where ``x`` or ``y`` is not finite are never chosen; when no more than
+    ``max_points`` points are finite they are all returned. The first and
+    last finite points are always kept.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    n = len(valid)
+    if n <= max_points:
+        return valid
+    if max_points < 3:
+        return valid[[0, n - 1][:max(max_points, 0)]]
+
+    xs, ys = x[valid], y[valid]
+    # max_points - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, max_points - 1).astype('int64')
+    selected = np.empty(max_points, dtype='int64')
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = xs[stop:edges[i + 2]].mean()
+            next_y = ys[stop:edges[i + 2]].mean()
+        else:
+            next_x, next_y = xs[-1], ys[-1]
+        # Twice the triangle area, which has the same argmax
+        area = np.abs((xs[a] - next_x) * (ys[start:stop] - ys[a])
+                      - (xs[a] - xs[start:stop]) * (next_y - ys[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return valid[selected]
+
+
+def downsample_indices(x, ys, max_points):
+    """Positions to keep so that every series in ``ys`` keeps its LTTB points over ``x``.
+
+    Series plotted on shared labels keep the union of their own picks, so
+    each one keeps its shape; with several series the result can exceed
+    ``max_points``.
+    """
+    n = len(x)
+    if n <= max_points or not ys:
+        return np.arange(n)
+    return np.unique(np.concatenate([lttb_indices(x, y, max_points) for y in ys]))
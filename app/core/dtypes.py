@@ -0,0 +1,130 @@
+"""Compact dtypes for loaded financial frames.
+
+CSV and Excel parsing yields int64/float64 numbers and object text. Before a
+frame is cached or written to its columnar copy, ``compact_frame``:
+
+- downcasts integers to the smallest type holding their range, and floats
+  to float32 when every value survives the round trip;
+- parses text columns whose values are all dates into datetime64, once;
+- turns text columns with few distinct values (account names, segments,
+  currencies) into categoricals.
+
+Every conversion is lossless, but arithmetic on the compacted columns is not:
+float32 sums lose cents once totals pass 2**24 and small integer types
+overflow. Sums, means and other aggregations of loaded columns must be done
+in float64, either on ``as_float64`` copies (rollups, comparisons, trends) or
+on arrays read with ``to_numpy(dtype='float64')`` (profiles, ratios).
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+# Share of sampled values that must parse as dates for a text column
+DATE_PARSE_THRESHOLD = 0.9
+
+# Text columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+
+def frame_memory(df):
+    """Bytes held by a DataFrame, including Python string objects"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def looks_like_dates(series, sample_size=50):
+    """Check whether a text column holds dates by parsing a small sample"""
+    sample = series.dropna().head(sample_size)
+    if sample.empty:
+        return False
+    parsed = pd.to_datetime(sample.astype(str), errors='coerce', format='mixed')
+    return parsed.notna().mean() >= DATE_PARSE_THRESHOLD
+
+
+def _downcast_float(series):
+    values = series.to_numpy()
+    compact = values.astype('float32')
+    if np.array_equal(compact.astype(values.dtype), values, equal_nan=True):
+        return pd.Series(compact, index=series.index, name=series.name)
+    return series
+
+
+def _parse_dates(series):
+    """Parse a text column as dates if every value is one, else return None"""
+    non_null = series.dropna()
+    if non_null.empty or not looks_like_dates(series):
+        return None
+    # Bare month or weekday names would silently get the current year
+    if not non_null.astype(str).str.contains(r'\d').all():
+        return None
+    parsed = pd.to_datetime(series, errors='coerce', format='mixed')
+    if not pd.api.types.is_datetime64_dtype(parsed) or parsed.count() != len(non_null):
+        return None
+    return parsed
+
+
+def _categorize(series):
+    count = series.count()
+    if count and series.nunique() <= CATEGORY_MAX_RATIO * count:
+        return series.astype('category')
+    return series
+
+
+def compact_frame(df):
+    """Return a compacted copy of ``df`` and a report of the memory saved.
+
+    The report is ``{'before_bytes', 'after_bytes', 'saved_bytes',
+    'columns': {column: {'from': dtype, 'to': dtype}}}``.
+    """
+    before = frame_memory(df)
+    compacted = df.copy(deep=False)
+    changes = {}
+
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            new = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            new = _downcast_float(series)
+        elif pd.api.types.is_object_dtype(series):
+            new = _parse_dates(series)
+            if new is None:
+                new = _categorize(series)
+        else:
+            continue
+        if new.dtype != series.dtype:
+            compacted[col] = new
+            changes[str(col)] = {'from': str(series.dtype), 'to': str(new.dtype)}
+
+    after = frame_memory(compacted)
+    return compacted, {
+        'before_bytes': before,
+        'after_bytes': after,
+        'saved_bytes': before - after,
+        'columns': changes,
+    }
+
+
+def as_float64(data):
+    """Cast a numeric Series, or the numeric columns of a DataFrame, to float64"""
+    if isinstance(data, pd.Series):
+        return data.astype('float64')
+    numeric = data.select_dtypes(include=['number']).columns
+    return data.astype({col: 'float64' for col in numeric})
+
+
+def frame_records(df):
+    """Convert a frame to JSON-safe records.
+
+    Missing values become None, dates become ISO strings (without a time part
+    when they have none) and numpy scalars become Python numbers.
+    """
+    out = df.copy(deep=False)
+    for col in out.columns:
+        series = out[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            dates_only = (series.dropna() == series.dropna().dt.normalize()).all()
+            out[col] = series.dt.strftime('%Y-%m-%d' if dates_only else '%Y-%m-%dT%H:%M:%S')
+    return json.loads(out.to_json(orient='records', double_precision=15))
@@ -0,0 +1,574 @@
+"""Streaming ingestion of CSV uploads larger than memory.
+
+Large CSV files are read ``INGEST_CHUNK_ROWS`` rows at a time. Each chunk
+updates a ``ProfileAccumulator`` (moments, null counts, distinct sketches and
+a uniform row sample), is folded into monthly rollups and appended to the
+columnar copy, and is then dropped. Peak memory depends on the chunk size,
+the sample size and the number of months, not on the size of the file.
+
+Analysis of a streamed file runs on its monthly rollup and row sample (see
+``load_stream_frames``) instead of on the full frame. Every file with a
+date column also keeps weekly, monthly, quarterly and yearly rollups as
+columnar tables, which dashboard charts slice instead of grouping rows
+(see ``load_period_rollup``).
+"""
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+
+from app import db
+from app.core import columnar
+from app.core.dtypes import as_float64
+from app.core.loader import build_columnar_copy, financial_file_path, load_financial_frame
+from app.core.models import FinancialFile
+from app.core.profile import (QUANTILE_KEYS, SAMPLE_ROWS, TOTAL_METRICS, build_profile, column_totals,
+                              distinct_sketch, merge_distinct_sketches, sketch_estimate, _to_json_number)
+from app.core.sheets import record_sheets
+from app.core.schema import STOCK_ROLES, infer_column_roles, resolve_column_roles, role_columns
+from app.core.storage import artifact_path
+
+# Rows kept in the uniform sample used for quartiles and correlations
+ROW_SAMPLE_SIZE = 10000
+ROLLUP_FREQ = 'M'
+WEEKLY_FREQ = 'W'
+# Granularity: period frequency. Quarters and years are regrouped from the
+# monthly totals; weeks do not nest in months and are folded separately
+ROLLUP_GRANULARITIES = {'week': WEEKLY_FREQ, 'month': ROLLUP_FREQ, 'quarter': 'Q', 'year': 'Y'}
+SAMPLE_FILENAME = 'sample.arrow'
+PERIOD_ROLLUP_FILENAME = 'rollup-{}.arrow'
+ROLLUP_FILENAME = PERIOD_ROLLUP_FILENAME.format('month')
+STATE_FILENAME = 'ingest-state.json'
+SKETCHES_FILENAME = 'sketches.npz'
+
+
+def _merge_dtype(previous, current):
+    """Dtype of a column whose chunks had dtypes ``previous`` and ``current``"""
+    # Categoricals built from different chunks differ in their categories
+    if previous is None or previous == current or str(previous) == str(current):
+        return current
+    if pd.api.types.is_numeric_dtype(previous) and pd.api.types.is_numeric_dtype(current):
+        return np.result_type(previous, current)
+    return np.dtype('object')
+
+
+class ProfileAccumulator:
+    """Build a statistics profile (see ``app.core.profile``) chunk by chunk.
+
+    Counts, null counts, extremes, means, standard deviations and the running
+    totals are exact; moments of each chunk are combined with Chan's parallel
+    variance update.
+    Distinct counts use the same KMV sketch as ``build_profile``. Quartiles
+    come from a uniform reservoir sample of rows and are exact while the file
+    has no more rows than the sample.
+    """
+
+    def __init__(self, sample_size=ROW_SAMPLE_SIZE, seed=0):
+        self.sample_size = sample_size
+        self.rows = 0
+        self.chunks = 0
+        self.columns = None
+        self.head_records = None
+        self.sample = None
+        self.dtypes = {}
+        # column -> [count, mean, m2, min, max] for columns numeric in every chunk
+        self.moments = {}
+        # column -> [sum, first, last, latest], see ``app.core.profile.TOTAL_METRICS``
+        self.totals = {}
+        self.null_counts = {}
+        self.sketches = {}
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self.head_records = json.loads(chunk.head(SAMPLE_ROWS).to_json(orient='records', date_format='iso'))
+            self.sample = chunk.iloc[:0]
+            self.moments = {col: [0, 0.0, 0.0, np.inf, -np.inf]
+                            for col in chunk.select_dtypes(include=['number']).columns}
+            self.totals = {col: [0.0, np.nan, np.nan, np.nan] for col in self.moments}
+
+        numeric_now = set(chunk.select_dtypes(include=['number']).columns)
+        for col in self.columns:
+            series = chunk[col]
+            self.dtypes[col] = _merge_dtype(self.dtypes.get(col), series.dtype)
+            self.null_counts[col] = self.null_counts.get(col, 0) + int(series.isna().sum())
+            if col in self.moments and col not in numeric_now:
+                # Text showed up in a column that looked numeric so far
+                del self.moments[col]
+                del self.totals[col]
+
+            if col in self.moments:
+                values = series.to_numpy(dtype='float64', na_value=np.nan)
+                self._update_totals(col, values)
+                values = values[~np.isnan(values)]
+                self._update_moments(col, values)
+            else:
+                values = series.dropna().to_numpy()
+            sketch = distinct_sketch(values)
+            previous = self.sketches.get(col)
+            self.sketches[col] = sketch if previous is None else merge_distinct_sketches(previous, sketch)
+
+        self._update_sample(chunk)
+        self.rows += len(chunk)
+        self.chunks += 1
+
+    def _update_moments(self, col, values):
+        if not len(values):
+            return
+        count, mean, m2, low, high = self.moments[col]
+        chunk_count = len(values)
+        chunk_mean = values.mean()
+        chunk_m2 = ((values - chunk_mean) ** 2).sum()
+        total = count + chunk_count
+        delta = chunk_mean - mean
+        self.moments[col] = [
+            total,
+            mean + delta * chunk_count / total,
+            m2 + chunk_m2 + delta ** 2 * count * chunk_count / total,
+            min(low, values.min()),
+            max(high, values.max()),
+        ]
+
+    def _update_totals(self, col, values):
+        if not len(values):
+            return
+        total, first, _, latest = self.totals[col]
+        chunk_total, chunk_first, chunk_last, chunk_latest = column_totals(values[:, None])
+        self.totals[col] = [
+            total + chunk_total[0],
+            chunk_first[0] if self.rows == 0 else first,
+            chunk_last[0],
+            latest if np.isnan(chunk_latest[0]) else chunk_latest[0],
+        ]
+
+    def _update_sample(self, chunk):
+        """Reservoir sampling (algorithm R), vectorized over a chunk"""
+        fill = max(0, min(len(chunk), self.sample_size - self.rows))
+        if fill:
+            self.sample = pd.concat([self.sample, chunk.iloc[:fill]], ignore_index=True)
+        rest = chunk.iloc[fill:]
+        if rest.empty:
+            return
+
+        # Row i (0-based, over the whole file) replaces slot j ~ U[0, i] if j < size
+        positions = np.arange(self.rows + fill, self.rows + len(chunk))
+        slots = self._rng.integers(0, positions + 1)
+        keep = slots < self.sample_size
+        rows, slots = rest[keep], slots[keep]
+        if rows.empty:
+            return
+        # When a slot is drawn twice the later row wins, as in the sequential algorithm
+        _, last = np.unique(slots[::-1], return_index=True)
+        chosen = len(slots) - 1 - last
+        order = np.arange(len(self.sample))
+        order[slots[chosen]] = len(self.sample) + np.arange(len(chosen))
+        combined = pd.concat([self.sample, rows.iloc[chosen]], ignore_index=True)
+        self.sample = combined.iloc[order].reset_index(drop=True)
+
+    def result(self):
+        """Return the profile in the format produced by ``build_profile``"""
+        numeric_columns = [col for col in self.columns if col in self.moments]
+        stats = {}
+
+        if numeric_columns:
+            values = self.sample[numeric_columns].to_numpy(dtype='float64', na_value=np.nan)
+            with warnings.catch_warnings():
+                # All-null columns legitimately produce NaN statistics
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                quantiles = np.nanpercentile(values, [0, 25, 50, 75, 100], axis=0)
+        for i, col in enumerate(numeric_columns):
+            count, mean, m2, low, high = self.moments[col]
+            column_stats = {
+                'count': int(count),
+                'mean': float(mean) if count else None,
+                'std': float(np.sqrt(m2 / (count - 1))) if count > 1 else None,
+            }
+            for key, row in zip(QUANTILE_KEYS, quantiles):
+                column_stats[key] = _to_json_number(row[i])
+            # Extremes are tracked exactly rather than taken from the sample
+            column_stats['min'] = float(low) if count else None
+            column_stats['max'] = float(high) if count else None
+            for key, value in zip(TOTAL_METRICS, self.totals[col]):
+                column_stats[key] = _to_json_number(value)
+            if not count:
+                column_stats['sum'] = None
+            stats[col] = column_stats
+
+        for col in self.columns:
+            null_count = self.null_counts[col]
+            column_stats = stats.setdefault(col, {'count': self.rows - null_count})
+            column_stats['null_count'] = null_count
+            column_stats['distinct'] = sketch_estimate(self.sketches[col])
+
+        return {
+            'rows': int(self.rows),
+            'columns': [str(col) for col in self.columns],
+            'numeric_columns': [str(col) for col in numeric_columns],
+            'dtypes': {str(col): str(dtype) for col, dtype in self.dtypes.items()},
+            'stats': {str(col): column_stats for col, column_stats in stats.items()},
+            'sample': self.head_records,
+            'ingest': {'chunks': self.chunks, 'sampled_rows': len(self.sample)},
+        }
+
+    def state(self):
+        """Return the JSON-serializable state; sketches and sample are stored separately"""
+        return {
+            'sample_size': self.sample_size,
+            'rows': self.rows,
+            'chunks': self.chunks,
+            'columns': self.columns,
+            'head_records': self.head_records,
+            'dtypes': {col: str(dtype) for col, dtype in self.dtypes.items()},
+            'moments': {col: [float(value) for value in moments] for col, moments in self.moments.items()},
+            'totals': {col: [_to_json_number(value) for value in totals] for col, totals in self.totals.items()},
+            'null_counts': self.null_counts,
+            'rng': self._rng.bit_generator.state,
+        }
+
+    @classmethod
+    def from_state(cls, state, sketches, sample):
+        """Rebuild an accumulator saved with ``state()``"""
+        accumulator = cls(sample_size=state['sample_size'])
+        accumulator.rows = state['rows']
+        accumulator.chunks = state['chunks']
+        accumulator.columns = state['columns']
+        accumulator.head_records = state['head_records']
+        accumulator.dtypes = {col: pd.api.types.pandas_dtype(dtype) for col, dtype in state['dtypes'].items()}
+        accumulator.moments = {col: [int(moments[0])] + moments[1:] for col, moments in state['moments'].items()}
+        accumulator.totals = {col: [np.nan if value is None else value for value in totals]
+                              for col, totals in state['totals'].items()}
+        accumulator.null_counts = state['null_counts']
+        accumulator.sketches = sketches
+        accumulator.sample = sample
+        accumulator._rng.bit_generator.state = state['rng']
+        return accumulator
+
+
+def rollup_spec(roles):
+    """Describe how a role map rolls rows up into periods, or None without a date role.
+
+    ``roles`` maps roles to columns. Columns with balance-sheet roles keep
+    their last value per period; every other numeric column is summed.
+    """
+    if 'date' not in roles:
+        return None
+    return {
+        'date': roles['date'],
+        'stocks': sorted({roles[role] for role in STOCK_ROLES if role in roles}),
+    }
+
+
+class RollupAccumulator:
+    """Fold chunks into monthly totals of their numeric columns, and weekly ones alongside"""
+
+    def __init__(self, spec, freq=ROLLUP_FREQ):
+        self.spec = spec
+        self.date_column = spec['date']
+        self.stock_columns = set(spec['stocks'])
+        self.freq = freq
+        self.totals = None
+        self.weekly = RollupAccumulator(spec, WEEKLY_FREQ) if freq == ROLLUP_FREQ else None
+
+    def _aggregations(self, columns):
+        return {col: 'last' if col in self.stock_columns else 'sum' for col in columns}
+
+    def update(self, chunk):
+        dates = pd.to_datetime(chunk[self.date_column], errors='coerce', format='mixed')
+        numeric = chunk.select_dtypes(include=['number']).drop(columns=[self.date_column], errors='ignore')
+        if numeric.empty:
+            return
+        # Compacted float32 columns would otherwise be summed in float32
+        numeric = as_float64(numeric)
+        self._fold(dates, numeric)
+        if self.weekly is not None:
+            self.weekly._fold(dates, numeric)
+
+    def _fold(self, dates, numeric):
+        # Rows whose date does not parse fall out of the grouping
+        rolled = numeric.groupby(dates.dt.to_period(self.freq).values).agg(self._aggregations(numeric.columns))
+        if self.totals is not None:
+            combined = pd.concat([self.totals, rolled])
+            rolled = combined.groupby(level=0).agg(self._aggregations(combined.columns))
+        self.totals = rolled
+
+    @classmethod
+    def from_result(cls, spec, rollup, freq=ROLLUP_FREQ, weekly=None):
+        """Rebuild an accumulator from a frame returned by ``result()``.
+
+        ``weekly`` is the weekly frame of ``period_tables()``; without it the
+        weekly totals are dropped, as they cannot be recovered from months.
+        """
+        accumulator = cls(spec, freq)
+        if len(rollup):
+            totals = rollup.set_index(accumulator.date_column)
+            totals.index = totals.index.to_period(freq)
+            totals.index.name = None
+            accumulator.totals = totals
+        if accumulator.weekly is not None:
+            accumulator.weekly = cls.from_result(spec, weekly, WEEKLY_FREQ) if weekly is not None else None
+        return accumulator
+
+    def _frame(self, totals):
+        if totals is None:
+            return pd.DataFrame({self.date_column: pd.Series(dtype='datetime64[ns]')})
+        rollup = totals.sort_index()
+        rollup.index = rollup.index.to_timestamp()
+        rollup.index.name = self.date_column
+        return rollup.reset_index()
+
+    def result(self):
+        """Return the rollup as a frame with the period start in the date column"""
+        return self._frame(self.totals)
+
+    def period_tables(self):
+        """Return ``{granularity: frame}`` for every granularity this accumulator can give"""
+        tables = {'month': self.result()}
+        if self.weekly is not None:
+            tables['week'] = self.weekly.result()
+        for granularity in ('quarter', 'year'):
+            totals = self.totals
+            if totals is not None:
+                periods = totals.index.asfreq(ROLLUP_GRANULARITIES[granularity])
+                totals = totals.groupby(periods).agg(self._aggregations(totals.columns))
+            tables[granularity] = self._frame(totals)
+        return tables
+
+
+def should_stream(file):
+    """Whether an upload is large enough to be ingested in chunks"""
+    if file.file_type != 'csv' or not file.storage_path or not columnar.pyarrow_available:
+        return False
+    return os.path.getsize(financial_file_path(file)) > current_app.config['STREAMING_INGEST_THRESHOLD']
+
+
+def is_streamed(file):
+    """Whether a file was ingested in chunks and must not be loaded whole"""
+    return (file.profile or {}).get('ingest', {}).get('mode') == 'streaming'
+
+
+def _read_chunks(file):
+    return pd.read_csv(financial_file_path(file), chunksize=current_app.config['INGEST_CHUNK_ROWS'])
+
+
+def _write_rollup(file, rollup):
+    for granularity, table in rollup.period_tables().items():
+        columnar.write_columnar_copy(table, artifact_path(file, PERIOD_ROLLUP_FILENAME.format(granularity)))
+
+
+def save_ingest_state(file, profile, rollup):
+    """Store the accumulators of a file next to its blob.
+
+    Appending rows later (see ``app.core.append``) resumes from this state
+    instead of reading the file again from row zero.
+    """
+    state = dict(profile.state(), rollup=rollup.spec if rollup is not None else None)
+    np.savez(artifact_path(file, SKETCHES_FILENAME), *[profile.sketches[col] for col in profile.columns])
+    columnar.write_columnar_copy(profile.sample, artifact_path(file, SAMPLE_FILENAME))
+    if rollup is not None:
+        _write_rollup(file, rollup)
+    # Written last: a state file means the rest of the state is complete
+    path = artifact_path(file, STATE_FILENAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def build_ingest_state(file, chunks):
+    """Run fresh accumulators over ``chunks`` of a file and save their state"""
+    profile = ProfileAccumulator()
+    spec = rollup_spec(role_columns(resolve_column_roles(file.column_roles, file.column_role_overrides)))
+    rollup = RollupAccumulator(spec) if spec else None
+    for chunk in chunks:
+        profile.update(chunk)
+        if rollup is not None:
+            rollup.update(chunk)
+    save_ingest_state(file, profile, rollup)
+    return profile, rollup
+
+
+def load_ingest_state(file):
+    """Return the saved ``(profile, rollup)`` accumulators of a file, or None.
+
+    ``rollup`` is None when the file has no date column. States saved before
+    running totals were kept count as missing.
+    """
+    path = artifact_path(file, STATE_FILENAME)
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if 'totals' not in state:
+        return None
+    with np.load(artifact_path(file, SKETCHES_FILENAME)) as stored:
+        sketches = {col: stored[f'arr_{i}'] for i, col in enumerate(state['columns'])}
+    sample, _ = columnar.read_columnar_copy(artifact_path(file, SAMPLE_FILENAME))
+    profile = ProfileAccumulator.from_state(state, sketches, sample)
+
+    rollup = None
+    if state['rollup'] is not None:
+        frame, _ = columnar.read_columnar_copy(artifact_path(file, ROLLUP_FILENAME))
+        weekly_path = artifact_path(file, PERIOD_ROLLUP_FILENAME.format('week'))
+        weekly = columnar.read_columnar_copy(weekly_path)[0] if os.path.exists(weekly_path) else None
+        rollup = RollupAccumulator.from_result(state['rollup'], frame, weekly=weekly)
+    return profile, rollup
+
+
+def ingest_csv(file):
+    """Read a CSV upload in chunks and store everything analysis needs from it.
+
+    Sets ``profile``, ``column_roles`` and ``columnar_filename`` on the file
+    and writes its row sample and monthly rollup next to the blob; the caller
+    commits the session.
+    """
+    profile = ProfileAccumulator()
+    roles = rollup = None
+    columnar_name = columnar.columnar_filename_for(file.storage_path)
+    writer = columnar.ColumnarWriter(os.path.join(current_app.config['UPLOAD_FOLDER'], columnar_name))
+
+    for chunk in _read_chunks(file):
+        if roles is None:
+            # Roles are detected on the first chunk; it is large enough for
+            # the name rules and date sniffing
+            roles = infer_column_roles(chunk)
+            spec = rollup_spec(role_columns(roles))
+            rollup = RollupAccumulator(spec) if spec else None
+        profile.update(chunk)
+        writer.write(chunk)
+        if rollup is not None:
+            rollup.update(chunk)
+
+    if writer.close():
+        file.columnar_filename = columnar_name
+    file.column_roles = roles or {}
+    file.profile = profile.result()
+    file.profile['ingest'].update(mode='streaming', rollup=rollup.spec if rollup is not None else None)
+    save_ingest_state(file, profile, rollup)
+
+
+def prepare_financial_file(file):
+    """Derive the columnar copy, column roles and profile of a new upload.
+
+    Results are reused from an earlier file with the same content when there
+    is one. Otherwise the upload is parsed once, or streamed in chunks when
+    it is too large to load. Only the first sheet of a workbook is parsed;
+    the others are listed in ``file.sheets`` (see ``app.core.sheets``).
+    Failures are logged and leave the file to be prepared lazily on first
+    use; the caller commits the session.
+    """
+    record_sheets(file, financial_file_path(file))
+    previous = next((f for f in FinancialFile.query.filter_by(content_hash=file.content_hash,
+                                                              sheet_name=file.sheet_name)
+                     if f.profile and f.id != file.id), None) if file.content_hash else None
+    if previous is not None:
+        # The same content was uploaded before; reuse what was derived from it
+        file.columnar_filename = previous.columnar_filename
+        file.column_roles = previous.column_roles
+        file.profile = previous.profile
+        return
+
+    # Keep a typed columnar copy so later reads skip CSV/XLSX parsing, and
+    # detect column roles and statistics once while the parsed frame is at
+    # hand. Large CSVs are never loaded whole.
+    try:
+        if should_stream(file):
+            ingest_csv(file)
+        else:
+            df, memory = build_columnar_copy(file)
+            file.column_roles = infer_column_roles(df)
+            file.profile = dict(build_profile(df), memory=memory)
+            if file.storage_path and columnar.pyarrow_available:
+                build_ingest_state(file, [df])
+    except Exception as e:
+        current_app.logger.warning(f"Could not prepare {file.filename} for analysis: {str(e)}")
+
+
+def _rebuild_rollup(file, spec):
+    """Fold a whole file into a fresh rollup for ``spec`` and store it with the ingest state"""
+    rollup = RollupAccumulator(spec)
+    streamed = is_streamed(file)
+    for chunk in (_read_chunks(file) if streamed else [load_financial_frame(file)]):
+        rollup.update(chunk)
+    state = load_ingest_state(file)
+    if state is not None:
+        save_ingest_state(file, state[0], rollup)
+    else:
+        _write_rollup(file, rollup)
+    if streamed:
+        profile = dict(file.profile)
+        profile['ingest'] = dict(profile['ingest'], rollup=spec)
+        file.profile = profile
+        db.session.commit()
+    return rollup
+
+
+def load_row_sample(file):
+    """The uniform row sample a streamed file keeps in place of its rows; not in row order"""
+    sample, _ = columnar.read_columnar_copy(artifact_path(file, SAMPLE_FILENAME))
+    return sample
+
+
+def load_row_frame(file):
+    """Rows of a file for code that needs them all at once.
+
+    That is the whole frame, except for streamed files, which are never
+    loaded whole and give their row sample instead.
+    """
+    if is_streamed(file):
+        return load_row_sample(file)
+    return load_financial_frame(file)
+
+
+def load_stream_frames(file, roles):
+    """Return ``(rollup, sample)`` frames of a streamed file for a role map.
+
+    The rollup is None when there is no date role. If the user has changed
+    the date or balance-sheet columns since ingestion, the rollup is rebuilt
+    with another pass over the file before it is returned.
+    """
+    sample = load_row_sample(file)
+    spec = rollup_spec(roles)
+    if spec is None:
+        return None, sample
+
+    if spec != file.profile['ingest'].get('rollup'):
+        _rebuild_rollup(file, spec)
+
+    rollup_frame, _ = columnar.read_columnar_copy(artifact_path(file, ROLLUP_FILENAME))
+    return rollup_frame, sample
+
+
+def _stored_rollup_spec(file):
+    path = artifact_path(file, STATE_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)['rollup']
+
+
+def load_period_rollup(file, roles, granularity):
+    """Return the rollup of a file at a granularity of ``ROLLUP_GRANULARITIES``.
+
+    The frame has one row per period, with the period start in the date
+    column, flows summed and balance-sheet columns at their last value. It
+    is read from the table stored at ingest; files that predate the tables,
+    or whose date or balance-sheet columns have changed since, are rolled up
+    again once. Returns None when there is no date role.
+    """
+    spec = rollup_spec(roles)
+    if spec is None:
+        return None
+    path = artifact_path(file, PERIOD_ROLLUP_FILENAME.format(granularity))
+    if path is None or not columnar.pyarrow_available:
+        # Nowhere to keep the tables; roll the file up in memory
+        rollup = RollupAccumulator(spec)
+        rollup.update(load_financial_frame(file))
+        return rollup.period_tables()[granularity]
+
+    if not os.path.exists(path) or _stored_rollup_spec(file) != spec:
+        _rebuild_rollup(file, spec)
+    frame, _ = columnar.read_columnar_copy(path)
+    return frame
@@ -0,0 +1,223 @@
+"""Shared loading layer for uploaded financial files.
+
+Every route that needs the contents of a ``FinancialFile`` goes through
+``load_financial_frame`` so that a file is parsed once per worker process and
+then served from a size-bounded LRU cache until it changes on disk. When the
+upload has a typed columnar copy (see ``app.core.columnar``) that copy is
+memory-mapped instead of parsing the original CSV/Excel file. Either way the
+frame has compact dtypes (see ``app.core.dtypes``).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from flask import current_app
+
+from app.core import columnar
+from app.core.dtypes import compact_frame
+from app.core.storage import sheet_suffix
+
+
+def financial_file_path(file):
+    """Return the absolute path of an uploaded file on disk"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], file.storage_path or file.filename)
+
+
+def columnar_file_path(file):
+    """Return the path of the columnar copy of an upload, or None if it has none"""
+    if not file.columnar_filename or not columnar.pyarrow_available:
+        return None
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.columnar_filename)
+    return path if os.path.exists(path) else None
+
+
+def read_financial_file(path, file_type, columns=None, offset=0, limit=None, sheet_name=None):
+    """Parse a CSV or Excel file into a DataFrame without any caching.
+
+    ``columns`` restricts parsing to those columns and ``offset``/``limit``
+    to a window of data rows, so only that part of the file is converted.
+    Excel files are read from ``sheet_name``, or their first sheet.
+    """
+    kwargs = {}
+    if columns is not None:
+        kwargs['usecols'] = columns
+    if offset:
+        kwargs['skiprows'] = range(1, offset + 1)  # keep the header row
+    if limit is not None:
+        kwargs['nrows'] = limit
+    if file_type == 'csv':
+        df = pd.read_csv(path, **kwargs)
+    else:
+        df = pd.read_excel(path, sheet_name=sheet_name or 0, **kwargs)
+    # usecols keeps file order; return columns in the order asked for
+    return df if columns is None else df[list(columns)]
+
+
+def build_columnar_copy(file):
+    """Parse the original upload, compact its dtypes and write its columnar copy.
+
+    Sets ``file.columnar_filename`` on success; the caller commits the session.
+    Returns the compacted DataFrame, so upload handlers can reuse it, and the
+    memory report of ``compact_frame``.
+    """
+    df, memory = compact_frame(read_financial_file(financial_file_path(file), file.file_type,
+                                                   sheet_name=file.sheet_name))
+    # Stored next to the blob, so files with the same content share it
+    name = columnar.columnar_filename_for((file.storage_path or file.filename) + sheet_suffix(file.sheet_name))
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], name)
+    if columnar.write_columnar_copy(df, path):
+        file.columnar_filename = name
+    return df, memory
+
+
+class FrameCache:
+    """Thread-safe LRU cache of parsed DataFrames bounded by entries and bytes.
+
+    Only private heap memory counts against ``max_bytes``. Columns that are
+    views of a memory-mapped Arrow file live in the shared OS page cache and
+    are tracked separately as ``mapped_bytes``.
+    """
+
+    def __init__(self, max_entries=16, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self.mapped_bytes = 0
+
+    def peek(self, key):
+        """Return a cached frame without updating recency or counters"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, frame, mapped_bytes=0):
+        size = int(frame.memory_usage(index=True, deep=True).sum()) - mapped_bytes
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+                self.mapped_bytes -= old[2]
+            self._entries[key] = (frame, size, mapped_bytes)
+            self.current_bytes += size
+            self.mapped_bytes += mapped_bytes
+            # Always keep the newest entry, even if it alone exceeds the byte budget
+            while len(self._entries) > 1 and (
+                    len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes):
+                _, (_, evicted_size, evicted_mapped) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.mapped_bytes -= evicted_mapped
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.mapped_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                # Resident memory this worker saves by sharing mapped pages
+                'mapped_bytes': self.mapped_bytes,
+                'pid': os.getpid(),
+            }
+
+
+def get_frame_cache():
+    """Return the frame cache of the current application"""
+    return current_app.extensions['frame_cache']
+
+
+def _frame_source(file):
+    """Return the path to read for a file, whether it is columnar, and its cache key"""
+    path = columnar_file_path(file)
+    is_columnar = path is not None
+    if not is_columnar:
+        path = financial_file_path(file)
+    st = os.stat(path)
+    # Files with the same content share one cached frame; sheets of a
+    # workbook share a blob but not a frame
+    key = (file.content_hash or file.id, file.sheet_name, path, st.st_mtime_ns, st.st_size)
+    return path, is_columnar, key
+
+
+def load_financial_frame(file):
+    """Load the DataFrame for a FinancialFile, parsing it at most once.
+
+    The columnar copy is preferred and the original file is only parsed when
+    the copy is missing. The cache key combines the file id with the path,
+    modification time and size of whichever file is read, so a replaced
+    upload is re-read automatically; content-addressed files are keyed by
+    their hash instead of their id so duplicate uploads share one frame.
+    Callers get a shallow copy and may add or replace columns freely, but
+    must not modify cached values in place; columns backed by a
+    memory-mapped file are read-only.
+
+    Raises FileNotFoundError if the upload is missing from disk.
+    """
+    path, is_columnar, key = _frame_source(file)
+
+    cache = get_frame_cache()
+    frame = cache.get(key)
+    if frame is None:
+        mapped_bytes = 0
+        if is_columnar:
+            frame, mapped_bytes = columnar.read_columnar_copy(path)
+        else:
+            frame, _ = compact_frame(read_financial_file(path, file.file_type, sheet_name=file.sheet_name))
+        cache.put(key, frame, mapped_bytes)
+    return frame.copy(deep=False)
+
+
+def read_financial_window(file, columns=None, offset=0, limit=None):
+    """Read only the given columns and row window of a FinancialFile.
+
+    Light endpoints use this instead of ``load_financial_frame`` so their cost
+    depends on the slice they need, not on the width and length of the file.
+    A fully cached frame is sliced directly; otherwise the columnar copy is
+    projected and sliced before conversion to pandas, and original files are
+    parsed with ``usecols``/``nrows``. Windows are not cached.
+    """
+    path, is_columnar, key = _frame_source(file)
+    stop = None if limit is None else offset + limit
+
+    frame = get_frame_cache().peek(key)
+    if frame is not None:
+        frame = frame.iloc[offset:stop]
+        return frame if columns is None else frame[list(columns)]
+    if is_columnar:
+        return columnar.read_columnar_window(path, columns, offset, limit)
+    return read_financial_file(path, file.file_type, columns, offset, limit, file.sheet_name)
+
+
+def init_app(app):
+    """Attach a frame cache sized from the app config"""
+    app.extensions['frame_cache'] = FrameCache(
+        max_entries=app.config.get('FRAME_CACHE_MAX_ENTRIES', 16),
+        max_bytes=app.config.get('FRAME_CACHE_MAX_BYTES', 256 * 1024 * 1024),
+    )
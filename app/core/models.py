@@ -23,6 +23,25 @@ class FinancialFile(db.Model):
     filename = db.Column(db.String(255), nullable=False)
     upload_date = db.Column(db.DateTime, default=datetime.utcnow)
     file_type = db.Column(db.String(50))
+    # sha256 of the uploaded bytes and the blob path under UPLOAD_FOLDER,
+    # see app.core.storage; files uploaded earlier only have ``filename``
+    content_hash = db.Column(db.String(64), index=True)
+    storage_path = db.Column(db.String(255))
+    columnar_filename = db.Column(db.String(255))
+    # {role: {'column': ..., 'confidence': ...}} detected at upload
+    column_roles = db.Column(db.JSON)
+    # {role: column or None} corrections made by the user
+    column_role_overrides = db.Column(db.JSON)
+    # Summary statistics computed once at upload, see app.core.profile
+    profile = db.Column(db.JSON)
+    # Worksheets of an Excel upload, see app.core.sheets. The upload stands
+    # for the first sheet; every further sheet is a child file sharing its
+    # blob, with ``sheet_name`` set and ``parent_id`` pointing at the upload
+    sheets = db.Column(db.JSON)
+    sheet_name = db.Column(db.String(255))
+    parent_id = db.Column(db.Integer, db.ForeignKey('financial_file.id'))
+    # Incremented by every append of new rows, see app.core.append
+    version = db.Column(db.Integer, default=1, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     analyses = db.relationship('Analysis', back_populates='file', lazy='dynamic')
 
@@ -33,6 +52,10 @@ class Analysis(db.Model):
     created_date = db.Column(db.DateTime, default=datetime.utcnow)
     analysis_type = db.Column(db.String(50))
     results = db.Column(db.JSON)
+    # File version and sha256 of the parameters the results were computed
+    # from; with ``analysis_type`` they address the results for reuse
+    version = db.Column(db.Integer)
+    params_hash = db.Column(db.String(64), index=True)
     
     file = db.relationship('FinancialFile', back_populates='analyses')
     user = db.relationship('User', backref='user_analyses')
@@ -40,6 +63,67 @@ class Analysis(db.Model):
     def __repr__(self):
         return f'<Analysis {self.id} {self.analysis_type}>'
 
+class UploadSession(db.Model):
+    """A resumable upload in progress, see app.core.uploads"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    file_type = db.Column(db.String(50))
+    # Declared by the client at init; finalize refuses an incomplete upload
+    total_size = db.Column(db.BigInteger)
+    received_bytes = db.Column(db.BigInteger, default=0, nullable=False)
+    # uploading -> processing -> complete, or failed
+    status = db.Column(db.String(20), default='uploading', nullable=False)
+    error = db.Column(db.Text)
+    content_hash = db.Column(db.String(64))
+    storage_path = db.Column(db.String(255))
+    file_id = db.Column(db.Integer, db.ForeignKey('financial_file.id'))
+    # When ingestion started; sessions processing for longer than
+    # UPLOAD_PROCESSING_TIMEOUT are reported as failed
+    processing_started = db.Column(db.DateTime)
+    created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AnalysisJob(db.Model):
+    """An analysis computed by the background worker pool, see app.analysis.jobs"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    file_id = db.Column(db.Integer, db.ForeignKey('financial_file.id'), nullable=False)
+    analysis_type = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.JSON)
+    # File version and sha256 of ``params``, as on ``Analysis``
+    version = db.Column(db.Integer)
+    params_hash = db.Column(db.String(64), index=True)
+    # queued -> running -> complete, or failed
+    status = db.Column(db.String(20), default='queued', nullable=False)
+    progress = db.Column(db.Integer, default=0, nullable=False)
+    stage = db.Column(db.String(100))
+    error = db.Column(db.Text)
+    # Everything the results page renders, including the charts
+    result = db.Column(db.JSON)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis.id'))
+    created_date = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_date = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_date = db.Column(db.DateTime)
+    
+    file = db.relationship('FinancialFile')
+    analysis = db.relationship('Analysis')
+
+class ForecastModel(db.Model):
+    """A forecast model fitted to one column of one file version, see app.analysis.service"""
+    __table_args__ = (db.UniqueConstraint('file_id', 'version', 'model', 'params_hash', 'column'),)
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('financial_file.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    # The model asked for, one of MODEL_CHOICES; ``state`` names the one fitted
+    model = db.Column(db.String(50), nullable=False)
+    # sha256 of the column roles the file was read with
+    params_hash = db.Column(db.String(64), nullable=False)
+    column = db.Column(db.String(255), nullable=False)
+    # Final states, parameters and error variance, see app.analysis.forecasting
+    state = db.Column(db.JSON, nullable=False)
+    created_date = db.Column(db.DateTime, default=datetime.utcnow)
+
 @login.user_loader
 def load_user(id):
     return User.query.get(int(id))
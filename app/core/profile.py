@@ -0,0 +1,177 @@
+"""Per-file statistics profiles.
+
+A profile holds the summary statistics of every column (count, mean, std,
+quartiles, min/max, null count and a distinct-count estimate) plus a small
+sample of rows. It is computed once at upload and stored on
+``FinancialFile.profile`` so file views, chat and comparisons can show
+statistics without touching pandas.
+
+Numeric columns also carry running totals (``TOTAL_METRICS``: the sum, the
+values of the first and last rows and the last non-null value), which are
+enough for aggregate ratios and trends and are extended row by row when a
+file is appended to (see ``app.core.append``).
+"""
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from app import db
+from app.core.loader import load_financial_frame
+
+# Keys match DataFrame.describe() so existing templates keep working
+QUANTILE_KEYS = ['min', '25%', '50%', '75%', 'max']
+NUMERIC_METRICS = ['count', 'mean', 'std'] + QUANTILE_KEYS + ['null_count', 'distinct']
+TOTAL_METRICS = ['sum', 'first', 'last', 'latest']
+
+# Size of the k-minimum-values sketch used for distinct counts
+DISTINCT_SKETCH_SIZE = 1024
+SAMPLE_ROWS = 5
+
+
+def _to_json_number(value):
+    """Convert a numpy scalar to a JSON-safe Python number (NaN becomes None)"""
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def column_totals(values):
+    """Running totals of the columns of a 2-D float64 array, as four arrays.
+
+    Returns the column sums, the first and last rows and the last non-null
+    value of each column (NaN when there is none). The array must have rows.
+    """
+    present = ~np.isnan(values)
+    last_present = len(values) - 1 - np.argmax(present[::-1], axis=0)
+    latest = np.where(present.any(axis=0), values[last_present, np.arange(values.shape[1])], np.nan)
+    return np.nansum(values, axis=0), values[0], values[-1], latest
+
+
+def has_running_totals(profile):
+    """Whether every numeric column of a profile carries ``TOTAL_METRICS``"""
+    return all('sum' in profile['stats'][col] for col in profile['numeric_columns'])
+
+
+def _smallest_distinct(hashes, k):
+    """The ``k`` smallest distinct values of a hash array, sorted.
+
+    Rather than sorting every hash, the array is partitioned around its
+    ``size``-th smallest value and only the hashes up to it are
+    deduplicated, growing ``size`` by the duplication seen until they hold
+    ``k`` distinct values. Columns with few distinct values, judged by the
+    first hashes, are deduplicated whole instead, which is cheap for them.
+    """
+    head = hashes[:8 * k]
+    size = k if len(pd.unique(head)) > len(head) // 2 else len(hashes)
+    while size <= len(hashes) // 8:
+        threshold = np.partition(hashes, size - 1)[size - 1]
+        smallest = np.sort(pd.unique(hashes[hashes <= threshold]))
+        if len(smallest) >= k:
+            return smallest[:k]
+        size = 2 * size * k // max(len(smallest), 1)
+    distinct = pd.unique(hashes)
+    if len(distinct) > k:
+        distinct = np.partition(distinct, k - 1)[:k]
+    return np.sort(distinct)
+
+
+def distinct_sketch(values, k=DISTINCT_SKETCH_SIZE):
+    """Return the ``k`` smallest distinct 64-bit hashes of an array, sorted"""
+    return _smallest_distinct(pd.util.hash_array(values), k)
+
+
+def merge_distinct_sketches(left, right, k=DISTINCT_SKETCH_SIZE):
+    """Combine two sketches into the sketch of the union of their inputs"""
+    return _smallest_distinct(np.concatenate([left, right]), k)
+
+
+def sketch_estimate(sketch, k=DISTINCT_SKETCH_SIZE):
+    """Distinct-count estimate of a KMV sketch; exact below ``k`` values"""
+    if len(sketch) < k:
+        return int(len(sketch))
+    return int(round((k - 1) / (sketch[k - 1] / np.float64(2 ** 64))))
+
+
+def estimate_distinct(series, k=DISTINCT_SKETCH_SIZE):
+    """Estimate the number of distinct non-null values with a KMV sketch.
+
+    Exact when there are fewer than ``k`` distinct values.
+    """
+    return sketch_estimate(distinct_sketch(series.dropna().to_numpy(), k), k)
+
+
+def build_profile(df):
+    """Compute the statistics profile of a DataFrame in one pass over its columns"""
+    numeric_columns = [col for col in df.select_dtypes(include=['number']).columns]
+    stats = {}
+
+    if numeric_columns:
+        values = df[numeric_columns].to_numpy(dtype='float64', na_value=np.nan)
+        with warnings.catch_warnings():
+            # All-null columns legitimately produce NaN statistics
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            counts = np.sum(~np.isnan(values), axis=0)
+            means = np.nanmean(values, axis=0)
+            stds = np.nanstd(values, axis=0, ddof=1)
+            quantiles = np.nanpercentile(values, [0, 25, 50, 75, 100], axis=0)
+        totals = column_totals(values) if len(values) else [np.full(len(numeric_columns), np.nan)] * 4
+        for i, col in enumerate(numeric_columns):
+            column_stats = {
+                'count': int(counts[i]),
+                'mean': _to_json_number(means[i]),
+                'std': _to_json_number(stds[i]) if counts[i] > 1 else None,
+            }
+            for key, row in zip(QUANTILE_KEYS, quantiles):
+                column_stats[key] = _to_json_number(row[i])
+            for key, row in zip(TOTAL_METRICS, totals):
+                column_stats[key] = _to_json_number(row[i])
+            if not counts[i]:
+                column_stats['sum'] = None
+            stats[col] = column_stats
+
+    for col in df.columns:
+        series = df[col]
+        null_count = int(series.isna().sum())
+        column_stats = stats.setdefault(col, {'count': len(series) - null_count})
+        column_stats['null_count'] = null_count
+        column_stats['distinct'] = estimate_distinct(series)
+
+    return {
+        'rows': int(len(df)),
+        'columns': [str(col) for col in df.columns],
+        'numeric_columns': [str(col) for col in numeric_columns],
+        'dtypes': {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+        'stats': {str(col): column_stats for col, column_stats in stats.items()},
+        'sample': json.loads(df.head(SAMPLE_ROWS).to_json(orient='records', date_format='iso')),
+    }
+
+
+def describe_from_profile(profile, columns=None, metrics=None):
+    """Return ``{metric: {column: value}}`` like ``DataFrame.describe().to_dict()`` transposed"""
+    columns = profile['numeric_columns'] if columns is None else columns
+    metrics = NUMERIC_METRICS if metrics is None else metrics
+    return {
+        metric: {col: profile['stats'].get(col, {}).get(metric) for col in columns}
+        for metric in metrics
+    }
+
+
+def ensure_profile(file):
+    """Return the profile of a file, computing and storing it on first use.
+
+    Sheets of a workbook are prepared like a new upload the first time they
+    are used, which also writes their columnar copy and detects their roles;
+    large CSVs are ingested in chunks again.
+    """
+    if file.profile is None:
+        from app.core.ingest import ingest_csv, prepare_financial_file, should_stream
+        if file.sheet_name is not None and file.columnar_filename is None:
+            prepare_financial_file(file)
+        elif should_stream(file):
+            # A large upload whose ingestion failed is streamed again, never loaded whole
+            ingest_csv(file)
+        if file.profile is None:
+            file.profile = build_profile(load_financial_frame(file))
+        db.session.commit()
+    return file.profile
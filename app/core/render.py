@@ -0,0 +1,177 @@
+"""Chart drawing on a bounded pool of worker processes.
+
+pyplot keeps one global figure state per process, so charts drawn with it
+from several request or job threads have to take turns. Charts here are
+built with matplotlib's object-oriented API (a ``Figure`` on its own Agg
+canvas), which shares no state, and ``ChartRenderer.render_many`` fans a
+batch of charts out to a process pool so they draw on separate cores.
+
+A chart is a kind, naming one of the ``RENDERERS``, and a payload of plain
+arrays and strings, which pickles cheaply to the pool. With
+``CHART_WORKERS`` set to 0 charts are drawn in the calling thread.
+"""
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Points kept per line in PNG charts, about twice their width in pixels;
+# longer series are downsampled by the caller (see app.core.downsample)
+PNG_MAX_POINTS = 2000
+
+
+def _png(fig):
+    FigureCanvasAgg(fig)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def draw_time_series(payload):
+    """Line chart of ``payload['values']`` over ``payload['dates']``"""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    ax.plot(payload['dates'], payload['values'])
+    ax.set_title(f"{payload['column']} Over Time")
+    ax.set_xlabel('Date')
+    ax.set_ylabel(payload['column'])
+    ax.grid(True)
+    fig.tight_layout()
+    return _png(fig)
+
+
+def draw_correlation(payload):
+    """Heatmap of the square ``payload['matrix']`` labelled with ``payload['columns']``"""
+    columns = payload['columns']
+    fig = Figure(figsize=(10, 8))
+    ax = fig.add_subplot()
+    image = ax.matshow(payload['matrix'])
+    fig.colorbar(image)
+    ax.set_xticks(range(len(columns)), columns, rotation=90)
+    ax.set_yticks(range(len(columns)), columns)
+    return _png(fig)
+
+
+def draw_comparison(payload):
+    """One line per dataset in ``payload['series']``, over ``payload['positions']``"""
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    for i, (positions, values) in enumerate(zip(payload['positions'], payload['series'])):
+        if values is not None:
+            ax.plot(positions, values, label=f'Dataset {i+1}')
+    ax.set_title(f"Comparison of {payload['column']}")
+    ax.set_xlabel('Data Points')
+    ax.set_ylabel(payload['column'])
+    ax.legend()
+    ax.grid(True)
+    return _png(fig)
+
+
+RENDERERS = {
+    'time_series': draw_time_series,
+    'correlation': draw_correlation,
+    'comparison': draw_comparison,
+}
+
+
+def render_chart(kind, payload):
+    """Draw one chart in the calling process and return its PNG bytes"""
+    return RENDERERS[kind](payload)
+
+
+class ChartRenderer:
+    """Draws batches of charts on a lazily started pool of processes.
+
+    Counts charts drawn and the wall time spent on batches, so
+    ``renders_per_second`` is the throughput the pool delivers.
+    """
+
+    def __init__(self, max_workers=2, timeout=120):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.failures = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Forking a process with running threads can copy held locks
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def render_many(self, charts):
+        """Draw ``[(kind, payload)]`` and return their PNG bytes in the same order"""
+        if not charts:
+            return []
+        started = time.perf_counter()
+        try:
+            if self.max_workers <= 0:
+                return [render_chart(kind, payload) for kind, payload in charts]
+            executor = self._get_executor()
+            futures = [executor.submit(render_chart, kind, payload) for kind, payload in charts]
+            try:
+                return [future.result(timeout=self.timeout) for future in futures]
+            except BrokenProcessPool:
+                # A worker died; start a fresh pool for the next batch
+                self._reset(executor)
+                raise
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.batches += 1
+                self.renders += len(charts)
+                self.seconds += elapsed
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'renders': self.renders,
+                'failures': self.failures,
+                'batches': self.batches,
+                'seconds': round(self.seconds, 4),
+                'renders_per_second': round(self.renders / self.seconds, 2) if self.seconds else 0.0,
+                'max_workers': self.max_workers,
+                'pool_started': self._executor is not None,
+                'pid': os.getpid(),
+            }
+
+
+def get_chart_renderer():
+    """Return the chart renderer of the current application"""
+    return current_app.extensions['chart_renderer']
+
+
+def init_app(app):
+    """Attach a chart renderer sized from the app config"""
+    app.extensions['chart_renderer'] = ChartRenderer(
+        max_workers=app.config.get('CHART_WORKERS', 1),
+        timeout=app.config.get('CHART_RENDER_TIMEOUT', 120),
+    )
@@ -1,10 +1,16 @@
 import os
 from werkzeug.utils import secure_filename
-import pandas as pd
-from flask import render_template, flash, redirect, url_for, request, current_app, send_from_directory, jsonify
+from flask import render_template, flash, redirect, url_for, request, current_app, send_from_directory, jsonify, send_file, abort
 from flask_login import login_required, current_user
 from app.core import bp
 from app.core.models import FinancialFile, Analysis  # Added Analysis import
+from app.core.loader import financial_file_path, read_financial_window
+from app.core.profile import describe_from_profile, ensure_profile
+from app.core.dtypes import frame_records
+from app.core.storage import store_blob
+from app.core.ingest import prepare_financial_file
+from app.core.sheets import add_sheet_files, workbook_sheets
+from app.core.charts import CHART_KEY_PATTERN, chart_path
 from app import db
 from sqlalchemy.exc import OperationalError, InvalidRequestError
 from datetime import datetime
@@ -68,17 +74,28 @@ def upload_file():
             
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+            file_type = filename.rsplit('.', 1)[1].lower()
+            
+            # Store the bytes under their content hash so uploads with the
+            # same name never overwrite each other and identical files share
+            # one blob
+            content_hash, storage_path = store_blob(file.stream, file_type)
             
             # Save file info to database
-            file_type = filename.rsplit('.', 1)[1].lower()
             new_file = FinancialFile(
                 filename=filename,
                 file_type=file_type,
+                content_hash=content_hash,
+                storage_path=storage_path,
                 user_id=current_user.id
             )
+            
+            prepare_financial_file(new_file)
+            
             db.session.add(new_file)
+            db.session.flush()
+            # Further sheets of a workbook are parsed when first opened
+            add_sheet_files(new_file)
             db.session.commit()
             
             flash(f'File {filename} uploaded successfully')
@@ -102,7 +119,7 @@ def view_file(file_id):
         return redirect(url_for('core.dashboard'))
     
     # Get file path
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
+    file_path = financial_file_path(file)
     
     try:
         # Check if file exists
@@ -110,49 +127,35 @@ def view_file(file_id):
             flash(f'File not found: {file.filename}. It may have been deleted from the server.', 'danger')
             return redirect(url_for('core.dashboard'))
             
-        # Read data
-        if file.file_type == 'csv':
-            df = pd.read_csv(file_path)
-        else:  # excel
-            df = pd.read_excel(file_path)
+        # Statistics come from the profile computed at upload
+        profile = ensure_profile(file)
+        columns = profile['columns']
         
-        # Get basic stats
-        columns = df.columns.tolist()
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
+        # Only the rows shown on the page are read
+        df = read_financial_window(file, limit=100)
         
-        # Calculate statistics
+        numeric_cols = profile['numeric_columns']
         stats = {}
         stats['columns'] = numeric_cols
-        stats['metrics'] = ['count', 'mean', 'min', '25%', '50%', '75%', 'max', 'std']
-        stats['data'] = {}
+        stats['metrics'] = ['count', 'mean', 'min', '25%', '50%', '75%', 'max', 'std', 'null_count', 'distinct']
         
         if not numeric_cols:
             # No numeric columns to analyze
-            stats['data'] = {'count': {col: len(df) for col in columns}}
+            stats['data'] = {'count': {col: profile['rows'] for col in columns}}
         else:
-            # Generate statistics for numeric columns
-            for metric in stats['metrics']:
-                stats['data'][metric] = {}
-                desc = df.describe().to_dict()
-                
-                for col in numeric_cols:
-                    if col in desc:
-                        if metric in desc[col]:
-                            stats['data'][metric][col] = desc[col][metric]
-                        else:
-                            stats['data'][metric][col] = None
-                    else:
-                        stats['data'][metric][col] = None
+            stats['data'] = describe_from_profile(profile, numeric_cols, stats['metrics'])
         
         # Get last analysis
         last_analysis = Analysis.query.filter_by(file_id=file_id).order_by(Analysis.created_date.desc()).first()
         
         # Prepare sample data for template
+        records = frame_records(df)
         data = {
             'columns': columns,
-            'shape': df.shape,
-            'records': df.head(100).replace({np.nan: None}).to_dict('records'),
-            'sample_data': df.head(5).to_dict('records')
+            'shape': (profile['rows'], len(columns)),
+            'memory': profile.get('memory'),
+            'records': records,
+            'sample_data': records[:5]
         }
         
         return render_template(
@@ -160,6 +163,7 @@ def view_file(file_id):
             file=file, 
             data=data, 
             stats=stats,
+            sheets=workbook_sheets(file),
             last_analysis=last_analysis
         )
     except Exception as e:
@@ -167,6 +171,22 @@ def view_file(file_id):
         flash(f'Error reading file: {str(e)}', 'danger')
         return redirect(url_for('core.dashboard'))
 
+@bp.route('/charts/<key>.png')
+@login_required
+def chart_image(key):
+    """Serve a rendered chart; the bytes behind a key never change"""
+    if not CHART_KEY_PATTERN.match(key):
+        abort(404)
+    path = chart_path(key)
+    if not os.path.exists(path):
+        abort(404)
+    response = send_file(path, mimetype='image/png', etag=key, conditional=True, max_age=31536000)
+    # Keys derive from private data, so shared caches must not store them
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
 @bp.route('/api/files/first')
 @login_required
 def get_first_file():
@@ -176,6 +196,12 @@ def get_first_file():
         return jsonify({'file_id': file.id})
     return jsonify({'file_id': None, 'message': 'No files found. Please upload a file first.'})
 
+@bp.errorhandler(413)
+def too_large_error(error):
+    limit = current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    flash(f'Files larger than {limit} MB must be sent with the resumable upload API (/api/uploads)')
+    return redirect(url_for('core.upload_file'))
+
 @bp.errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
@@ -0,0 +1,164 @@
+"""Column-role inference for uploaded financial files.
+
+Decides once per file which column holds the dates, revenue, expenses,
+assets and so on, and stores the result on ``FinancialFile.column_roles``.
+Analysis code reads that map instead of scanning column names on every
+request, and users can correct it through ``column_role_overrides``.
+"""
+import re
+
+import pandas as pd
+
+from app import db
+from app.core.dtypes import looks_like_dates
+from app.core.profile import ensure_profile
+
+# Ordered (pattern, confidence) rules matched against normalized column names
+ROLE_RULES = {
+    'date': [
+        (r'^(date|period|month|quarter|week|day|timestamp)$', 1.0),
+        (r'\b(date|period)\b', 0.8),
+        (r'\b(time|month)\b', 0.6),
+    ],
+    'revenue': [
+        (r'^(total |net )?(revenue|revenues|sales|turnover)$', 1.0),
+        (r'\b(revenue|revenues|sales|turnover)\b', 0.8),
+        (r'^(total )?income$', 0.6),
+    ],
+    'expense': [
+        (r'^(total |operating )?(expense|expenses|expenditure|expenditures|costs)$', 1.0),
+        (r'\b(expense|expenses|expenditure|expenditures|opex)\b', 0.8),
+        (r'\b(cost|costs)\b', 0.5),
+    ],
+    'cost_of_goods_sold': [
+        (r'^(cost of goods sold|cogs|cost of sales)$', 1.0),
+        (r'\b(cogs|cost of goods|cost of sales)\b', 0.8),
+    ],
+    'net_income': [
+        (r'^net (income|profit|earnings)$', 1.0),
+        (r'\bnet (income|profit|earnings)\b', 0.8),
+        (r'\bprofit\b', 0.6),
+    ],
+    'total_assets': [
+        (r'^(total )?assets$', 1.0),
+        (r'^(?!.*\bcurrent\b).*\bassets?\b', 0.6),
+    ],
+    'current_assets': [
+        (r'^(total )?current assets$', 1.0),
+        (r'\bcurrent\b.*\bassets?\b', 0.8),
+    ],
+    'total_liabilities': [
+        (r'^(total )?liabilities$', 1.0),
+        (r'^(?!.*\bcurrent\b).*\bliab', 0.6),
+    ],
+    'current_liabilities': [
+        (r'^(total )?current liabilities$', 1.0),
+        (r'\bcurrent\b.*\bliab', 0.8),
+    ],
+    'total_debt': [
+        (r'^(total )?debt$', 1.0),
+        (r'\bdebt\b', 0.7),
+    ],
+    'equity': [
+        (r'^(total |shareholders |stockholders )?equity$', 1.0),
+        (r'\bequity\b', 0.7),
+    ],
+    'inventory': [
+        (r'^inventor(y|ies)$', 1.0),
+        (r'\binventor(y|ies)\b', 0.8),
+    ],
+}
+
+ROLES = tuple(ROLE_RULES)
+
+# Balance-sheet roles are levels at a point in time: when rows are rolled up
+# into periods they keep the last value instead of being summed
+STOCK_ROLES = ('total_assets', 'current_assets', 'total_liabilities',
+               'current_liabilities', 'total_debt', 'equity', 'inventory')
+
+
+def normalize_column_name(name):
+    """Lowercase a column name and turn separators into single spaces"""
+    return re.sub(r'[\s_\-.]+', ' ', str(name).strip().lower()).strip()
+
+
+def _name_confidence(role, normalized):
+    for pattern, confidence in ROLE_RULES[role]:
+        if re.search(pattern, normalized):
+            return confidence
+    return 0.0
+
+
+def infer_column_roles(df):
+    """Infer a role map for a DataFrame.
+
+    Returns ``{role: {'column': name, 'confidence': float}}``. Each column is
+    given to at most one role, highest confidence first. Value roles need a
+    numeric column; the date role needs a datetime column or text that parses
+    as dates.
+    """
+    candidates = []
+    for position, column in enumerate(df.columns):
+        normalized = normalize_column_name(column)
+        series = df[column]
+        is_numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        for role in ROLES:
+            confidence = _name_confidence(role, normalized)
+            if not confidence:
+                continue
+            if role == 'date':
+                if pd.api.types.is_datetime64_any_dtype(series):
+                    pass
+                elif is_numeric or not looks_like_dates(series):
+                    continue
+            elif not is_numeric:
+                continue
+            candidates.append((-confidence, position, role, column))
+
+    roles = {}
+    taken = set()
+    for neg_confidence, _, role, column in sorted(candidates):
+        if role in roles or column in taken:
+            continue
+        roles[role] = {'column': column, 'confidence': -neg_confidence}
+        taken.add(column)
+    return roles
+
+
+def resolve_column_roles(inferred, overrides):
+    """Apply user overrides on top of an inferred role map.
+
+    An override maps a role to a column name, or to None to clear the role.
+    """
+    roles = {role: dict(info, source='inferred') for role, info in (inferred or {}).items()}
+    for role, column in (overrides or {}).items():
+        if column is None:
+            roles.pop(role, None)
+        else:
+            roles[role] = {'column': column, 'confidence': 1.0, 'source': 'user'}
+    return roles
+
+
+def role_columns(roles):
+    """Flatten a role map to ``{role: column}``"""
+    return {role: info['column'] for role, info in roles.items()}
+
+
+def ensure_column_roles(file, df=None):
+    """Return the effective role map of a file, inferring it on first use.
+
+    Files uploaded before role inference existed get their map computed and
+    stored the first time an analysis path asks for it; ``df`` avoids a
+    reload when the caller already has the full frame.
+    """
+    if file.column_roles is None and df is None and file.profile is None:
+        # Preparing a sheet or ingesting a large CSV detects its roles along
+        # with its profile
+        ensure_profile(file)
+    if file.column_roles is None:
+        if df is None:
+            from app.core.ingest import load_row_frame
+            df = load_row_frame(file)
+        file.column_roles = infer_column_roles(df)
+        db.session.commit()
+    return resolve_column_roles(file.column_roles, file.column_role_overrides)
@@ -0,0 +1,102 @@
+"""Worksheets of uploaded Excel workbooks.
+
+A workbook is stored once, but each worksheet is its own dataset. At upload
+the sheet names and dimensions are read with openpyxl in read-only mode,
+which only parses the workbook index and the ``<dimension>`` tag of each
+sheet, never their cells. The upload's ``FinancialFile`` stands for the
+first sheet and lists every sheet in ``sheets``; each further sheet with
+data gets a child ``FinancialFile`` sharing the same blob, with
+``sheet_name`` set and ``parent_id`` pointing at the upload.
+
+Child files start without a columnar copy, roles or profile. A sheet is
+parsed the first time a route asks for its profile (see
+``app.core.profile.ensure_profile``), so opening one tab of a large workbook
+does not pay for all the others.
+"""
+import logging
+
+from app import db
+from app.core.models import FinancialFile
+
+logger = logging.getLogger(__name__)
+
+try:
+    import openpyxl
+    openpyxl_available = True
+except ImportError:
+    openpyxl_available = False
+    logger.warning("openpyxl is not installed. Only the first sheet of Excel uploads will be read.")
+
+# Formats openpyxl can open; legacy .xls workbooks are read as a single sheet
+WORKBOOK_TYPES = ('xlsx',)
+
+
+def discover_sheets(path):
+    """List the worksheets of a workbook without reading their cells.
+
+    Returns ``[{'name', 'rows', 'columns'}]`` in workbook order. ``rows``
+    excludes the header row; both are None when the sheet does not record
+    its dimensions.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        sheets = []
+        for worksheet in workbook.worksheets:
+            max_row, max_column = worksheet.max_row, worksheet.max_column
+            sheets.append({
+                'name': worksheet.title,
+                'rows': max(max_row - 1, 0) if max_row is not None else None,
+                'columns': max_column,
+            })
+        return sheets
+    finally:
+        workbook.close()
+
+
+def record_sheets(file, path):
+    """Store the sheet list of an Excel upload on ``file.sheets``; the caller commits"""
+    if file.file_type not in WORKBOOK_TYPES or not openpyxl_available or file.sheet_name is not None:
+        return
+    try:
+        file.sheets = discover_sheets(path)
+    except Exception as e:
+        logger.warning(f"Could not list the sheets of {file.filename}: {str(e)}")
+
+
+def add_sheet_files(file):
+    """Create a child file for every further sheet of a workbook that has data.
+
+    ``file`` must already have an id. Returns the new files; the caller
+    commits the session.
+    """
+    children = []
+    sheets = list(file.sheets or [])
+    for index, sheet in enumerate(sheets[1:], start=1):
+        if sheet['rows'] == 0:
+            continue
+        child = FinancialFile(
+            filename=f"{file.filename} ({sheet['name']})",
+            file_type=file.file_type,
+            content_hash=file.content_hash,
+            storage_path=file.storage_path,
+            sheet_name=sheet['name'],
+            parent_id=file.id,
+            user_id=file.user_id
+        )
+        db.session.add(child)
+        children.append((index, child))
+
+    if children:
+        db.session.flush()
+        for index, child in children:
+            sheets[index] = dict(sheets[index], file_id=child.id)
+        # Reassign the JSON value so SQLAlchemy notices the change
+        file.sheets = [dict(sheets[0], file_id=file.id)] + sheets[1:]
+    return [child for _, child in children]
+
+
+def workbook_sheets(file):
+    """Sheet list of the workbook a file belongs to, or None for single-sheet files"""
+    workbook = FinancialFile.query.get(file.parent_id) if file.parent_id else file
+    sheets = workbook.sheets if workbook is not None else None
+    return sheets if sheets and len(sheets) > 1 else None
@@ -0,0 +1,138 @@
+"""Content-addressed storage for uploaded files.
+
+Uploads are stored once per distinct content, as
+``UPLOAD_FOLDER/<h[0:2]>/<h[2:4]>/<sha256>.<ext>``. Every ``FinancialFile``
+with the same bytes points at the same blob, so uploads never overwrite each
+other and the columnar copy, profile and other results derived from a blob
+are computed once and shared. Derived results that are not stored on the
+model live as JSON artifacts in ``<blob>.artifacts/``.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+ARTIFACTS_SUFFIX = '.artifacts'
+
+
+def blob_relpath(content_hash, extension):
+    """Path of a blob relative to the upload folder, sharded by hash prefix"""
+    return os.path.join(content_hash[:2], content_hash[2:4], f'{content_hash}.{extension}')
+
+
+def file_sha256(path):
+    """Return the hex sha256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def place_blob(path, content_hash, extension):
+    """Move a complete file into the blob store under its content hash.
+
+    Returns the blob path relative to the upload folder. If a blob with the
+    same content already exists the file is discarded.
+    """
+    relpath = blob_relpath(content_hash, extension)
+    target = os.path.join(current_app.config['UPLOAD_FOLDER'], relpath)
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    return relpath
+
+
+def store_blob(stream, extension):
+    """Copy an upload stream into the blob store while hashing it.
+
+    Returns ``(content_hash, relpath)``. If a blob with the same content
+    already exists the new copy is discarded.
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=current_app.config['UPLOAD_FOLDER'], suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        content_hash = digest.hexdigest()
+        return content_hash, place_blob(tmp_path, content_hash, extension)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def sheet_suffix(sheet_name):
+    """Suffix that keeps files derived from one sheet of a workbook apart from its siblings'"""
+    if sheet_name is None:
+        return ''
+    return '.sheet-' + hashlib.sha256(sheet_name.encode('utf-8')).hexdigest()[:12]
+
+
+def artifact_path(file, filename):
+    """Path of a derived file in the artifact directory of a blob.
+
+    Each sheet of a workbook has its own directory. Returns None for files
+    stored before content addressing. The directory is created on demand.
+    """
+    if not file.storage_path:
+        return None
+    directory = os.path.join(current_app.config['UPLOAD_FOLDER'],
+                             file.storage_path + sheet_suffix(file.sheet_name) + ARTIFACTS_SUFFIX)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def params_digest(params):
+    """sha256 of the canonical JSON of a parameter dict"""
+    encoded = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _artifact_path(file, name, params):
+    if params is not None:
+        name = f'{name}-{params_digest(params)[:16]}'
+    return artifact_path(file, name + '.json')
+
+
+def cached_artifact(file, name, compute, params=None, refresh=False):
+    """Return a JSON-serializable result derived from a file's content.
+
+    The result is computed with ``compute()`` the first time any file with
+    the same content asks for ``name`` with the same ``params`` and read
+    back from disk afterwards; ``refresh`` computes and stores it again.
+    Files stored before content addressing have no blob and are always
+    computed.
+    """
+    path = _artifact_path(file, name, params)
+    if path is not None and not refresh and os.path.exists(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable artifact {path}: {e}")
+
+    value = compute()
+    if path is None:
+        return value
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not store artifact {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return value
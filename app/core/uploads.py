@@ -0,0 +1,197 @@
+"""Resumable chunked uploads.
+
+A client opens an ``UploadSession``, sends the file in chunks that are
+written straight to ``UPLOAD_FOLDER/partial/<id>.part``, and finalizes with
+the sha256 of the whole file. Hashing the file, moving it into the blob
+store (see ``app.core.storage``) and ingesting it run on a background
+thread, so no request holds a worker for the whole file. A dropped
+connection only costs the chunk in flight: the session reports how many
+bytes were received and the client resumes from there. A checksum mismatch
+puts the session back to ``uploading`` at offset 0, with the mismatch as
+its ``error``.
+
+Ingestion threads die with their worker process. A session still
+processing ``UPLOAD_PROCESSING_TIMEOUT`` seconds after ingestion started is
+reported as failed, and a result that arrives after that is dropped.
+"""
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.core.ingest import prepare_financial_file
+from app.core.models import FinancialFile, UploadSession
+from app.core.sheets import add_sheet_files
+from app.core.storage import HASH_CHUNK_SIZE, file_sha256, place_blob
+
+PARTIAL_FOLDER = 'partial'
+
+
+class UploadError(Exception):
+    """A request that does not fit the state of an upload session"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def partial_path(session):
+    """Path of the file an upload session is being written to"""
+    folder = os.path.join(current_app.config['UPLOAD_FOLDER'], PARTIAL_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f'{session.id}.part')
+
+
+def create_upload(user_id, filename, file_type, total_size=None):
+    """Open an upload session and create its empty partial file"""
+    if total_size is not None and total_size > current_app.config['MAX_UPLOAD_SIZE']:
+        raise UploadError('File is larger than the upload limit', 413)
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename,
+        file_type=file_type,
+        total_size=total_size,
+        received_bytes=0,
+        status='uploading'
+    )
+    open(partial_path(session), 'wb').close()
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def append_chunk(session, offset, stream):
+    """Write a chunk at ``offset``, which must equal the bytes received so far.
+
+    A mismatching offset raises a 409 so the client can resume from
+    ``received_bytes``. The session row stays locked until the chunk is
+    written, so of two requests sending the same offset the second one
+    waits and then gets the 409. Returns the new number of received bytes.
+    """
+    db.session.refresh(session, with_for_update=True)
+    if session.status != 'uploading':
+        raise UploadError(f'Upload is {session.status}', 409)
+    if offset != session.received_bytes:
+        raise UploadError(f'Expected offset {session.received_bytes}', 409)
+
+    limit = session.total_size if session.total_size is not None else current_app.config['MAX_UPLOAD_SIZE']
+    written = 0
+    with open(partial_path(session), 'r+b') as f:
+        # Drop anything past the offset left by an interrupted chunk
+        f.truncate(offset)
+        f.seek(offset)
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+            written += len(chunk)
+            if offset + written > limit:
+                f.truncate(offset)
+                raise UploadError('Chunk runs past the end of the file', 413)
+            f.write(chunk)
+
+    session.received_bytes = offset + written
+    db.session.commit()
+    return session.received_bytes
+
+
+def finalize_upload(session, checksum):
+    """Hand the assembled file to verification and ingestion.
+
+    The file is checked against ``checksum``, moved into the blob store and
+    a ``FinancialFile`` is created once ingestion has finished; poll the
+    session for ``status``, ``file_id`` and ``error``.
+    """
+    db.session.refresh(session, with_for_update=True)
+    if session.status != 'uploading':
+        raise UploadError(f'Upload is {session.status}', 409)
+    if session.total_size is not None and session.received_bytes != session.total_size:
+        raise UploadError(f'Received {session.received_bytes} of {session.total_size} bytes')
+
+    session.status = 'processing'
+    session.processing_started = datetime.utcnow()
+    session.error = None
+    db.session.commit()
+
+    if current_app.config['INGEST_IN_BACKGROUND']:
+        app = current_app._get_current_object()
+        thread = threading.Thread(target=_run_ingestion, args=(app, session.id, checksum),
+                                  name=f'ingest-{session.id}', daemon=True)
+        thread.start()
+    else:
+        ingest_upload(session, checksum)
+
+
+def _run_ingestion(app, session_id, checksum):
+    with app.app_context():
+        ingest_upload(UploadSession.query.get(session_id), checksum)
+        db.session.remove()
+
+
+def ingest_upload(session, checksum):
+    """Verify a finalized upload session, then create and prepare its FinancialFile"""
+    try:
+        path = partial_path(session)
+        content_hash = file_sha256(path)
+        if content_hash != (checksum or '').lower():
+            # Keep the session open; the client can re-send from offset 0
+            session.status = 'uploading'
+            session.received_bytes = 0
+            session.processing_started = None
+            session.error = 'Checksum mismatch, upload the file again'
+            open(path, 'wb').close()
+            db.session.commit()
+            return
+        session.content_hash = content_hash
+        session.storage_path = place_blob(path, content_hash, session.file_type)
+        db.session.commit()
+
+        new_file = FinancialFile(
+            filename=session.filename,
+            file_type=session.file_type,
+            content_hash=session.content_hash,
+            storage_path=session.storage_path,
+            user_id=session.user_id
+        )
+        prepare_financial_file(new_file)
+        db.session.refresh(session, ['status'])
+        if session.status != 'processing':
+            current_app.logger.warning(f"Upload {session.id} finished ingestion after it was marked {session.status}")
+            return
+        db.session.add(new_file)
+        db.session.flush()
+        add_sheet_files(new_file)
+        session.file_id = new_file.id
+        session.status = 'complete'
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Could not ingest upload {session.id}: {str(e)}")
+        session.status = 'failed'
+        session.error = str(e)
+        db.session.commit()
+
+
+def _is_stale(session):
+    timeout = timedelta(seconds=current_app.config['UPLOAD_PROCESSING_TIMEOUT'])
+    return (session.status == 'processing' and session.processing_started is not None
+            and session.processing_started < datetime.utcnow() - timeout)
+
+
+def upload_status(session):
+    """JSON-serializable state of an upload session"""
+    if _is_stale(session):
+        session.status = 'failed'
+        session.error = 'Processing the upload stopped; please upload the file again'
+        db.session.commit()
+    return {
+        'upload_id': session.id,
+        'filename': session.filename,
+        'status': session.status,
+        'received_bytes': session.received_bytes,
+        'total_size': session.total_size,
+        'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE'],
+        'file_id': session.file_id,
+        'error': session.error,
+    }
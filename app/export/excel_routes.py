@@ -6,6 +6,9 @@ from flask import send_file, flash, redirect, url_for, current_app
 from flask_login import login_required, current_user
 from app.export import excel_only_bp
 from app.core.models import FinancialFile, Analysis
+from app.core.ingest import is_streamed
+from app.core.loader import load_financial_frame
+from app.core.profile import ensure_profile
 import pandas as pd
 import os
 from datetime import datetime
@@ -31,9 +34,13 @@ def export_analysis_excel(file_id):
             flash('Access denied')
             return redirect(url_for('core.dashboard'))
         
+        # Streamed files are too large to load, let alone to fit in a sheet
+        if is_streamed(file):
+            flash(f'{file.filename} is too large to export row by row')
+            return redirect(url_for('core.view_file', file_id=file_id))
+        
         # Get file data
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-        df = pd.read_csv(file_path) if file.file_type == 'csv' else pd.read_excel(file_path)
+        df = load_financial_frame(file)
         
         # Get latest analysis
         analysis = Analysis.query.filter_by(file_id=file_id).order_by(Analysis.created_date.desc()).first()
@@ -92,17 +99,16 @@ def export_comparison_excel(file_ids):
         
         with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
             for i, file in enumerate(files):
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-                df = pd.read_csv(file_path) if file.file_type == 'csv' else pd.read_excel(file_path)
+                if is_streamed(file):
+                    # Sheets cannot hold a streamed file; its row count is still summarized
+                    continue
+                df = load_financial_frame(file)
                 df.to_excel(writer, sheet_name=f'File {i+1}', index=False)
                 
             # Summary sheet
             summary = pd.DataFrame({
                 'Filename': [f.filename for f in files],
-                'Row Count': [pd.read_csv(os.path.join(current_app.config['UPLOAD_FOLDER'], f.filename)).shape[0] 
-                            if f.file_type == 'csv' else 
-                            pd.read_excel(os.path.join(current_app.config['UPLOAD_FOLDER'], f.filename)).shape[0] 
-                            for f in files]
+                'Row Count': [ensure_profile(f)['rows'] for f in files]
             })
             summary.to_excel(writer, sheet_name='Summary', index=False)
             
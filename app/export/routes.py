@@ -1,12 +1,18 @@
-from flask import render_template, make_response, request, current_app, send_file, jsonify
+from flask import render_template, make_response, request, current_app, send_file, jsonify, flash, redirect, url_for
 from flask_login import login_required, current_user
 import io
 import csv
 import tempfile
 import os
 from datetime import datetime
-from app.export import bp
+from app.export import bp, weasyprint_available
+from app.export.service import ExportService
+from app.analysis.jobs import analysis_charts
+from app.core.charts import chart_file_url
 from app.core.models import FinancialFile, Analysis
+from app.core.ingest import is_streamed, load_row_frame
+from app.core.loader import load_financial_frame
+from app.core.profile import ensure_profile
 import pandas as pd
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill
@@ -28,11 +34,13 @@ def export_analysis_pdf(file_id):
             flash('No analysis found for this file')
             return redirect(url_for('core.view_file', file_id=file_id))
         
-        # Generate PDF
+        # Generate PDF from the charts already rendered for the page
+        charts, _ = analysis_charts(analysis)
         pdf = ExportService.generate_pdf_report(
             'export/analysis_report.html',
             file=file,
             analysis=analysis,
+            charts={column: chart_file_url(key) for column, key in charts.items()},
             date=datetime.now()
         )
         
@@ -56,9 +64,13 @@ def export_analysis_excel(file_id):
             flash('Access denied')
             return redirect(url_for('core.dashboard'))
         
+        # Streamed files are too large to load, let alone to fit in a sheet
+        if is_streamed(file):
+            flash(f'{file.filename} is too large to export row by row')
+            return redirect(url_for('core.view_file', file_id=file_id))
+        
         # Get file data
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-        df = pd.read_csv(file_path) if file.file_type == 'csv' else pd.read_excel(file_path)
+        df = load_financial_frame(file)
         
         # Get latest analysis
         analysis = Analysis.query.filter_by(file_id=file_id).order_by(Analysis.created_date.desc()).first()
@@ -136,17 +148,16 @@ def export_comparison_excel(file_ids):
             
             with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
                 for i, file in enumerate(files):
-                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-                    df = pd.read_csv(file_path) if file.file_type == 'csv' else pd.read_excel(file_path)
+                    if is_streamed(file):
+                        # Sheets cannot hold a streamed file; its row count is still summarized
+                        continue
+                    df = load_financial_frame(file)
                     df.to_excel(writer, sheet_name=f'File {i+1}', index=False)
                     
                 # Summary sheet
                 summary = pd.DataFrame({
                     'Filename': [f.filename for f in files],
-                    'Row Count': [pd.read_csv(os.path.join(current_app.config['UPLOAD_FOLDER'], f.filename)).shape[0] 
-                                if f.file_type == 'csv' else 
-                                pd.read_excel(os.path.join(current_app.config['UPLOAD_FOLDER'], f.filename)).shape[0] 
-                                for f in files]
+                    'Row Count': [ensure_profile(f)['rows'] for f in files]
                 })
                 summary.to_excel(writer, sheet_name='Summary', index=False)
                 
@@ -163,13 +174,12 @@ def export_comparison_excel(file_ids):
             # Load data for comparison
             dataframes = []
             for file in files:
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
-                df = pd.read_csv(file_path) if file.file_type == 'csv' else pd.read_excel(file_path)
+                df = load_row_frame(file)
                 dataframes.append(df)
                 
             # Get comparison data
             from app.comparison.service import ComparisonService
-            comparison = ComparisonService(dataframes)
+            comparison = ComparisonService(dataframes, [ensure_profile(file) for file in files])
             comparison_data = {
                 'summary_stats': comparison.compare_summary_statistics(),
                 'differences': comparison.calculate_differences()
@@ -317,11 +327,13 @@ def export_analysis(analysis_id, format):
     filename_prefix = f"FinGenius_Analysis_{datetime.now().strftime('%Y%m%d')}"
     
     if format == 'pdf':
-        # Render HTML for PDF
+        # Render HTML for PDF, with the charts already rendered for the page
+        charts, _ = analysis_charts(analysis)
         html = render_template('export/analysis_report.html', 
                                user=current_user, 
                                file=file,
                                analysis=analysis,
+                               charts={column: chart_file_url(key) for column, key in charts.items()},
                                timestamp=datetime.now().strftime("%Y-%m-%d %H:%M"))
         
         # Generate PDF
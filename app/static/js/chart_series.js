@@ -0,0 +1,85 @@
+/**
+ * Chart Series for FinGenius
+ * Draws Chart.js charts from the JSON series of the chart-series API
+ * ({labels, datasets: [{label, data}]}) instead of server-drawn images
+ */
+
+const FinGeniusSeries = {
+    /**
+     * Fetch a series and pass it to a callback
+     * @param {string} url - The series endpoint
+     * @param {Function} callback - Called with the parsed series
+     */
+    fetch: function(url, callback) {
+        fetch(url, {credentials: 'same-origin'})
+            .then(response => response.json())
+            .then(callback)
+            .catch(error => console.error(`Error loading chart data from ${url}:`, error));
+    },
+
+    /**
+     * Draw a line chart on a canvas
+     * @param {string} canvasId - The ID of the canvas element
+     * @param {Array} labels - The x axis labels
+     * @param {Array} datasets - [{label, data}] with null for missing points
+     */
+    lineChart: function(canvasId, labels, datasets) {
+        const canvas = document.getElementById(canvasId);
+        if (!canvas) {
+            return null;
+        }
+        return new Chart(canvas, {
+            type: 'line',
+            data: {
+                labels: labels,
+                datasets: datasets.map(dataset => ({
+                    label: dataset.label,
+                    data: dataset.data,
+                    borderWidth: 1.5,
+                    pointRadius: 0,
+                    spanGaps: true
+                }))
+            },
+            options: {
+                animation: false,
+                interaction: {mode: 'index', intersect: false},
+                plugins: {legend: {display: datasets.length > 1}}
+            }
+        });
+    },
+
+    /**
+     * Fill a table with a correlation matrix, shading cells by strength
+     * @param {string} tableId - The ID of an empty table element
+     * @param {Object} correlation - {columns, matrix}
+     */
+    correlationTable: function(tableId, correlation) {
+        const table = document.getElementById(tableId);
+        if (!table || !correlation.columns.length) {
+            return;
+        }
+        const header = table.createTHead().insertRow();
+        header.appendChild(document.createElement('th'));
+        correlation.columns.forEach(column => {
+            const th = document.createElement('th');
+            th.textContent = column;
+            header.appendChild(th);
+        });
+        const body = table.createTBody();
+        correlation.matrix.forEach((values, i) => {
+            const row = body.insertRow();
+            const th = document.createElement('th');
+            th.textContent = correlation.columns[i];
+            row.appendChild(th);
+            values.forEach(value => {
+                const cell = row.insertCell();
+                cell.textContent = value === null ? '' : value.toFixed(2);
+                if (value !== null) {
+                    const alpha = Math.min(Math.abs(value), 1) * 0.6;
+                    cell.style.backgroundColor = value >= 0 ?
+                        `rgba(25, 135, 84, ${alpha})` : `rgba(220, 53, 69, ${alpha})`;
+                }
+            });
+        });
+    }
+};
@@ -24,8 +24,48 @@ class Config:
     # Ensure upload directory exists
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     
-    # Maximum upload file size
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB
+    # Maximum request size, and so of a file sent through the upload form.
+    # Larger files go through the resumable upload API, whose chunks stay
+    # under this limit, and large CSVs are then ingested in chunks
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16 MB
+    
+    # CSV uploads above this size are ingested in chunks (see app.core.ingest)
+    STREAMING_INGEST_THRESHOLD = int(os.environ.get('STREAMING_INGEST_THRESHOLD', 64 * 1024 * 1024))
+    INGEST_CHUNK_ROWS = int(os.environ.get('INGEST_CHUNK_ROWS', 100000))
+    
+    # Resumable uploads (see app.core.uploads): each chunk request stays
+    # under MAX_CONTENT_LENGTH, the assembled file under MAX_UPLOAD_SIZE
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 10 * 1024 * 1024 * 1024))  # 10 GB
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    # Run ingestion of finalized uploads on a background thread; uploads
+    # still processing after UPLOAD_PROCESSING_TIMEOUT seconds are reported
+    # as failed
+    INGEST_IN_BACKGROUND = os.environ.get('INGEST_IN_BACKGROUND', 'true').lower() == 'true'
+    UPLOAD_PROCESSING_TIMEOUT = int(os.environ.get('UPLOAD_PROCESSING_TIMEOUT', 60 * 60))
+    
+    # Analyses run as jobs on a pool of threads in each worker process (see
+    # app.analysis.jobs); jobs with no progress for ANALYSIS_JOB_TIMEOUT
+    # seconds are reported as failed
+    ANALYSIS_IN_BACKGROUND = os.environ.get('ANALYSIS_IN_BACKGROUND', 'true').lower() == 'true'
+    ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 2))
+    ANALYSIS_JOB_TIMEOUT = int(os.environ.get('ANALYSIS_JOB_TIMEOUT', 15 * 60))
+    
+    # Charts are drawn on a pool of CHART_WORKERS processes per worker (see
+    # app.core.render); 0 draws them in the requesting thread. Every gunicorn
+    # worker starts its own pool, so a host runs gunicorn workers (2 x CPUs + 1
+    # in gunicorn.conf.py) times CHART_WORKERS chart processes; raise it only
+    # with few gunicorn workers, keeping the product near the CPU count
+    CHART_WORKERS = int(os.environ.get('CHART_WORKERS', 1))
+    CHART_RENDER_TIMEOUT = int(os.environ.get('CHART_RENDER_TIMEOUT', 120))
+    
+    # Forecast models are backtested in parallel on a pool of BACKTEST_WORKERS
+    # processes per worker (see app.analysis.backtest); 0 runs them in turn.
+    # Pools are per gunicorn worker and multiply like CHART_WORKERS
+    BACKTEST_WORKERS = int(os.environ.get('BACKTEST_WORKERS', 1))
+    
+    # Parsed DataFrame cache (per worker process)
+    FRAME_CACHE_MAX_ENTRIES = int(os.environ.get('FRAME_CACHE_MAX_ENTRIES', 16))
+    FRAME_CACHE_MAX_BYTES = int(os.environ.get('FRAME_CACHE_MAX_BYTES', 256 * 1024 * 1024))
     
     # Integration config
     DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY')
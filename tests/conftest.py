@@ -1,5 +1,7 @@
+import io
 import os
 import tempfile
+import pandas as pd
 import pytest
 from app import create_app, db
 from app.core.models import User, FinancialFile
@@ -10,6 +12,8 @@ class TestConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite://'
     UPLOAD_FOLDER = tempfile.mkdtemp()
     WTF_CSRF_ENABLED = False
+    CHART_WORKERS = 0
+    BACKTEST_WORKERS = 0
 
 @pytest.fixture
 def app():
@@ -62,3 +66,37 @@ def test_file(app, test_user):
     db.session.add(file)
     db.session.commit()
     return file
+
+@pytest.fixture
+def upload(auth_client):
+    """Upload a file through the upload form and return its FinancialFile.
+    
+    ``data`` may be text, bytes or a DataFrame, which is sent as CSV.
+    """
+    def upload(data, filename='ledger.csv'):
+        if isinstance(data, pd.DataFrame):
+            data = data.to_csv(index=False)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        auth_client.post('/upload', data={'file': (io.BytesIO(data), filename)},
+                         content_type='multipart/form-data')
+        return FinancialFile.query.filter_by(filename=filename).order_by(FinancialFile.id.desc()).first()
+    return upload
+
+@pytest.fixture
+def append(auth_client):
+    """Append CSV text to an uploaded file through the API and return the response."""
+    def append(file_id, data, **form):
+        return auth_client.post(f'/api/file/{file_id}/append',
+                                data=dict(form, file=(io.BytesIO(data.encode('utf-8')), 'new.csv')),
+                                content_type='multipart/form-data')
+    return append
+
+@pytest.fixture
+def start_upload(auth_client):
+    """Open a resumable upload session and return its id."""
+    def start_upload(size, filename='ledger.csv'):
+        response = auth_client.post('/api/uploads', json={'filename': filename, 'size': size})
+        assert response.status_code == 201
+        return response.get_json()['upload_id']
+    return start_upload
@@ -1,6 +1,14 @@
+import pytest
 import pandas as pd
 import numpy as np
+from app.analysis import jobs, service
+from app.analysis.backtest import best_models, run_backtest
+from app.analysis.forecasting import evaluate_state, linear_forecast, smoothing_forecast
+from app.analysis.jobs import analysis_charts
 from app.analysis.service import FinancialAnalyzer
+from app.analysis.ratios import aggregate_ratios
+from app.core.models import Analysis, AnalysisJob, ForecastModel
+from app.core.render import ChartRenderer, render_chart
 
 def test_financial_ratios():
     """Test financial ratio calculations."""
@@ -15,10 +23,10 @@ def test_financial_ratios():
     
     ratios = analyzer.calculate_financial_ratios()
     
-    assert 'profit_margin' in ratios
-    assert abs(ratios['profit_margin'] - 0.115) < 0.01  # ~11.5%
-    assert 'roa' in ratios
-    assert abs(ratios['roa'] - 0.061) < 0.01  # ~6.1%
+    # Income over the whole period against the latest balance sheet
+    assert abs(ratios['profit_margin'] - 375 / 3300) < 1e-12
+    assert abs(ratios['roa'] - 375 / 2050) < 1e-12
+    assert abs(ratios['roe'] - 375 / 1550) < 1e-12
 
 def test_trend_analysis():
     """Test trend identification."""
@@ -47,3 +55,267 @@ def test_forecasting():
     
     assert len(forecast) == 2
     assert all(forecast['forecast'] > 1400)  # Forecasted values should continue trend
+
+def test_ratio_series_and_current_values():
+    """Test ratios are computed per period and aggregated by role kind."""
+    df = pd.DataFrame({
+        'revenue': [1000, 0, 1100],
+        'net income': [100, 150, 125],
+        'current assets': [500, 600, np.nan],
+        'current liabilities': [250, 300, 400],
+    })
+    analyzer = FinancialAnalyzer(df)
+    
+    series = analyzer.ratio_series()
+    
+    # a zero revenue or a missing value leaves that period undefined
+    assert series['profit_margin'].isna().tolist() == [False, True, False]
+    assert abs(series['profit_margin'].iloc[2] - 125 / 1100) < 1e-12
+    assert series['current_ratio'].isna().tolist() == [False, False, True]
+    assert 'roa' not in series
+    
+    current = aggregate_ratios(df, analyzer.roles)
+    assert abs(current['profit_margin'] - 375 / 2100) < 1e-12
+    # the latest balance sheet values are used: 600 / 400
+    assert current['current_ratio'] == 1.5
+
+def test_analysis_runs_as_job(auth_client, app, upload):
+    """Test analyzing a file queues a job whose stored output renders the results."""
+    app.config['ANALYSIS_IN_BACKGROUND'] = False
+    data = 'date,revenue,net income\n2023-01-01,1000,100\n2023-02-01,1200,150\n'
+    file = upload(data, 'pl.csv')
+    
+    response = auth_client.post(f'/api/analysis/{file.id}/jobs')
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    
+    status = auth_client.get(f'/api/analysis-jobs/{job_id}').get_json()
+    assert status['status'] == 'complete'
+    assert status['progress'] == 100
+    job = AnalysisJob.query.get(job_id)
+    assert job.analysis.results['financial_ratios']['profit_margin'] > 0
+    
+    page = auth_client.get(f'/analysis/jobs/{job_id}/results')
+    assert page.status_code == 200
+    assert b'Profit Margin' in page.data
+
+def test_stale_job_result_is_dropped(auth_client, app, monkeypatch, upload):
+    """Test a job reported as failed while it ran does not store its late result."""
+    app.config['ANALYSIS_IN_BACKGROUND'] = False
+    data = 'date,revenue,net income\n2023-01-01,1000,100\n2023-02-01,1200,150\n'
+    file = upload(data, 'slow.csv')
+    
+    compute = jobs.compute_financial_metrics
+    def stalled(*args, **kwargs):
+        result = compute(*args, **kwargs)
+        # job_status gave up on the job from another request meanwhile
+        AnalysisJob.query.filter_by(status='running').update({'status': 'failed', 'error': 'stalled'})
+        jobs.db.session.commit()
+        return result
+    monkeypatch.setattr(jobs, 'compute_financial_metrics', stalled)
+    
+    job_id = auth_client.post(f'/api/analysis/{file.id}/jobs').get_json()['job_id']
+    job = AnalysisJob.query.get(job_id)
+    assert job.status == 'failed'
+    assert job.result is None
+    assert Analysis.query.filter_by(file_id=file.id).count() == 0
+
+def test_charts_served_by_key(auth_client, app, upload):
+    """Test analysis charts are stored once and served with a long-lived ETag."""
+    app.config['ANALYSIS_IN_BACKGROUND'] = False
+    data = 'date,revenue,net income\n2023-01-01,1000,100\n2023-02-01,1200,150\n'
+    file = upload(data, 'charts.csv')
+    
+    job_id = auth_client.post(f'/api/analysis/{file.id}/jobs').get_json()['job_id']
+    charts, correlation_key = analysis_charts(AnalysisJob.query.get(job_id).analysis)
+    key = charts['revenue']
+    assert correlation_key
+    
+    response = auth_client.get(f'/charts/{key}.png')
+    assert response.status_code == 200
+    assert response.data.startswith(b'\x89PNG')
+    assert response.headers['ETag'] == f'"{key}"'
+    assert 'immutable' in response.headers['Cache-Control']
+    
+    cached = auth_client.get(f'/charts/{key}.png', headers={'If-None-Match': f'"{key}"'})
+    assert cached.status_code == 304
+
+def test_chart_renderer_pool():
+    """Test charts drawn on the process pool match those drawn in-process and are counted."""
+    charts = [('comparison', {'column': 'revenue', 'series': [np.arange(5.0), None],
+                              'positions': [np.arange(5), None]}),
+              ('correlation', {'columns': ['a', 'b'], 'matrix': np.array([[1.0, 0.5], [0.5, 1.0]])})]
+    renderer = ChartRenderer(max_workers=2)
+    try:
+        pngs = renderer.render_many(charts)
+    finally:
+        renderer.shutdown()
+    
+    assert pngs == [render_chart(kind, payload) for kind, payload in charts]
+    stats = renderer.stats()
+    assert stats['renders'] == 2
+    assert stats['renders_per_second'] > 0
+
+def test_chart_series_api(auth_client, app, upload):
+    """Test the results page charts from downsampled JSON series instead of images."""
+    app.config['ANALYSIS_IN_BACKGROUND'] = False
+    rows = ''.join(f'2023-01-{day:02d},{1000 + day},{day}\n' for day in range(1, 31))
+    data = 'date,revenue,net income\n' + rows
+    file = upload(data, 'series.csv')
+    
+    job_id = auth_client.post(f'/api/analysis/{file.id}/jobs').get_json()['job_id']
+    page = auth_client.get(f'/analysis/jobs/{job_id}/results')
+    assert b'data:image/png' not in page.data
+    assert b'seriesChart0' in page.data
+    
+    series = auth_client.get(f'/api/file/{file.id}/series?column=revenue&max_points=10').get_json()
+    assert series['points'] == 30
+    assert len(series['labels']) == 10
+    assert series['labels'][0] == '2023-01-01' and series['labels'][-1] == '2023-01-30'
+    assert series['datasets'][0]['data'][0] == 1001
+    
+    correlation = auth_client.get(f'/api/file/{file.id}/correlation').get_json()
+    assert correlation['columns'] == ['revenue', 'net income']
+    assert correlation['matrix'][0][1] == pytest.approx(1.0)
+
+def test_forecast_all_columns_with_intervals():
+    """Test every numeric column is forecast at once with intervals around the trend."""
+    df = pd.DataFrame({
+        'revenue': [1000, 1110, 1190, 1305, 1398, 1502],
+        'costs': [500, np.nan, 520, 530, 545, 548],
+        'flat': [7, 7, 7, 7, 7, 7],
+    })
+    forecasts = {column: pd.DataFrame(result['forecast'])
+                 for column, result in FinancialAnalyzer(df).forecast_all(periods=3).items()}
+    
+    assert set(forecasts) == {'revenue', 'costs', 'flat'}
+    revenue = forecasts['revenue']
+    assert (revenue['lower'] < revenue['forecast']).all() and (revenue['forecast'] < revenue['upper']).all()
+    # intervals widen further from the data
+    assert (np.diff(revenue['upper'] - revenue['lower']) > 0).all()
+    assert forecasts['flat']['forecast'].tolist() == [7, 7, 7]
+    
+    # the masked fit of a column with a gap matches a fit of its observed rows
+    x = np.array([0, 2, 3, 4, 5])
+    slope, intercept = np.polyfit(x, df['costs'].dropna(), 1)
+    assert forecasts['costs']['forecast'].iloc[0] == pytest.approx(intercept + slope * 6)
+    
+    # two values give a forecast but no interval
+    fit = linear_forecast([[1.0], [2.0]], periods=1)
+    assert fit['forecast'][0, 0] == pytest.approx(3.0)
+    assert np.isnan(fit['lower'][0, 0])
+
+def test_holt_winters_model_selection(auth_client, upload):
+    """Test automatic model choice finds seasonality and the forecast API serves it."""
+    rng = np.random.default_rng(1)
+    t = np.arange(48)
+    season = np.tile([10, 12, 15, 20, 18, 14, 11, 9, 8, 10, 13, 25], 4)
+    additive = 100 + 2 * t + season + rng.normal(0, 1, 48)
+    level = 50 + rng.normal(0, 2, 48)
+    
+    fit = smoothing_forecast(np.column_stack([additive, level]), periods=12, season_length=12)
+    assert fit['model'] == ['holt_winters', 'simple']
+    expected = 100 + 2 * np.arange(48, 60) + season[:12]
+    assert np.abs(fit['forecast'][:, 0] - expected).max() < 3
+    assert (fit['lower'][:, 0] < fit['forecast'][:, 0]).all()
+    
+    dates = pd.date_range('2020-01-01', periods=48, freq='MS').strftime('%Y-%m-%d')
+    data = pd.DataFrame({'date': dates, 'revenue': additive.round(2)}).to_csv(index=False)
+    file = upload(data, 'seasonal.csv')
+    
+    response = auth_client.get(f'/api/file/{file.id}/forecast?periods=6&column=revenue')
+    assert response.status_code == 200
+    revenue = response.get_json()['forecasts']['revenue']
+    assert revenue['model'] == 'holt_winters'
+    assert revenue['params']['season_length'] == 12
+    assert len(revenue['forecast']) == 6
+    assert auth_client.get(f'/api/file/{file.id}/forecast?model=arima').status_code == 400
+
+def test_backtest_picks_default_model(auth_client, upload):
+    """Test the rolling-origin backtest scores every model and sets the default forecast model."""
+    rng = np.random.default_rng(2)
+    t = np.arange(40)
+    trend = 10 + 3 * t + rng.normal(0, 0.5, 40)
+    flat = 50 + rng.normal(0, 2, 40)
+    
+    result = run_backtest(np.column_stack([trend, flat]), horizon=3, origins=6)
+    assert result['origins'] == 6
+    assert 'holt_winters' not in result['models']
+    assert result['models']['linear']['mase'][0] < result['models']['simple']['mase'][0]
+    assert best_models(result, ['trend', 'flat'])['trend'] in ('linear', 'holt', 'damped')
+    assert run_backtest(trend[:8], horizon=3)['origins'] == 0
+    
+    dates = pd.date_range('2020-01-01', periods=40, freq='MS').strftime('%Y-%m-%d')
+    data = pd.DataFrame({'date': dates, 'trend': trend.round(2)}).to_csv(index=False)
+    file = upload(data, 'trend.csv')
+    
+    response = auth_client.get(f'/api/file/{file.id}/backtest')
+    assert response.status_code == 200
+    backtest = response.get_json()
+    assert backtest['version'] == file.version
+    scores = backtest['columns']['trend']
+    assert set(scores['models']) >= {'linear', 'simple', 'holt_winters'}
+    
+    forecast = auth_client.get(f'/api/file/{file.id}/forecast?column=trend').get_json()['forecasts']['trend']
+    assert forecast['model'] == scores['best']
+    assert forecast['selection'] == 'backtest'
+
+def test_forecast_models_stored_per_version(auth_client, monkeypatch, upload, append):
+    """Test fitted models are stored, reused for other horizons and dropped by an append."""
+    rng = np.random.default_rng(3)
+    values = 100 + 2 * np.arange(36) + np.tile([5, 9, 14, 3], 9) + rng.normal(0, 1, 36)
+    
+    fit = smoothing_forecast(values, periods=8, model='holt_winters', season_length=4)
+    path = evaluate_state(fit['states'][0], periods=8)
+    assert np.allclose(path['forecast'], fit['forecast'][:, 0])
+    assert np.allclose(path['upper'], fit['upper'][:, 0])
+    
+    dates = pd.date_range('2015-01-01', periods=36, freq='QS').strftime('%Y-%m-%d')
+    data = pd.DataFrame({'date': dates, 'revenue': values.round(2)}).to_csv(index=False)
+    file = upload(data, 'quarters.csv')
+    
+    first = auth_client.get(f'/api/file/{file.id}/forecast?periods=4&model=holt').get_json()
+    rows = ForecastModel.query.filter_by(file_id=file.id, model='holt').all()
+    assert [row.column for row in rows] == ['revenue']
+    
+    def no_refit(*args):
+        raise AssertionError('stored models should be reused')
+    monkeypatch.setattr(service, 'get_analyzer', no_refit)
+    longer = auth_client.get(f'/api/file/{file.id}/forecast?periods=8&model=holt&level=0.8').get_json()
+    assert longer['forecasts']['revenue']['forecast'][:4] != first['forecasts']['revenue']['forecast']
+    assert [row['forecast'] for row in longer['forecasts']['revenue']['forecast'][:4]] == \
+        [row['forecast'] for row in first['forecasts']['revenue']['forecast']]
+    monkeypatch.undo()
+    
+    append(file.id, 'date,revenue\n2024-01-01,190\n')
+    assert ForecastModel.query.filter_by(file_id=file.id).count() == 0
+    refit = auth_client.get(f'/api/file/{file.id}/forecast?periods=4&model=holt').get_json()
+    assert refit['version'] == 2
+    assert ForecastModel.query.filter_by(file_id=file.id, version=2).count() == 1
+
+def test_analysis_reused_until_recomputed(auth_client, app, upload, append):
+    """Test a repeated analysis returns the stored job and only recompute runs it again."""
+    app.config['ANALYSIS_IN_BACKGROUND'] = False
+    data = 'date,revenue,net income\n2023-01-01,1000,100\n2023-02-01,1200,150\n'
+    file = upload(data, 'reuse.csv')
+    
+    first = auth_client.post(f'/api/analysis/{file.id}/jobs')
+    assert first.status_code == 202
+    job_id = first.get_json()['job_id']
+    
+    again = auth_client.get(f'/analysis/analyze/{file.id}')
+    assert again.headers['Location'].endswith(f'/jobs/{job_id}')
+    repeat = auth_client.post(f'/api/analysis/{file.id}/jobs').get_json()
+    assert repeat['job_id'] == job_id
+    assert repeat['status'] == 'complete'
+    
+    recomputed = auth_client.post(f'/analysis/analyze/{file.id}', data={'recompute': '1'})
+    assert not recomputed.headers['Location'].endswith(f'/jobs/{job_id}')
+    assert AnalysisJob.query.filter_by(file_id=file.id).count() == 2
+    analyses = Analysis.query.filter_by(file_id=file.id, analysis_type='financial_metrics').all()
+    assert len(analyses) == 1
+    assert analyses[0].version == file.version
+    
+    append(file.id, 'date,revenue,net income\n2023-03-01,1300,160\n')
+    assert auth_client.post(f'/api/analysis/{file.id}/jobs').get_json()['job_id'] != job_id
+    assert Analysis.query.filter_by(file_id=file.id, analysis_type='financial_metrics').count() == 2
@@ -0,0 +1,115 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from app.analysis.service import FinancialAnalyzer, get_analyzer
+from app.core.loader import load_financial_frame
+from app.core.ingest import load_ingest_state, load_stream_frames
+from app.core.profile import build_profile
+from app.core.schema import role_columns
+
+LEDGER = (
+    'date,revenue,total_assets\n'
+    '2023-01-05,100,1000\n'
+    '2023-01-20,150,1100\n'
+    '2023-02-03,200,1200\n'
+)
+NEW_ROWS = (
+    'date,revenue,total_assets\n'
+    '2023-02-25,50.5,1150\n'
+    '2023-03-10,300,1300\n'
+)
+
+def test_append_updates_profile_incrementally(auth_client, app, upload, append):
+    """Test appended rows update statistics and rollups to match a full recompute."""
+    file = upload(LEDGER)
+    old_path = file.storage_path
+    
+    response = append(file.id, NEW_ROWS, version=1)
+    
+    assert response.status_code == 200
+    assert response.get_json()['appended_rows'] == 2
+    assert file.version == 2
+    assert file.storage_path != old_path
+    
+    df = load_financial_frame(file)
+    assert len(df) == 5
+    expected = build_profile(pd.read_csv(io.StringIO(LEDGER + NEW_ROWS.split('\n', 1)[1])))
+    for metric in ('count', 'mean', 'std', 'min', 'max'):
+        assert np.isclose(file.profile['stats']['revenue'][metric], expected['stats']['revenue'][metric])
+    
+    _, rollup = load_ingest_state(file)
+    result = rollup.result()
+    assert result['revenue'].tolist() == [250, 250.5, 300]
+    assert result['total_assets'].tolist() == [1100, 1150, 1300]
+
+def test_append_to_streamed_file_updates_rollup(auth_client, app, upload, append):
+    """Test appending to a file ingested in chunks extends its monthly rollup."""
+    app.config['STREAMING_INGEST_THRESHOLD'] = 0
+    app.config['INGEST_CHUNK_ROWS'] = 2
+    file = upload(LEDGER)
+    
+    append(file.id, NEW_ROWS)
+    
+    assert file.profile['rows'] == 5
+    assert file.profile['ingest']['mode'] == 'streaming'
+    rollup, sample = load_stream_frames(file, role_columns(file.column_roles))
+    assert rollup['revenue'].tolist() == [250, 250.5, 300]
+    assert len(sample) == 5
+
+def test_append_rejects_stale_version_and_other_columns(auth_client, app, upload, append):
+    """Test an append is refused when the version moved on or the columns differ."""
+    file = upload(LEDGER)
+    append(file.id, NEW_ROWS)
+    
+    stale = append(file.id, NEW_ROWS, version=1)
+    assert stale.status_code == 409
+    assert stale.get_json()['version'] == 2
+    
+    mismatched = append(file.id, 'date,revenue\n2023-04-01,10\n')
+    assert mismatched.status_code == 400
+    assert file.profile['rows'] == 5
+
+def test_append_widens_float32_column_for_inexact_values(auth_client, app, upload, append):
+    """Test a float32 column is rebuilt as float64 when an appended value does not fit it."""
+    file = upload('date,revenue\n2023-01-05,1.5\n2023-02-05,2.25\n', 'small.csv')
+    assert load_financial_frame(file)['revenue'].dtype == np.float32
+    
+    response = append(file.id, 'date,revenue\n2023-03-05,1234567.89\n')
+    
+    assert response.status_code == 200
+    df = load_financial_frame(file)
+    assert df['revenue'].tolist() == [1.5, 2.25, 1234567.89]
+    assert df['revenue'].max() == file.profile['stats']['revenue']['max']
+
+def test_append_updates_ratios_and_trends_from_running_totals(auth_client, app, upload, append):
+    """Test ratios and trends of an appended file are read from its running totals and match the rows."""
+    file = upload('date,revenue,net income,total assets\n2023-01-31,1000,100,2000\n2023-02-28,1200,150,\n')
+    append(file.id, 'date,revenue,net income,total assets\n2023-03-31,1100,125,2100\n2023-04-30,900,80,\n')
+    
+    stats = file.profile['stats']
+    assert (stats['revenue']['sum'], stats['revenue']['first'], stats['revenue']['last']) == (4200, 1000, 900)
+    assert stats['total assets']['last'] is None
+    assert stats['total assets']['latest'] == 2100
+    
+    roles = role_columns(file.column_roles)
+    analyzer = get_analyzer(file, roles)
+    assert analyzer.totals is not None
+    rows = FinancialAnalyzer(load_financial_frame(file), roles)
+    assert analyzer.calculate_financial_ratios() == pytest.approx(rows.calculate_financial_ratios())
+    assert analyzer.calculate_financial_ratios()['roa'] == pytest.approx(455 / 2100)
+    trends = analyzer.find_trends()
+    assert trends.keys() == rows.find_trends().keys()
+    assert trends['revenue'] == rows.find_trends()['revenue'] == {'growth_rate': -10.0, 'trend': 'decreasing'}
+
+def test_append_to_workbook_is_rejected(auth_client, app, upload, append):
+    """Test rows cannot be appended to an Excel file, which would stop being one."""
+    buffer = io.BytesIO()
+    pd.read_csv(io.StringIO(LEDGER)).to_excel(buffer, index=False)
+    book = upload(buffer.getvalue(), 'book.xlsx')
+    
+    response = append(book.id, NEW_ROWS)
+    
+    assert response.status_code == 400
+    assert book.file_type == 'xlsx'
+    assert book.version == 1
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+from app.comparison.service import ComparisonService
+
+def test_correlation_comparison_matches_pandas(auth_client, upload):
+    """Test stacked correlation differences match pandas and the comparison page renders them."""
+    rng = np.random.default_rng(4)
+    frames = []
+    for rows in (40, 55):
+        df = pd.DataFrame(rng.normal(size=(rows, 4)), columns=['revenue', 'expenses', 'assets', 'debt'])
+        df.loc[rng.integers(0, rows, 6), 'assets'] = np.nan
+        df['label'] = 'x'
+        frames.append(df)
+    frames[1]['debt'] = frames[1]['revenue'] * 2 + rng.normal(0, 0.01, 55)
+    
+    comparison = ComparisonService(frames)
+    columns, corr = comparison.correlation_stack()
+    assert columns == ['revenue', 'expenses', 'assets', 'debt']
+    for i, df in enumerate(frames):
+        assert np.allclose(corr[i], df[columns].corr().to_numpy())
+    
+    diffs = comparison.generate_correlation_comparison()['dataset_2_vs_1']
+    expected = frames[1][columns].corr() - frames[0][columns].corr()
+    assert np.isclose(diffs['debt']['revenue'], expected.loc['revenue', 'debt'])
+    shifts = comparison.top_correlation_shifts(2)['dataset_2_vs_1']
+    assert len(shifts) == 2
+    assert shifts[0]['columns'] == ['revenue', 'debt']
+    assert abs(shifts[0]['change']) >= abs(shifts[1]['change'])
+    
+    ids = [upload(df, f'cmp{i}.csv').id for i, df in enumerate(frames)]
+    page = auth_client.post('/comparison/compare', data={'file_ids': ids})
+    assert page.status_code == 200
+    assert b'Largest Changes' in page.data
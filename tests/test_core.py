@@ -1,6 +1,7 @@
 import os
 import io
 from app.core.models import FinancialFile
+from app.core.loader import financial_file_path
 from werkzeug.datastructures import FileStorage
 
 def test_home_page(client):
@@ -47,7 +48,7 @@ def test_file_upload(auth_client, app):
     with app.app_context():
         uploaded_file = FinancialFile.query.filter_by(filename='test_upload.csv').first()
         assert uploaded_file is not None
-        assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'test_upload.csv'))
+        assert os.path.exists(financial_file_path(uploaded_file))
 
 def test_view_file(auth_client, test_file):
     """Test file viewing functionality."""
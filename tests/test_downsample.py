@@ -0,0 +1,30 @@
+import numpy as np
+from app.core.downsample import downsample_indices, lttb_indices
+
+def test_lttb_keeps_shape():
+    """Test LTTB keeps the requested number of points, the end points and isolated spikes."""
+    x = np.arange(10000, dtype='float64')
+    y = np.sin(x / 500)
+    y[4321] = 50
+    y[7777] = -50
+    
+    index = lttb_indices(x, y, 200)
+    assert len(index) == 200
+    assert index[0] == 0 and index[-1] == 9999
+    assert np.all(np.diff(index) > 0)
+    assert 4321 in index and 7777 in index
+
+def test_lttb_skips_missing_values():
+    """Test missing values are never picked and short series are kept whole."""
+    y = np.array([1.0, np.nan, 3.0, 4.0])
+    assert list(lttb_indices(np.arange(4), y, 10)) == [0, 2, 3]
+    
+    y = np.random.default_rng(0).normal(size=1000)
+    y[::7] = np.nan
+    index = lttb_indices(np.arange(1000), y, 50)
+    assert len(index) == 50
+    assert not np.isnan(y[index]).any()
+    
+    # Several series on shared labels keep the union of their picks
+    union = downsample_indices(np.arange(1000), [y, -y], 50)
+    assert set(index) <= set(union)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from app.comparison.service import ComparisonService
+from app.core.dtypes import as_float64, compact_frame, frame_records
+
+def test_compact_frame_is_lossless():
+    """Test numbers are downcast, dates parsed and repeated text categorized without changing values."""
+    df = pd.DataFrame({
+        'date': ['2023-01-01', '2023-02-01', '2023-03-01', '2023-04-01'],
+        'units': [1, 2, 3, 4],
+        'price': [1.5, 2.25, np.nan, 4.0],
+        'rate': [0.1, 0.2, 0.3, 0.4],
+        'segment': ['retail', 'retail', 'wholesale', 'retail'],
+        'memo': ['a', 'b', 'c', 'd'],
+    })
+    
+    compacted, report = compact_frame(df)
+    
+    assert str(compacted['date'].dtype) == 'datetime64[ns]'
+    assert compacted['units'].dtype == np.int8
+    assert compacted['price'].dtype == np.float32
+    assert compacted['rate'].dtype == np.float64  # 0.1 is not exact in float32
+    assert compacted['segment'].dtype == 'category'
+    assert compacted['memo'].dtype == object
+    assert report['saved_bytes'] == report['before_bytes'] - report['after_bytes'] > 0
+    assert report['columns']['units'] == {'from': 'int64', 'to': 'int8'}
+    
+    records = frame_records(compacted)
+    assert records[2] == {'date': '2023-03-01', 'units': 3, 'price': None, 'rate': 0.3,
+                          'segment': 'wholesale', 'memo': 'c'}
+
+def test_sums_of_compacted_columns_are_exact():
+    """Test float32 columns are summed and averaged in float64 once cast with as_float64."""
+    compacted, _ = compact_frame(pd.DataFrame({'amount': [123456.25] * 721, 'units': [100] * 721}))
+    assert compacted['amount'].dtype == np.float32
+    
+    totals = as_float64(compacted).sum()
+    assert totals['amount'] == 721 * 123456.25
+    assert totals['units'] == 72100
+    
+    stats = ComparisonService([compacted, compacted]).compare_summary_statistics()
+    assert stats['amount'][0]['mean'] == 123456.25
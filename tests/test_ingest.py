@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+from app.api import routes
+from app.core import loader
+from app.core.models import FinancialFile
+from app.core.profile import build_profile
+from app.core.ingest import is_streamed, load_period_rollup, load_stream_frames, ProfileAccumulator
+from app.core.schema import ensure_column_roles, role_columns
+
+def test_chunked_profile_matches_full_profile():
+    """Test a profile built chunk by chunk agrees with one built from the whole frame."""
+    df = pd.DataFrame({
+        'revenue': [1000, 1200, np.nan, 1300, 900, 1500, 1100],
+        'segment': ['a', 'b', 'a', None, 'c', 'b', 'a'],
+    })
+    accumulator = ProfileAccumulator()
+    for start in range(0, len(df), 3):
+        accumulator.update(df.iloc[start:start + 3])
+    
+    streamed = accumulator.result()
+    expected = build_profile(df)
+    
+    assert streamed['rows'] == expected['rows']
+    assert streamed['numeric_columns'] == expected['numeric_columns']
+    assert streamed['stats']['segment'] == expected['stats']['segment']
+    for metric, value in expected['stats']['revenue'].items():
+        assert abs(streamed['stats']['revenue'][metric] - value) < 1e-9
+    assert streamed['ingest']['chunks'] == 3
+
+def test_large_csv_is_streamed_into_monthly_rollup(auth_client, app, upload):
+    """Test large CSVs are ingested in chunks with flows summed and balances kept."""
+    app.config['STREAMING_INGEST_THRESHOLD'] = 0
+    app.config['INGEST_CHUNK_ROWS'] = 2
+    data = (
+        'date,revenue,total_assets\n'
+        '2023-01-05,100,1000\n'
+        '2023-01-20,150,1100\n'
+        '2023-02-03,200,1200\n'
+        '2023-02-25,50,1150\n'
+        '2023-03-10,300,1300\n'
+    )
+    
+    file = upload(data, 'ledger.csv')
+    assert is_streamed(file)
+    assert file.profile['rows'] == 5
+    
+    rollup, sample = load_stream_frames(file, role_columns(file.column_roles))
+    assert rollup['revenue'].tolist() == [250, 250, 300]
+    assert rollup['total_assets'].tolist() == [1100, 1150, 1300]
+    assert len(sample) == 5
+
+def test_dashboard_charts_slice_period_rollups(auth_client, app, monkeypatch, upload):
+    """Test period rollups are stored at upload and the dashboard charts read them without the rows."""
+    today = pd.Timestamp(datetime.now().date())
+    dates = pd.date_range(today - timedelta(days=400), today, freq='3D')
+    df = pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'revenue': np.arange(len(dates), dtype=float),
+                       'expenses': 2.0, 'total_assets': np.arange(len(dates)) * 10.0})
+    file = upload(df, 'daily.csv')
+    roles = role_columns(file.column_roles)
+    
+    quarters = load_period_rollup(file, roles, 'quarter')
+    expected = df.groupby(dates.to_period('Q')).agg({'revenue': 'sum', 'total_assets': 'last'})
+    assert quarters['revenue'].tolist() == expected['revenue'].tolist()
+    assert quarters['total_assets'].tolist() == expected['total_assets'].tolist()
+    
+    def no_rows(*args, **kwargs):
+        raise AssertionError('charts should read the stored rollups')
+    monkeypatch.setattr(routes, 'read_financial_window', no_rows)
+    monkeypatch.setattr('app.core.ingest.load_financial_frame', no_rows)
+    weeks = auth_client.get('/api/charts/financial-data?timeRange=month').get_json()['revenueExpenses']
+    assert 5 <= len(weeks['labels']) <= 6
+    assert weeks['labels'][-1] == f'Week {today.isocalendar()[1]}'
+    weekly = df.groupby(dates.to_period('W'))['revenue'].sum()
+    assert weeks['revenue'] == weekly.iloc[-len(weeks['revenue']):].tolist()
+    
+    years = auth_client.get('/api/charts/financial-data?timeRange=all').get_json()['revenueExpenses']
+    assert sum(years['revenue']) == df['revenue'].sum()
+
+def test_rollups_of_compacted_columns_keep_cents(auth_client, upload):
+    """Test monthly totals above 2**24 keep their fractional part when the rows are stored as float32."""
+    df = pd.DataFrame({'date': ['2023-01-15'] * 721, 'revenue': 123456.25})
+    file = upload(df, 'cents.csv')
+    assert not is_streamed(file)
+    
+    months = load_period_rollup(file, role_columns(file.column_roles), 'month')
+    assert months['revenue'].tolist() == [89011956.25]
+
+@pytest.fixture
+def streamed_files(app, monkeypatch, upload):
+    """Ids of two streamed CSVs; loading any file whole fails once they are uploaded."""
+    app.config['STREAMING_INGEST_THRESHOLD'] = 0
+    rng = np.random.default_rng(8)
+    ids = []
+    for i in range(2):
+        df = pd.DataFrame({'date': pd.date_range('2023-01-01', periods=60, freq='D').strftime('%Y-%m-%d'),
+                           'revenue': rng.normal(100, 10, 60), 'expenses': rng.normal(60, 5, 60)})
+        ids.append(upload(df, f'big{i}.csv').id)
+    
+    def no_rows(*args, **kwargs):
+        raise AssertionError('streamed files must not be loaded whole')
+    for module in list(sys.modules.values()):
+        if getattr(module, 'load_financial_frame', None) is loader.load_financial_frame:
+            monkeypatch.setattr(module, 'load_financial_frame', no_rows)
+    return ids
+
+def test_streamed_files_are_never_loaded_whole(auth_client, streamed_files):
+    """Test comparisons, exports and lazy profiles of streamed files read their sample, never the whole file."""
+    ids = streamed_files
+    
+    page = auth_client.post('/comparison/compare', data={'file_ids': ids})
+    assert page.status_code == 200
+    assert b'Error comparing files' not in page.data
+    
+    series = auth_client.get(f'/api/comparison/series?file_id={ids[0]}&file_id={ids[1]}&column=revenue')
+    assert series.status_code == 200
+    assert series.get_json()['points'] == 60
+    
+    refused = auth_client.get(f'/export/excel/analysis/{ids[0]}', follow_redirects=True)
+    assert b'too large to export row by row' in refused.data
+    
+    # A file whose ingestion failed is streamed again on first use
+    file = FinancialFile.query.get(ids[0])
+    file.profile = file.column_roles = None
+    assert ensure_column_roles(file)['revenue']['column'] == 'revenue'
+    assert is_streamed(file)
+
+def test_streamed_comparison_export(auth_client, streamed_files):
+    """Test the comparison workbook of streamed files is built without loading them whole."""
+    pytest.importorskip('xlsxwriter')
+    ids = streamed_files
+    
+    export = auth_client.get(f'/export/excel/comparison/{ids[0]},{ids[1]}')
+    assert export.status_code == 200
+    assert export.mimetype.endswith('spreadsheetml.sheet')
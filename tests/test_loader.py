@@ -0,0 +1,75 @@
+import os
+import pandas as pd
+from app.core.loader import (FrameCache, load_financial_frame, get_frame_cache, build_columnar_copy,
+                             read_financial_window)
+
+def test_frame_cache_evicts_least_recently_used():
+    """Test LRU eviction and hit/miss counters."""
+    cache = FrameCache(max_entries=2)
+    cache.put('a', pd.DataFrame({'x': [1]}))
+    cache.put('b', pd.DataFrame({'x': [2]}))
+    assert cache.get('a') is not None  # 'a' becomes most recently used
+    cache.put('c', pd.DataFrame({'x': [3]}))
+
+    assert cache.get('b') is None
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+
+def test_load_financial_frame_parses_once(app, test_file):
+    """Test repeated loads of the same file are served from the cache."""
+    path = os.path.join(app.config['UPLOAD_FOLDER'], test_file.filename)
+    pd.DataFrame({'revenue': [100, 200], 'expenses': [50, 80]}).to_csv(path, index=False)
+    get_frame_cache().clear()
+
+    first = load_financial_frame(test_file)
+    first['extra'] = 1  # callers may add columns without touching the cache
+    second = load_financial_frame(test_file)
+
+    assert 'extra' not in second.columns
+    assert second['revenue'].tolist() == [100, 200]
+    stats = get_frame_cache().stats()
+    assert stats['misses'] >= 1
+    assert stats['hits'] >= 1
+
+def test_load_prefers_columnar_copy(app, test_file):
+    """Test reads memory-map the columnar copy once it has been built."""
+    path = os.path.join(app.config['UPLOAD_FOLDER'], test_file.filename)
+    pd.DataFrame({'revenue': [100, 200], 'segment': ['a', 'b']}).to_csv(path, index=False)
+    build_columnar_copy(test_file)
+    os.remove(path)  # the original is no longer needed for reads
+
+    df = load_financial_frame(test_file)
+
+    assert test_file.columnar_filename == 'test.csv.arrow'
+    assert df['revenue'].tolist() == [100, 200]
+    assert df['segment'].tolist() == ['a', 'b']
+    # the numeric column is a view of the memory-mapped file
+    assert get_frame_cache().stats()['mapped_bytes'] == df['revenue'].values.nbytes
+
+def test_read_financial_window_projects_columns_and_rows(app, test_file):
+    """Test windowed reads return only the requested columns and rows."""
+    path = os.path.join(app.config['UPLOAD_FOLDER'], test_file.filename)
+    pd.DataFrame({'revenue': [1, 2, 3, 4], 'expenses': [5, 6, 7, 8], 'segment': list('abcd')}).to_csv(path, index=False)
+    get_frame_cache().clear()
+
+    csv_window = read_financial_window(test_file, columns=['segment', 'revenue'], offset=1, limit=2)
+    build_columnar_copy(test_file)
+    arrow_window = read_financial_window(test_file, columns=['segment', 'revenue'], offset=1, limit=2)
+
+    for window in (csv_window, arrow_window):
+        assert list(window.columns) == ['segment', 'revenue']
+        assert window['revenue'].tolist() == [2, 3]
+    assert get_frame_cache().stats()['entries'] == 0
+
+def test_diagnostics_require_login(client, test_user):
+    """Test the cache and renderer diagnostics are only served to signed-in users."""
+    for path in ('/api/diagnostics/frame-cache', '/api/diagnostics/chart-renderer'):
+        assert client.get(path).status_code == 302
+    
+    client.post('/auth/login', data={'username': 'test_user', 'password': 'password'})
+    response = client.get('/api/diagnostics/frame-cache')
+    assert response.status_code == 200
+    assert 'hits' in response.get_json()
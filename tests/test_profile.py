@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+from app.core.profile import build_profile, distinct_sketch, estimate_distinct, merge_distinct_sketches
+
+def test_profile_matches_describe():
+    """Test profile statistics agree with pandas describe()."""
+    df = pd.DataFrame({
+        'revenue': [1000, 1200, 1100, np.nan, 1300],
+        'segment': ['a', 'b', 'a', 'b', None]
+    })
+    
+    profile = build_profile(df)
+    expected = df.describe().to_dict()['revenue']
+    stats = profile['stats']['revenue']
+    
+    assert profile['rows'] == 5
+    assert profile['numeric_columns'] == ['revenue']
+    for metric in ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']:
+        assert abs(stats[metric] - expected[metric]) < 1e-9
+    assert stats['null_count'] == 1
+    assert profile['stats']['segment'] == {'count': 4, 'null_count': 1, 'distinct': 2}
+    assert len(profile['sample']) == 5
+
+def test_distinct_estimate_is_close():
+    """Test the distinct sketch is exact for small and close for large cardinality."""
+    assert estimate_distinct(pd.Series([1, 2, 2, 3])) == 3
+    
+    estimate = estimate_distinct(pd.Series(np.arange(50000)))
+    assert abs(estimate - 50000) / 50000 < 0.1
+
+def test_distinct_sketch_matches_sorted_hashes():
+    """Test the partitioned sketch and merge keep exactly the k smallest distinct hashes."""
+    rng = np.random.default_rng(5)
+    left, right = rng.integers(0, 3000, 20000), rng.integers(2000, 9000, 20000)
+    expected = np.unique(pd.util.hash_array(np.concatenate([left, right])))[:1024]
+    
+    assert np.array_equal(distinct_sketch(left), np.unique(pd.util.hash_array(left))[:1024])
+    assert np.array_equal(merge_distinct_sketches(distinct_sketch(left), distinct_sketch(right)), expected)
+    assert len(distinct_sketch(np.array([7] * 5000))) == 1
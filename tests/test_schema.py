@@ -0,0 +1,33 @@
+import pandas as pd
+from app.core.schema import infer_column_roles, resolve_column_roles, role_columns
+
+def test_infer_column_roles():
+    """Test roles are detected from column names and types."""
+    df = pd.DataFrame({
+        'Date': ['2023-01-01', '2023-02-01'],
+        'Total_Revenue': [1000, 1200],
+        'Operating Expenses': [600, 700],
+        'net_income': [100, 150],
+        'Current Assets': [500, 520],
+        'Total Assets': [2000, 2100],
+        'Notes': ['a', 'b']
+    })
+    
+    roles = role_columns(infer_column_roles(df))
+    
+    assert roles['date'] == 'Date'
+    assert roles['revenue'] == 'Total_Revenue'
+    assert roles['expense'] == 'Operating Expenses'
+    assert roles['net_income'] == 'net_income'
+    assert roles['current_assets'] == 'Current Assets'
+    assert roles['total_assets'] == 'Total Assets'
+    assert 'Notes' not in roles.values()
+
+def test_role_overrides():
+    """Test user overrides replace or clear inferred roles."""
+    inferred = {'revenue': {'column': 'sales', 'confidence': 0.8}, 'date': {'column': 'period', 'confidence': 1.0}}
+    
+    roles = resolve_column_roles(inferred, {'revenue': 'gross sales', 'date': None})
+    
+    assert roles['revenue'] == {'column': 'gross sales', 'confidence': 1.0, 'source': 'user'}
+    assert 'date' not in roles
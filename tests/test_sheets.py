@@ -0,0 +1,35 @@
+import io
+import pandas as pd
+from app.core.models import FinancialFile
+from app.core.loader import load_financial_frame
+from app.core.schema import ensure_column_roles
+
+def workbook_bytes():
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        pd.DataFrame({'date': pd.date_range('2023-01-01', periods=3, freq='MS'),
+                      'revenue': [100, 120, 90]}).to_excel(writer, sheet_name='P&L', index=False)
+        pd.DataFrame({'date': pd.date_range('2023-01-01', periods=2, freq='QS'),
+                      'total_assets': [1000, 1100]}).to_excel(writer, sheet_name='Balance Sheet', index=False)
+        pd.DataFrame().to_excel(writer, sheet_name='Notes', index=False)
+    return buffer.getvalue()
+
+def test_workbook_sheets_become_lazy_datasets(auth_client, app, upload):
+    """Test each sheet with data becomes a file that is parsed on first use."""
+    book = upload(workbook_bytes(), 'book.xlsx')
+    assert [sheet['name'] for sheet in book.sheets] == ['P&L', 'Balance Sheet', 'Notes']
+    assert book.profile['columns'] == ['date', 'revenue']
+    
+    balance = FinancialFile.query.filter_by(parent_id=book.id).one()
+    assert balance.sheet_name == 'Balance Sheet'
+    assert balance.storage_path == book.storage_path
+    assert balance.profile is None and balance.columnar_filename is None
+    
+    assert ensure_column_roles(balance)['total_assets']['column'] == 'total_assets'
+    assert balance.profile['rows'] == 2
+    assert balance.columnar_filename != book.columnar_filename
+    assert load_financial_frame(balance)['total_assets'].tolist() == [1000, 1100]
+    assert load_financial_frame(book)['revenue'].tolist() == [100, 120, 90]
+    
+    response = auth_client.get(f'/api/file/{balance.id}')
+    assert response.get_json()['file']['sheets'][1]['file_id'] == balance.id
@@ -0,0 +1,37 @@
+import os
+from app.core.models import FinancialFile
+from app.core.loader import financial_file_path
+from app.core.storage import blob_relpath, cached_artifact
+
+CSV_DATA = b'date,revenue,expenses\n2023-01-01,1000,500\n2023-02-01,1200,600\n'
+
+def test_duplicate_uploads_share_blob_and_profile(auth_client, app, upload):
+    """Test identical uploads are stored once and reuse the first profile."""
+    upload(CSV_DATA, 'january.csv')
+    upload(CSV_DATA, 'copy.csv')
+    upload(CSV_DATA.replace(b'1200', b'1300'), 'january.csv')
+
+    first, duplicate, changed = FinancialFile.query.order_by(FinancialFile.id).all()
+    assert first.content_hash == duplicate.content_hash != changed.content_hash
+    assert first.storage_path == blob_relpath(first.content_hash, 'csv')
+    assert duplicate.storage_path == first.storage_path
+    assert duplicate.profile == first.profile
+    # a new upload with an existing name does not overwrite the first file
+    assert os.path.exists(financial_file_path(first))
+    assert os.path.exists(financial_file_path(changed))
+
+def test_cached_artifact_computed_once_per_content(auth_client, app, upload):
+    """Test derived results are shared between files with the same content."""
+    upload(CSV_DATA, 'a.csv')
+    upload(CSV_DATA, 'b.csv')
+    first, duplicate = FinancialFile.query.order_by(FinancialFile.id).all()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'total': 2200}
+
+    assert cached_artifact(first, 'totals', compute, params={'column': 'revenue'}) == {'total': 2200}
+    assert cached_artifact(duplicate, 'totals', compute, params={'column': 'revenue'}) == {'total': 2200}
+    cached_artifact(duplicate, 'totals', compute, params={'column': 'expenses'})
+    assert len(calls) == 2
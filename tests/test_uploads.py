@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+import hashlib
+import io
+import pytest
+from app.core import uploads
+from app.core.models import FinancialFile, UploadSession
+from app.core.loader import financial_file_path
+
+CSV_DATA = b'date,revenue,expenses\n2023-01-01,1000,500\n2023-02-01,1200,600\n2023-03-01,1100,650\n'
+
+def test_resumable_upload_creates_file(auth_client, app, start_upload):
+    """Test a file sent in chunks is verified, stored and ingested."""
+    app.config['INGEST_IN_BACKGROUND'] = False
+    upload_id = start_upload(len(CSV_DATA))
+    
+    first = auth_client.put(f'/api/uploads/{upload_id}?offset=0', data=CSV_DATA[:30])
+    assert first.get_json()['received_bytes'] == 30
+    # a retried chunk at a stale offset is rejected with the resume point
+    stale = auth_client.put(f'/api/uploads/{upload_id}?offset=0', data=CSV_DATA[:30])
+    assert stale.status_code == 409
+    assert stale.get_json()['received_bytes'] == 30
+    auth_client.put(f'/api/uploads/{upload_id}?offset=30', data=CSV_DATA[30:])
+    
+    response = auth_client.post(f'/api/uploads/{upload_id}/complete',
+                                json={'sha256': hashlib.sha256(CSV_DATA).hexdigest()})
+    assert response.status_code == 202
+    
+    status = auth_client.get(f'/api/uploads/{upload_id}').get_json()
+    assert status['status'] == 'complete'
+    file = FinancialFile.query.get(status['file_id'])
+    assert file.profile['rows'] == 3
+    with open(financial_file_path(file), 'rb') as f:
+        assert f.read() == CSV_DATA
+
+def test_resumable_upload_rejects_bad_checksum(auth_client, app, start_upload):
+    """Test a checksum mismatch found after finalizing reopens the session and discards the data."""
+    app.config['INGEST_IN_BACKGROUND'] = False
+    upload_id = start_upload(len(CSV_DATA))
+    auth_client.put(f'/api/uploads/{upload_id}?offset=0', data=CSV_DATA)
+    
+    response = auth_client.post(f'/api/uploads/{upload_id}/complete', json={'sha256': '0' * 64})
+    
+    assert response.status_code == 202
+    status = auth_client.get(f'/api/uploads/{upload_id}').get_json()
+    assert status['received_bytes'] == 0
+    assert status['status'] == 'uploading'
+    assert status['error'].startswith('Checksum mismatch')
+    assert FinancialFile.query.count() == 0
+    
+    auth_client.put(f'/api/uploads/{upload_id}?offset=0', data=CSV_DATA)
+    auth_client.post(f'/api/uploads/{upload_id}/complete', json={'sha256': hashlib.sha256(CSV_DATA).hexdigest()})
+    assert auth_client.get(f'/api/uploads/{upload_id}').get_json()['status'] == 'complete'
+
+def test_chunk_offset_is_checked_against_the_stored_session(auth_client, app, start_upload):
+    """Test a chunk is checked against the session row, not a copy loaded before another chunk landed."""
+    upload_id = start_upload(len(CSV_DATA))
+    session = UploadSession.query.get(upload_id)
+    # a concurrent request wrote the first chunk after this one loaded the session
+    UploadSession.query.filter_by(id=upload_id).update({'received_bytes': 30}, synchronize_session=False)
+    
+    with pytest.raises(uploads.UploadError) as error:
+        uploads.append_chunk(session, 0, io.BytesIO(CSV_DATA[:30]))
+    
+    assert error.value.status_code == 409
+    assert session.received_bytes == 30
+
+def test_stalled_upload_is_reported_failed(auth_client, app, monkeypatch, start_upload):
+    """Test an upload stuck in processing past the timeout fails and its late ingestion is dropped."""
+    app.config['INGEST_IN_BACKGROUND'] = False
+    
+    def stalled(file):
+        # the worker running the ingestion was restarted meanwhile
+        session = UploadSession.query.filter_by(status='processing').first()
+        session.processing_started = datetime.utcnow() - timedelta(hours=2)
+        uploads.db.session.commit()
+        assert uploads.upload_status(session)['status'] == 'failed'
+    monkeypatch.setattr(uploads, 'prepare_financial_file', stalled)
+    
+    upload_id = start_upload(len(CSV_DATA))
+    auth_client.put(f'/api/uploads/{upload_id}?offset=0', data=CSV_DATA)
+    auth_client.post(f'/api/uploads/{upload_id}/complete', json={'sha256': hashlib.sha256(CSV_DATA).hexdigest()})
+    
+    status = auth_client.get(f'/api/uploads/{upload_id}').get_json()
+    assert status['status'] == 'failed'
+    assert status['file_id'] is None
+    assert FinancialFile.query.count() == 0
+
+def test_large_form_upload_points_to_resumable_api(auth_client, app):
+    """Test a form upload over MAX_CONTENT_LENGTH is refused with a pointer to the resumable API."""
+    app.config['MAX_CONTENT_LENGTH'] = 64
+    
+    response = auth_client.post('/upload', data={'file': (io.BytesIO(CSV_DATA), 'big.csv')},
+                                content_type='multipart/form-data', follow_redirects=True)
+    
+    assert b'resumable upload API' in response.data
+    assert FinancialFile.query.count() == 0